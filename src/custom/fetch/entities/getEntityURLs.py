@@ -0,0 +1,107 @@
+import sys
+import tqdm
+import logging
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.signalmanager import dispatcher
+
+from utils import common
+from utils.crawlers import Listings, Settings
+from utils.crawlers.URLs import normalizeURL
+
+logging.getLogger("scrapy").propagate = False
+
+ENTITY_TYPES = ["R", "H", "A"]
+
+def addEntityURLs(data, results, cities):
+    # Known pages keep their ids; new ones are numbered on from the largest id of their city and type
+    known_urls = set(normalizeURL(item["url"]) for item in data)
+    numbers = defaultdict(int)
+    for item in data:
+        city_id, entity_type, number = item["id"].split("_")
+        numbers[(city_id, entity_type)] = max(numbers[(city_id, entity_type)], int(number))
+
+    added = 0
+    for result in sorted(results, key = lambda result: (cities.index(result["city"]), ENTITY_TYPES.index(result["type"]))):
+        city_id = str(cities.index(result["city"]))
+        for url in result["urls"]:
+            if(normalizeURL(url) in known_urls):
+                continue
+            known_urls.add(normalizeURL(url))
+            numbers[(city_id, result["type"])] += 1
+            data.append({"id": "%s_%s_%d" % (city_id, result["type"], numbers[(city_id, result["type"])]), "url": url})
+            added += 1
+
+    return added
+
+class EntityURLsCrawler:
+    def __init__(self, limit = None, settings = None):
+        self.limit = limit
+        self.process = CrawlerProcess(settings = settings or {})
+
+    def fetch(self, listings):
+        results = []
+        bar = tqdm.tqdm(total = len(listings))
+
+        def collector(signal, sender, item, response, spider):
+            results.append(item)
+            bar.update()
+
+        dispatcher.connect(collector, signal = signals.item_scraped)
+
+        # Every listing is paged in the same crawl, so all cities are discovered in one parallel pass
+        self.process.crawl(Listings.Crawler, listings = listings, limit = self.limit)
+        self.process.start()
+
+        bar.close()
+        return results
+
+    def __call__(self, urls_file_path, cities_file_path, output_file_path, entity_types = ENTITY_TYPES, cities = None):
+        city_entity_urls = common.loadJSON(urls_file_path)
+        all_cities = common.loadJSON(cities_file_path)
+
+        listings = []
+        for entity_type in entity_types:
+            for city, url in city_entity_urls[entity_type].items():
+                if(cities is None or city in cities):
+                    listings.append({"type": entity_type, "city": city, "url": url})
+
+        # Incremental runs start from the ids discovered so far and only add new entities
+        data = common.loadJSON(output_file_path) if Path(output_file_path).exists() else []
+
+        added = addEntityURLs(data, self.fetch(listings), all_cities)
+        common.dumpJSON(data, output_file_path, atomic = True)
+
+        print("Added %d new entities (%d in total)" % (added, len(data)))
+        return added
+
+if(__name__ == "__main__"):
+    project_root_path = common.getProjectRootPath()
+
+    defaults = {}
+
+    defaults["urls_file_path"] = project_root_path / "data" / "common" / "city.entities.urls.json"
+    defaults["cities_file_path"] = project_root_path / "data" / "common" / "cities.json"
+    defaults["output_file_path"] = project_root_path / "data" / "custom" / "entities" / "help" / "entity_ids_to_entity_urls.json"
+
+    parser = argparse.ArgumentParser(description = "Discover entity urls from Trip Advisor and Booking listings")
+
+    parser.add_argument("-i", "--urls_file_path", type = str, default = defaults["urls_file_path"])
+    parser.add_argument("--cities_file_path", type = str, default = defaults["cities_file_path"])
+    parser.add_argument("-o", "--output_file_path", type = str, default = defaults["output_file_path"])
+    parser.add_argument("--entity_types", type = str, nargs = "+", choices = ENTITY_TYPES, default = ENTITY_TYPES)
+    parser.add_argument("--cities", type = str, nargs = "+", default = None)
+    parser.add_argument("--limit", type = int, default = None)
+    parser.add_argument("--profile", type = str, choices = list(Settings.PROFILES), default = "polite")
+    parser.add_argument("--concurrent_requests", type = int, default = None)
+    parser.add_argument("--concurrent_requests_per_domain", type = int, default = None)
+
+    options = parser.parse_args(sys.argv[1:])
+
+    settings = Settings.getSettings(profile = options.profile, concurrent_requests = options.concurrent_requests, concurrent_requests_per_domain = options.concurrent_requests_per_domain)
+
+    entity_urls_crawler = EntityURLsCrawler(limit = options.limit, settings = settings)
+    entity_urls_crawler(urls_file_path = Path(options.urls_file_path), cities_file_path = Path(options.cities_file_path), output_file_path = Path(options.output_file_path), entity_types = options.entity_types, cities = options.cities)
@@ -9,17 +9,24 @@ from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
 from utils import common
+from utils import planner
 
 class PostsCrawler:
     def __init__(self):
         self.retries = 5
+        self.sleep = 0.05
+        self.planner = None
 
     def getPageFromURL(self, url):
         for i in range(self.retries):
-            time.sleep(0.05)
+            time.sleep(self.sleep)
             try:
+                start = time.time()
                 response = urllib.request.urlopen(url)
-                page = BeautifulSoup(response.read(), "html.parser")
+                content = response.read()
+                if(self.planner is not None):
+                    self.planner.record(len(content), time.time() - start)
+                page = BeautifulSoup(content, "html.parser")
                 return page
             except:
                 pass
@@ -125,6 +132,27 @@ class PostsCrawler:
         bar.close()
         common.dumpJSON(posts, posts_file_path)
 
+    def plan(self, posts_urls_file_path, sample_size, seed = None):
+        posts_urls = common.loadJSON(posts_urls_file_path)
+        urls = [url for item in posts_urls.values() for url in item["post_urls"]]
+        sampled_urls = planner.sample(urls, sample_size, seed = seed)
+
+        self.planner = planner.CrawlPlanner(total = len(urls), sampled = len(sampled_urls), concurrency = 1, sleep = self.sleep, unit = "post", count = "answer")
+
+        bar = tqdm.tqdm(total = len(sampled_urls))
+        for url in sampled_urls:
+            try:
+                post = self.getPostFromURL(url)
+                self.planner.add(len(post["answers"]))
+            except Exception as e:
+                self.planner.add(0)
+
+            bar.update()
+
+        bar.close()
+        print(self.planner.report())
+        return self.planner.estimate()
+
 if(__name__ == "__main__"):
 	project_root_path = common.getProjectRootPath()
 
@@ -132,13 +160,20 @@ if(__name__ == "__main__"):
 
 	defaults["posts_urls_file_path"] = project_root_path / "data" / "custom" / "posts" / "urls" / "posts.urls.json"
 	defaults["posts_file_path"] = project_root_path / "data" / "custom" / "posts" / "fetched" / "posts.fetched.json"
+	defaults["plan_size"] = 20
 
 	parser = argparse.ArgumentParser(description = "Crawl Posts from Trip Advisor")
 
 	parser.add_argument("--posts_urls_file_path", type = str, default = defaults["posts_urls_file_path"])
 	parser.add_argument("--posts_file_path", type = str, default = defaults["posts_file_path"])
+	parser.add_argument("--plan", action = "store_true")
+	parser.add_argument("--plan_size", type = int, default = defaults["plan_size"])
+	parser.add_argument("--seed", type = int, default = None)
 
 	options = parser.parse_args(sys.argv[1:])
 
 	posts_crawler = PostsCrawler()
-	posts_crawler(posts_urls_file_path = Path(options.posts_urls_file_path), posts_file_path = Path(options.posts_file_path))
+	if(options.plan):
+		posts_crawler.plan(posts_urls_file_path = Path(options.posts_urls_file_path), sample_size = options.plan_size, seed = options.seed)
+	else:
+		posts_crawler(posts_urls_file_path = Path(options.posts_urls_file_path), posts_file_path = Path(options.posts_file_path))
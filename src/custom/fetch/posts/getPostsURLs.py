@@ -13,6 +13,7 @@ from urllib.parse import urljoin
 from collections import OrderedDict
 
 from utils import common
+from utils import planner
 
 class PostURLsCrawler:
     def __init__(self, sleep, retries, num_posts):
@@ -20,13 +21,18 @@ class PostURLsCrawler:
         self.retries = retries
         self.num_posts = num_posts
         self.count = 0
+        self.planner = None
 
     def getPageFromURL(self, url):
         for i in range(self.retries):
             time.sleep(self.sleep)
             try:
+                start = time.time()
                 response = urllib.request.urlopen(url)
-                page = BeautifulSoup(response.read(), "html.parser")
+                content = response.read()
+                if(self.planner is not None):
+                    self.planner.record(len(content), time.time() - start)
+                page = BeautifulSoup(content, "html.parser")
                 return page
             except:
                 pass
@@ -92,6 +98,23 @@ class PostURLsCrawler:
         bar.close()
         common.dumpJSON(city_post_urls, posts_urls_file_path)
 
+    def plan(self, city_urls_file_path, sample_size, seed = None):
+        city_urls = common.loadJSON(city_urls_file_path)
+        sampled_city_urls = planner.sample(city_urls.items(), sample_size, seed = seed)
+
+        self.planner = planner.CrawlPlanner(total = len(city_urls), sampled = len(sampled_city_urls), concurrency = 1, sleep = self.sleep, unit = "city", count = "post")
+
+        bar = tqdm.tqdm(total = len(sampled_city_urls))
+        for city, city_url in sampled_city_urls:
+            self.count = 0
+            post_urls = self.getPostURLsFromCityURL(city_url = city_url)
+            self.planner.add(len(post_urls))
+            bar.update()
+
+        bar.close()
+        print(self.planner.report())
+        return self.planner.estimate()
+
 if(__name__ == "__main__"):
     project_root_path = common.getProjectRootPath()
 
@@ -102,6 +125,7 @@ if(__name__ == "__main__"):
     defaults["sleep"] = 0.05
     defaults["retries"] = 5
     defaults["num_posts"] = 10
+    defaults["plan_size"] = 5
 
     parser = argparse.ArgumentParser(description = "Crawl city posts url from Trip Advisor")
 
@@ -110,8 +134,14 @@ if(__name__ == "__main__"):
     parser.add_argument("--sleep", type = float, default = defaults["sleep"])
     parser.add_argument("--retries", type = int, default = defaults["retries"])
     parser.add_argument("--num_posts", type = int, default = defaults["num_posts"])
+    parser.add_argument("--plan", action = "store_true")
+    parser.add_argument("--plan_size", type = int, default = defaults["plan_size"])
+    parser.add_argument("--seed", type = int, default = None)
 
     options = parser.parse_args(sys.argv[1:])
 
     post_urls_crawler = PostURLsCrawler(sleep = options.sleep, retries = options.retries, num_posts = options.num_posts)
-    post_urls_crawler(city_urls_file_path = Path(options.city_urls_file_path), posts_urls_file_path = Path(options.posts_urls_file_path))
+    if(options.plan):
+        post_urls_crawler.plan(city_urls_file_path = Path(options.city_urls_file_path), sample_size = options.plan_size, seed = options.seed)
+    else:
+        post_urls_crawler(city_urls_file_path = Path(options.city_urls_file_path), posts_urls_file_path = Path(options.posts_urls_file_path))
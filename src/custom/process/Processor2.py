@@ -2,15 +2,23 @@
 # Extracting entities for post
 
 import nltk
-from fuzzywuzzy import fuzz
 from typing import Dict, List
 from collections import defaultdict
 
+from utils.nameIndex import NameIndex
+
 class Processor:
-	def __init__(self, cities: List[str], city_entities: Dict[str, Dict[str, dict]], neighborhood_words: List[str]) -> None:
+	def __init__(self, cities: List[str], city_entities: Dict[str, Dict[str, dict]], neighborhood_words: List[str], canonical_ids: Dict[str, str] = None) -> None:
 		self.cities = cities
 		self.city_entities = city_entities
 		self.neighborhood_words = neighborhood_words
+		self.canonical_ids = canonical_ids or {}
+		self.name_indexes = {}
+
+	def getNameIndex(self, city: str) -> NameIndex:
+		if(city not in self.name_indexes):
+			self.name_indexes[city] = NameIndex.fromEntities(self.city_entities[city])
+		return self.name_indexes[city]
 
 	def isNotNeighborhood(self, x, y):
 		b1 = all("%s %s" % (x,z) not in y for z in ["road", "s"])
@@ -23,6 +31,7 @@ class Processor:
 
 		city = self.cities.index(post["city"])
 		entities = self.city_entities[str(city)]
+		name_index = self.getNameIndex(str(city))
 
 		for answer in post["answers"]:
 			try:
@@ -37,13 +46,14 @@ class Processor:
 					if(x == ""):
 						continue
 
-					for entity_id, entity_item in entities.items():
-						if(fuzz.ratio(x, entity_item["name"]) > 95 and self.isNotNeighborhood(x.lower(), answer["body"].lower())):
-							entity_counts[entity_id] += 1
+					for position in name_index.getMatches(x):
+						entity_id = name_index.ids[position]
+						if(self.isNotNeighborhood(x.lower(), answer["body"].lower())):
+							entity_counts[self.canonical_ids.get(entity_id, entity_id)] += 1
 
 				for entity_id, entity_item in entities.items():
 					if((len(entity_item["name"]) > 6) and (" " + entity_item["name"].lower() in answer["body"].lower()) and self.isNotNeighborhood(x.lower(), answer["body"].lower())):
-						entity_counts[entity_id] += 1
+						entity_counts[self.canonical_ids.get(entity_id, entity_id)] += 1
 			except:
 				pass
 
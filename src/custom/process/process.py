@@ -21,7 +21,7 @@ def getAveragePostLength(posts):
 	return average_post_length
 
 class Processor:
-	def __init__(self, average_post_length: int, cities_file_path: Path, city_entities_file_path: Path, cluster_categories_file_path: Path, common_names_file_path: Path, java_package_path: Path, neighborhood_words_file_path: Path, places_file_path: Path, stop_words_file_path: Path, word_embeddings_file_path: Path) -> None:
+	def __init__(self, average_post_length: int, cities_file_path: Path, city_entities_file_path: Path, cluster_categories_file_path: Path, common_names_file_path: Path, java_package_path: Path, neighborhood_words_file_path: Path, places_file_path: Path, stop_words_file_path: Path, word_embeddings_file_path: Path, canonical_ids_file_path: Path = None) -> None:
 		cities = json.load(open(cities_file_path, encoding = "utf-8"))
 		city_entities = json.load(open(city_entities_file_path, encoding = "utf-8"))
 		cluster_categories = json.load(open(cluster_categories_file_path, encoding = "utf-8"))
@@ -30,10 +30,12 @@ class Processor:
 		places = json.load(open(places_file_path, encoding = "utf-8"))
 		stop_words = json.load(open(stop_words_file_path, encoding = "utf-8"))
 		word_embeddings = pickle.load(open(word_embeddings_file_path, "rb"))
+		# Duplicate entities found by utils.resolveEntities count as their canonical entity
+		canonical_ids = json.load(open(canonical_ids_file_path, encoding = "utf-8")) if canonical_ids_file_path is not None else None
 
 		self.processors1 = []
 		self.processors1.append(Processor.wrap(1, Processor1.Processor(average_post_length = average_post_length)))
-		self.processors1.append(Processor.wrap(2, Processor2.Processor(cities = cities, city_entities = city_entities, neighborhood_words = neighborhood_words)))
+		self.processors1.append(Processor.wrap(2, Processor2.Processor(cities = cities, city_entities = city_entities, neighborhood_words = neighborhood_words, canonical_ids = canonical_ids)))
 
 		self.MSEQtagger = MSEQtagger.MSEQtagger(java_package_path = java_package_path)
 
@@ -158,6 +160,7 @@ if(__name__ == "__main__"):
 	parser.add_argument("--places_file_path", type = str, default = defaults["places_file_path"])
 	parser.add_argument("--stop_words_file_path", type = str, default = defaults["stop_words_file_path"])
 	parser.add_argument("--word_embeddings_file_path", type = str, default = defaults["word_embeddings_file_path"])
+	parser.add_argument("--canonical_ids_file_path", type = str, default = None)
 	parser.add_argument("--mseq", action = "store_true", default = True)
 	parser.add_argument("--replace", action = "store_true", default = True)
 
@@ -168,6 +171,6 @@ if(__name__ == "__main__"):
 	    posts += json.load(open(file_path, encoding = "utf-8"))
 	average_post_length = getAveragePostLength(posts)
 
-	processor = Processor(average_post_length = average_post_length, cities_file_path = Path(options.cities_file_path), city_entities_file_path = Path(options.city_entities_file_path), cluster_categories_file_path = Path(options.cluster_categories_file_path), common_names_file_path = Path(options.common_names_file_path), java_package_path = Path(options.java_package_path), neighborhood_words_file_path = Path(options.neighborhood_words_file_path), places_file_path = Path(options.places_file_path), stop_words_file_path = Path(options.stop_words_file_path), word_embeddings_file_path = Path(options.word_embeddings_file_path))
+	processor = Processor(average_post_length = average_post_length, cities_file_path = Path(options.cities_file_path), city_entities_file_path = Path(options.city_entities_file_path), cluster_categories_file_path = Path(options.cluster_categories_file_path), common_names_file_path = Path(options.common_names_file_path), java_package_path = Path(options.java_package_path), neighborhood_words_file_path = Path(options.neighborhood_words_file_path), places_file_path = Path(options.places_file_path), stop_words_file_path = Path(options.stop_words_file_path), word_embeddings_file_path = Path(options.word_embeddings_file_path), canonical_ids_file_path = Path(options.canonical_ids_file_path) if options.canonical_ids_file_path is not None else None)
 
 	processor(fetched_dir_path = Path(options.fetched_dir_path), processed_dir_path = Path(options.processed_dir_path), mseq = options.mseq, replace = options.replace)
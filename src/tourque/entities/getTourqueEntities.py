@@ -2,49 +2,229 @@ import sys
 import json
 import tqdm
 import logging
+import datetime
 import argparse
+import multiprocessing
+from queue import Empty
 from pathlib import Path
+from collections import Counter
 from scrapy import signals
 from scrapy.crawler import CrawlerProcess
 from scrapy.signalmanager import dispatcher
 
 from utils import common
-from utils.crawlers import Restaurants, Attractions, Hotels
+from utils import planner
+from utils.crawlers import Restaurants, Attractions, Hotels, Settings, Manifest
+from utils.crawlers.URLs import groupByURL
 
 logging.getLogger("scrapy").propagate = False
 
+def splitByType(data, types = ("R", "H", "A")):
+    # One pass over the ids instead of one filter per spider; ids of other types are left out as before
+    items = {type: [] for type in types}
+    for item in data:
+        type = item["id"].split("_")[1]
+        if(type in items):
+            items[type].append(item)
+    return items
+
+def loadDemand(file_paths):
+    # How many questions each entity answers, over all the help files given (train, validation, test)
+    demand = Counter()
+    for file_path in file_paths:
+        for question in common.loadJSON(file_path):
+            demand.update(question["answer_entity_ids"])
+    return demand
+
+def prioritize(data, demand):
+    # A page fetched once answers the questions of every id sharing it; the sort is stable, so ties keep the input order
+    data = groupByURL(data)
+    return sorted(data, key = lambda item: -sum(demand[id] for id in item["ids"]))
+
+def splitWork(data, workers):
+    # Pages shared by several ids stay in one worker, and dealing them out in type order gives every worker a similar mix of spiders
+    data = sorted(groupByURL(data), key = lambda item: item["id"].split("_")[1])
+    return [data[index::workers] for index in range(workers)]
+
+def getWorkerPath(path, index):
+    if(path is None):
+        return None
+    path = Path(path)
+    return path.with_name("%s.worker%d%s" % (path.stem, index, path.suffix))
+
+def fetchWorker(kwargs, data, output_dir_path, queue):
+    # Each worker runs its own CrawlerProcess on its own reactor and reports every scraped entity to the parent
+    tourque_entities_crawler = TourqueEntitiesCrawler(**kwargs)
+    tourque_entities_crawler.fetch(data, output_dir_path = output_dir_path, progress = queue.put)
+    sys.exit(tourque_entities_crawler.getStatus())
+
 class TourqueEntitiesCrawler:
-    def __init__(self) -> None:
-        self.process = CrawlerProcess(settings = {"FEEDS": {"items.json": {"format": "json"},},})
+    def __init__(self, hotel_review_rows = 25, max_reviews = None, reviews_since = None, settings = None, feed_file_path = None, stream_reviews = False, refresh = False, stats_dir_path = None, stats_interval = 60.0, priority_file_paths = None, packed = False) -> None:
+        self.kwargs = {"hotel_review_rows": hotel_review_rows, "max_reviews": max_reviews, "reviews_since": reviews_since, "settings": settings, "feed_file_path": feed_file_path, "stream_reviews": stream_reviews, "refresh": refresh, "stats_dir_path": stats_dir_path, "stats_interval": stats_interval, "priority_file_paths": priority_file_paths, "packed": packed}
+        self.hotel_review_rows = hotel_review_rows
+        self.max_reviews = max_reviews
+        self.reviews_since = reviews_since
+        self.stream_reviews = stream_reviews
+        self.refresh = refresh
+        self.priority_file_paths = priority_file_paths
+        self.finish_reasons = {}
+
+        base_settings = {"ITEM_PIPELINES": {"utils.crawlers.Pipelines.EntityWriterPipeline": 300}, "ENTITIES_PACKED": packed}
+        if(feed_file_path is not None):
+            base_settings["FEEDS"] = {str(feed_file_path): {"format": "json"}}
+
+        # Per spider throughput, latency and callback CPU time, written as JSON and Prometheus textfiles
+        if(stats_dir_path is not None):
+            base_settings["EXTENSIONS"] = {"utils.crawlers.Stats.CrawlStats": 500}
+            base_settings["SPIDER_MIDDLEWARES"] = {"utils.crawlers.Stats.CallbackTimerMiddleware": 950}
+            base_settings["CRAWL_STATS_DIR_PATH"] = str(stats_dir_path)
+            base_settings["CRAWL_STATS_INTERVAL"] = stats_interval
+
+        self.process = CrawlerProcess(settings = {**base_settings, **(settings or {})})
 
-    def fetch(self, data):
-        results = []
-        bar = tqdm.tqdm(total = len(data))
+    def fetch(self, data, output_dir_path = None, progress = None):
+        count = 0
+        data = groupByURL(data)
+        bar = tqdm.tqdm(total = sum(len(item["ids"]) for item in data)) if progress is None else None
+
+        # Entities are written by the item pipeline as soon as they are scraped, so nothing is kept here
+        if(output_dir_path is not None):
+            self.process.settings.set("ENTITIES_OUTPUT_DIR_PATH", str(output_dir_path))
+
+        review_stream_dir_path = output_dir_path if (self.stream_reviews and output_dir_path is not None) else None
+        refresh_dir_path = output_dir_path if self.refresh else None
 
         def fetcher(signal, sender, item, response, spider):
-            results.append(item)
-            bar.update()
+            nonlocal count
+            count += 1
+            if(progress is None):
+                bar.update()
+            else:
+                progress(1)
+
+        def closer(signal, sender, spider, reason):
+            self.finish_reasons[spider.name] = reason
 
         dispatcher.connect(fetcher, signal = signals.item_scraped)
+        dispatcher.connect(closer, signal = signals.spider_closed)
 
-        self.process.crawl(Restaurants.Crawler, items = list(filter(lambda item: item["id"].split("_")[1] == "R", data)))
-        self.process.crawl(Hotels.Crawler, items = list(filter(lambda item: item["id"].split("_")[1] == "H", data)))
-        self.process.crawl(Attractions.Crawler, items = list(filter(lambda item: item["id"].split("_")[1] == "A", data)))
+        items = splitByType(data)
+        self.process.crawl(Restaurants.Crawler, items = items["R"], max_reviews = self.max_reviews, reviews_since = self.reviews_since, review_stream_dir_path = review_stream_dir_path, refresh_dir_path = refresh_dir_path)
+        self.process.crawl(Hotels.Crawler, items = items["H"], rows = self.hotel_review_rows, max_reviews = self.max_reviews, reviews_since = self.reviews_since, review_stream_dir_path = review_stream_dir_path, refresh_dir_path = refresh_dir_path)
+        self.process.crawl(Attractions.Crawler, items = items["A"], max_reviews = self.max_reviews, reviews_since = self.reviews_since, review_stream_dir_path = review_stream_dir_path, refresh_dir_path = refresh_dir_path)
 
         self.process.start()
 
+        if(bar is not None):
+            bar.close()
+        return count
+
+    def getStatus(self):
+        return 0 if all(reason == "finished" for reason in self.finish_reasons.values()) else 1
+
+    def fetchInWorkers(self, data, workers, output_dir_path = None, target = fetchWorker):
+        chunks = [chunk for chunk in splitWork(data, workers) if len(chunk) > 0]
+        bar = tqdm.tqdm(total = sum(len(item["ids"]) for chunk in chunks for item in chunk))
+
+        # Spawned rather than forked, so no worker inherits the parent's reactor or open sockets
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        processes = []
+        for index, chunk in enumerate(chunks):
+            kwargs = dict(self.kwargs, feed_file_path = getWorkerPath(self.kwargs["feed_file_path"], index))
+            if(self.kwargs["stats_dir_path"] is not None):
+                kwargs["stats_dir_path"] = Path(self.kwargs["stats_dir_path"]) / ("worker%d" % index)
+            process = context.Process(target = target, args = (kwargs, chunk, output_dir_path, queue), name = "worker%d" % index)
+            process.start()
+            processes.append(process)
+
+        count = 0
+        while(any(process.is_alive() for process in processes)):
+            try:
+                count += queue.get(timeout = 0.5)
+                bar.update()
+            except Empty:
+                pass
+
+        # Whatever the workers reported just before exiting is still in the queue
+        while(True):
+            try:
+                count += queue.get(timeout = 0.1)
+                bar.update()
+            except Empty:
+                break
+
         bar.close()
-        return results
 
-    def __call__(self, input_file_path, output_dir_path):
-        data = []
+        status = 0
+        for process in processes:
+            process.join()
+            if(process.exitcode != 0):
+                print("%s exited with status %s" % (process.name, process.exitcode), file = sys.stderr)
+                status = 1
+
+        return count, status
+
+    def __call__(self, input_file_path, output_dir_path, workers = 1):
+        # A refresh revisits finished entities too, fetching only the reviews they do not have yet
+        completed = Manifest.loadCompleted(output_dir_path) if not self.refresh else set()
+        partials = Manifest.loadPartials(output_dir_path)
 
+        data = []
         for item in common.loadJSON(input_file_path):
-            if(not (output_dir_path / item["id"].split("_")[0] / item["id"]).with_suffix(".json").exists()):
-                data.append(item)
+            if(item["id"] in completed):
+                continue
+            # Entities whose review pagination failed last time continue from their cursor
+            if(item["id"] in partials):
+                item = dict(item, partial = partials[item["id"]])
+            data.append(item)
+
+        # The most asked about entities go first, so a partial or time boxed crawl covers as many QA pairs as it can
+        if(self.priority_file_paths is not None):
+            data = prioritize(data, loadDemand(self.priority_file_paths))
+
+        if(workers > 1):
+            count, status = self.fetchInWorkers(data, workers, output_dir_path = output_dir_path)
+            return status
+
+        self.fetch(data, output_dir_path = output_dir_path)
+        return self.getStatus()
+
+    def plan(self, input_file_path, sample_size, seed = None):
+        data = common.loadJSON(input_file_path)
+
+        concurrency = min(self.process.settings.getint("CONCURRENT_REQUESTS"), self.process.settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"))
+        delay = self.process.settings.getfloat("DOWNLOAD_DELAY")
+        target_concurrency = self.process.settings.getfloat("AUTOTHROTTLE_TARGET_CONCURRENCY") if self.process.settings.getbool("AUTOTHROTTLE_ENABLED") else None
 
-        for item in self.fetch(data):
-            common.dumpJSON(item, (output_dir_path / item["id"].split("_")[0] / item["id"]).with_suffix(".json"))
+        sampled_data = []
+        planners = {}
+        typed_items = splitByType(data)
+        for entity_type, spider in [("R", Restaurants.Crawler), ("H", Hotels.Crawler), ("A", Attractions.Crawler)]:
+            items = typed_items[entity_type]
+            sampled_items = planner.sample(items, sample_size, seed = seed)
+            sampled_data += sampled_items
+            planners[spider.name] = planner.CrawlPlanner(total = len(items), sampled = len(sampled_items), concurrency = concurrency, delay = delay, target_concurrency = target_concurrency, unit = "entity", count = "review")
+
+        def recorder(signal, sender, response, request, spider):
+            planners[spider.name].record(len(response.body), request.meta.get("download_latency", 0.0))
+
+        def counter(signal, sender, item, response, spider):
+            planners[spider.name].add(len(item["reviews"]))
+
+        dispatcher.connect(recorder, signal = signals.response_received)
+        dispatcher.connect(counter, signal = signals.item_scraped)
+
+        self.fetch(sampled_data)
+
+        for name, spider_planner in planners.items():
+            print(spider_planner.report(name = name))
+
+        # The three spiders run side by side, so the slowest one bounds the crawl
+        total_seconds = max(spider_planner.estimate()["total_seconds"] for spider_planner in planners.values())
+        print("Estimated wall-clock time: %s HH:MM:SS" % str(datetime.timedelta(seconds = int(total_seconds))))
+
+        return {name: spider_planner.estimate() for name, spider_planner in planners.items()}
 
 if(__name__ == "__main__"):
     project_root_path = common.getProjectRootPath()
@@ -53,13 +233,47 @@ if(__name__ == "__main__"):
 
     defaults["input_file_path"] = project_root_path / "data" / "tourque" / "entities" / "help"/ "entity_ids_to_entity_urls.json"
     defaults["output_dir_path"] = project_root_path / "data" / "tourque" / "entities" / "data"
+    defaults["plan_size"] = 10
+    defaults["hotel_review_rows"] = 25
+    defaults["stats_interval"] = 60.0
+    defaults["workers"] = 1
+    defaults["priority_file_paths"] = sorted((project_root_path / "data" / "tourque" / "posts" / "help").glob("*_question_urls_to_answer_entity_ids.json"))
 
     parser = argparse.ArgumentParser(description = "Crawl Questions from Trip Advisor")
 
     parser.add_argument("-i", "--input_file_path", type = str, default = defaults["input_file_path"])
     parser.add_argument("-o", "--output_dir_path", type = str, default = defaults["output_dir_path"])
+    parser.add_argument("--feed_file_path", type = str, default = None)
+    parser.add_argument("--hotel_review_rows", type = int, default = defaults["hotel_review_rows"])
+    parser.add_argument("--max_reviews", "--max-reviews", type = int, default = None)
+    parser.add_argument("--reviews_since", "--reviews-since", type = lambda s: datetime.datetime.strptime(s, "%Y-%m-%d"), default = None, metavar = "YYYY-MM-DD")
+    parser.add_argument("--stream_reviews", action = "store_true")
+    parser.add_argument("--packed", action = "store_true")
+    parser.add_argument("--refresh", action = "store_true")
+    parser.add_argument("--stats_dir_path", type = str, default = None)
+    parser.add_argument("--stats_interval", type = float, default = defaults["stats_interval"])
+    parser.add_argument("--priority", action = "store_true")
+    parser.add_argument("--priority_file_paths", type = str, nargs = "+", default = defaults["priority_file_paths"])
+    parser.add_argument("--workers", type = int, default = defaults["workers"])
+    parser.add_argument("--profile", type = str, choices = list(Settings.PROFILES), default = "default")
+    parser.add_argument("--concurrent_requests", type = int, default = None)
+    parser.add_argument("--concurrent_requests_per_domain", type = int, default = None)
+    parser.add_argument("--httpcache", type = str, choices = ["none"] + list(Settings.HTTPCACHE_STORAGES), default = None)
+    parser.add_argument("--httpcache_dir", type = str, default = None)
+    parser.add_argument("--autothrottle_target_concurrency", type = float, default = None)
+    parser.add_argument("--dns_cache", dest = "dns_cache", action = "store_const", const = True, default = None)
+    parser.add_argument("--no_dns_cache", dest = "dns_cache", action = "store_const", const = False)
+    parser.add_argument("--reactor", type = str, choices = list(Settings.REACTORS), default = None)
+    parser.add_argument("--plan", action = "store_true")
+    parser.add_argument("--plan_size", type = int, default = defaults["plan_size"])
+    parser.add_argument("--seed", type = int, default = None)
 
     options = parser.parse_args(sys.argv[1:])
 
-    tourque_entities_crawler = TourqueEntitiesCrawler()
-    tourque_entities_crawler(input_file_path = Path(options.input_file_path), output_dir_path = Path(options.output_dir_path))
+    settings = Settings.getSettings(profile = options.profile, concurrent_requests = options.concurrent_requests, concurrent_requests_per_domain = options.concurrent_requests_per_domain, httpcache = options.httpcache, httpcache_dir = options.httpcache_dir, autothrottle_target_concurrency = options.autothrottle_target_concurrency, dns_cache = options.dns_cache, reactor = options.reactor)
+
+    tourque_entities_crawler = TourqueEntitiesCrawler(hotel_review_rows = options.hotel_review_rows, max_reviews = options.max_reviews, reviews_since = options.reviews_since, settings = settings, feed_file_path = options.feed_file_path, stream_reviews = options.stream_reviews, refresh = options.refresh, stats_dir_path = options.stats_dir_path, stats_interval = options.stats_interval, priority_file_paths = options.priority_file_paths if options.priority else None, packed = options.packed)
+    if(options.plan):
+        tourque_entities_crawler.plan(input_file_path = Path(options.input_file_path), sample_size = options.plan_size, seed = options.seed)
+    else:
+        sys.exit(tourque_entities_crawler(input_file_path = Path(options.input_file_path), output_dir_path = Path(options.output_dir_path), workers = options.workers))
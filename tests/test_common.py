@@ -1,6 +1,7 @@
 """
 Tests for utils/common.py utilities
 """
+import io
 import json
 import pickle
 import pytest
@@ -78,6 +79,47 @@ class TestLoadJSON:
             common.loadJSON(temp_dir / "nonexistent.json")
 
 
+class TestLoadJSONFields:
+    """Tests for loadJSONFields and readJSONFields functions"""
+
+    @pytest.fixture
+    def entity(self):
+        """An entity whose reviews come after its header fields"""
+        return {"id": "123_R_1", "name": "Café", "properties": ["Pool"], "latitude": 28.6139, "longitude": -77.2, "rating": 4.5, "reviews": [{"title": "t", "description": "d" * 100}] * 50, "reviews_file": "x.jsonl"}
+
+    def test_loads_requested_fields(self, temp_dir, entity):
+        """Test that only the requested fields are returned"""
+        common.dumpJSON(entity, temp_dir / "entity.json")
+
+        result = common.loadJSONFields(temp_dir / "entity.json", ["id", "name", "latitude", "longitude"])
+        assert result == {"id": "123_R_1", "name": "Café", "latitude": 28.6139, "longitude": -77.2}
+
+    def test_stops_before_later_members(self, entity):
+        """Test that members after the last wanted field are never read"""
+        text = json.dumps(entity, indent = 4)
+        text = text[:text.index('"reviews"')] + "not json at all"
+
+        result = common.readJSONFields(io.StringIO(text), ["id", "properties", "rating"])
+        assert result == {"id": "123_R_1", "properties": ["Pool"], "rating": 4.5}
+
+    def test_small_chunks(self, entity):
+        """Test that values split across chunk boundaries, numbers included, decode whole"""
+        text = json.dumps(entity, indent = 4)
+        for chunk_size in [1, 2, 3, 7]:
+            result = common.readJSONFields(io.StringIO(text), ["latitude", "longitude", "reviews_file"], chunk_size = chunk_size)
+            assert result == {"latitude": 28.6139, "longitude": -77.2, "reviews_file": "x.jsonl"}
+
+    def test_missing_fields(self):
+        """Test that fields the object lacks are left out"""
+        assert common.readJSONFields(io.StringIO("{}"), ["id"]) == {}
+        assert common.readJSONFields(io.StringIO(' {"id": 1} '), ["id", "name"]) == {"id": 1}
+
+    def test_raises_error_for_truncated_file(self):
+        """Test that an object cut short is an error"""
+        with pytest.raises(json.JSONDecodeError):
+            common.readJSONFields(io.StringIO('{"id": "123_R_1", "na'), ["id", "name"])
+
+
 class TestDumpJSON:
     """Tests for dumpJSON function"""
 
@@ -115,6 +157,15 @@ class TestDumpJSON:
         assert "\n" in content  # Has newlines (formatted)
         assert "    " in content  # Has indentation
 
+    def test_atomic_write_replaces_existing_file(self, temp_dir):
+        """Test that dumpJSON with atomic=True replaces the file without leaving temporaries"""
+        file_path = temp_dir / "atomic.json"
+        common.dumpJSON({"version": 1}, file_path, atomic=True)
+        common.dumpJSON({"version": 2}, file_path, atomic=True)
+
+        assert common.loadJSON(file_path) == {"version": 2}
+        assert [path.name for path in temp_dir.iterdir()] == ["atomic.json"]
+
     def test_sorts_keys_when_requested(self, temp_dir):
         """Test that dumpJSON sorts keys when sort_keys=True"""
         data = {"z": 1, "a": 2, "m": 3}
@@ -214,3 +265,72 @@ class TestUpdate:
             "c": 3,
             "d": 5
         }
+
+    def test_creates_missing_keys(self):
+        """Test that nested dicts and lists missing from the target are created"""
+        d = {"1": {"1_R_1": {"categories": ["Bar"]}}}
+        u = {"1": {"1_R_2": {"categories": ["Pool"], "location": [1.0, 2.0]}}, "2": {"2_H_1": {"categories": ["Spa"]}}}
+        result = common.update(d, u)
+        assert result["1"]["1_R_2"] == {"categories": ["Pool"], "location": [1.0, 2.0]}
+        assert result["2"] == {"2_H_1": {"categories": ["Spa"]}}
+
+    def test_dedupes_in_order(self):
+        """Test that new list items keep their order and duplicates within the update are dropped"""
+        d = {"items": list(range(100))}
+        u = {"items": [150, 3, 120, 150, 101, 120]}
+        result = common.update(d, u)
+        assert result["items"] == list(range(100)) + [150, 120, 101]
+
+    def test_dedupes_unhashable_items(self):
+        """Test that dict and list items are deduplicated by value"""
+        d = {"items": [[1, 2], {"a": 1, "b": 2}] + list(range(20))}
+        u = {"items": [{"b": 2, "a": 1}, [1, 2], [2, 1]]}
+        result = common.update(d, u)
+        assert result["items"][-1] == [2, 1]
+        assert len(result["items"]) == 23
+
+    def test_unhashable_keys_never_equal_strings(self):
+        """Test that a dict or list item and its JSON string are both kept in a list long enough to be hashed"""
+        d = {"items": [{"q": 1}, [1]] + ["%d" % index for index in range(20)]}
+        u = {"items": ['{"q": 1}', "[1]", {"q": 1}, [1]]}
+        result = common.updateMany(d, [u, u])
+        assert result["items"][-2:] == ['{"q": 1}', "[1]"]
+        assert len(result["items"]) == 24
+
+    def test_merge_policies(self):
+        """Test the replace, keep, append and callable policies"""
+        d = {"1_R_1": {"location": [1.0, 2.0], "name": "Old", "categories": ["Bar"], "reviews": 3}, "visits": [1]}
+        u = {"1_R_1": {"location": [3.0, 4.0], "name": "New", "categories": ["Bar", "Pool"], "reviews": 2}, "visits": [1]}
+        policies = {"location": "replace", "1_R_1.name": "keep", "visits": "append", "reviews": lambda old, new: (old or 0) + new}
+        result = common.update(d, u, policies = policies)
+        assert result == {"1_R_1": {"location": [3.0, 4.0], "name": "Old", "categories": ["Bar", "Pool"], "reviews": 5}, "visits": [1, 1]}
+
+    def test_rejects_mismatched_types(self):
+        """Test that a dict and a list are never merged into each other without a replace policy"""
+        with pytest.raises(TypeError):
+            common.update({"c": {"x": 1}}, {"c": []})
+        with pytest.raises(TypeError):
+            common.update({"c": [1]}, {"c": {"x": 1}})
+        with pytest.raises(TypeError):
+            common.update({"c": {"x": 1}}, {"c": [2]}, policies = {"c": "append"})
+        assert common.update({"c": {"x": 1}}, {"c": [2]}, policies = {"c": "replace"}) == {"c": [2]}
+
+    def test_path_policy_before_key_policy(self):
+        """Test that a dotted path policy wins over a key name policy"""
+        d = {"a": {"x": [1]}, "b": {"x": [1]}}
+        result = common.update(d, {"a": {"x": [2]}, "b": {"x": [2]}}, policies = {"x": "replace", "a.x": "union"})
+        assert result == {"a": {"x": [1, 2]}, "b": {"x": [2]}}
+
+    def test_rejects_unknown_policy(self):
+        """Test that an unknown policy name is an error"""
+        with pytest.raises(ValueError):
+            common.update({}, {}, policies = {"a": "overwrite"})
+
+    def test_batch_matches_sequential_updates(self):
+        """Test that a batch of updates gives the same result as applying them one by one"""
+        updates = [{"ids": ["%d" % (index * 7 % 50) for index in range(start, start + 30)], "city": {"n": start}} for start in range(0, 300, 30)]
+        sequential = {"ids": ["%d" % index for index in range(40)], "city": {}}
+        for u in updates:
+            common.update(sequential, u)
+        batched = common.updateMany({"ids": ["%d" % index for index in range(40)], "city": {}}, updates)
+        assert batched == sequential
@@ -0,0 +1,640 @@
+"""
+Tests for the entity spiders in utils/crawlers
+"""
+import json
+import logging
+import pytest
+import datetime
+from unittest.mock import patch
+from scrapy.http import HtmlResponse, Request
+from utils.crawlers import Attractions, Hotels, Restaurants, TripAdvisor
+
+
+def makeManifest(location_id, location, reviews = None):
+    """Build a minimal window.__WEB_CONTEXT__ page manifest"""
+    responses = {"/data/1.0/location/%s" % location_id: {"data": location}}
+    if(reviews is not None):
+        responses["/data/1.0/location/%s/reviews" % location_id] = {"data": {"reviewListPage": {"reviews": reviews}}}
+    return {"redux": {"route": {"detail": location_id}, "api": {"responses": responses}}}
+
+
+def makeAttractionManifest(location_id, reviews):
+    """Build a minimal attraction page manifest"""
+    location = {"name": "Central Park", "address": "New York City", "latitude": 40.78, "longitude": -73.96, "rating": 5.0}
+    manifest = makeManifest(location_id, location, reviews)
+    manifest["redux"]["api"]["responses"]["/data/1.0/attraction/about/%s" % location_id] = {"data": {"taxonomyInfos": [{"name": "Parks"}]}}
+    return manifest
+
+
+def makePagination(url, page_size, last_offset):
+    """Build a TripAdvisor pagination block for the first review page"""
+    links = ['<a class="pageNum" data-offset="%d" href="%s">%d</a>' % (offset, url.replace("-Reviews-", "-Reviews-or%d-" % offset), offset // page_size + 1) for offset in range(page_size, last_offset + 1, page_size)]
+    return '<div class="ui_pagination"><a class="nav next" href="%s">Next</a><div class="pageNumbers">%s</div></div>' % (url.replace("-Reviews-", "-Reviews-or%d-" % page_size), "".join(links))
+
+
+def makeReviews(start, count):
+    """Build review data numbered from start"""
+    return [{"title": "Review %d" % i, "text": "Text %d" % i, "rating": 4, "publishedDate": "2019-10-18", "url": "/ShowUserReviews-r%d.html" % i} for i in range(start, start + count)]
+
+
+def makeResponse(url, manifest = None, body = "", meta = None):
+    """Build an HtmlResponse carrying the manifest in a script tag"""
+    script = ""
+    if(manifest is not None):
+        script = "<script>window.__WEB_CONTEXT__={pageManifest:%s};</script>" % json.dumps(manifest)
+    html = "<html><head>%s</head><body>%s</body></html>" % (script, body)
+    return HtmlResponse(url = url, body = html.encode("utf-8"), encoding = "utf-8", request = Request(url, meta = meta or {}))
+
+
+@pytest.fixture
+def restaurant_location():
+    """Sample restaurant location data"""
+    return {
+        "name": "Gin Gin",
+        "cuisine": [{"name": "Mexican"}, {"name": "Bar"}],
+        "address": "Santa Fe, Mexico City",
+        "latitude": 19.36,
+        "longitude": -99.26,
+        "rating": 4.5,
+    }
+
+
+@pytest.fixture
+def review_data():
+    """Sample reviews as found in reviewListPage"""
+    return [
+        {"title": "Great food", "text": "Loved the tacos.", "rating": 5, "publishedDate": "2019-10-18", "url": "/ShowUserReviews-g1-d2-r1-Gin_Gin.html"},
+        {"title": "Okay", "text": "Service was slow.", "rating": 3, "publishedDate": "2019-10-10", "url": "/ShowUserReviews-g1-d2-r2-Gin_Gin.html"},
+    ]
+
+
+class TestRestaurantsBulkReviews:
+    """Tests for reading restaurant reviews from the listing page"""
+
+    @pytest.fixture
+    def crawler(self):
+        """Create a Restaurants crawler"""
+        return Restaurants.Crawler(items = [])
+
+    def test_reads_reviews_from_review_list_page(self, crawler, restaurant_location, review_data):
+        """Test that reviews are read in bulk from the manifest"""
+        response = makeResponse("https://www.tripadvisor.in/Restaurant_Review-g1-d2-Reviews-Gin_Gin.html", makeManifest("2", restaurant_location, review_data))
+        reviews = crawler.getReviewItems(response)
+
+        assert len(reviews) == 2
+        assert reviews[0]["title"] == "Great food"
+        assert reviews[0]["date"] == "2019-10-18"
+        assert reviews[0]["url"] == "https://www.tripadvisor.in/ShowUserReviews-g1-d2-r1-Gin_Gin.html"
+
+    def test_returns_none_without_review_list_page(self, crawler, restaurant_location):
+        """Test that a page without a review list signals the fallback path"""
+        response = makeResponse("https://www.tripadvisor.in/Restaurant_Review-g1-d2-Reviews-Gin_Gin.html", makeManifest("2", restaurant_location))
+        assert crawler.getReviewItems(response) is None
+
+    def test_returns_none_without_manifest(self, crawler):
+        """Test that a page without a manifest signals the fallback path"""
+        response = makeResponse("https://www.tripadvisor.in/Restaurant_Review-g1-d2-Reviews-Gin_Gin.html")
+        assert crawler.getReviewItems(response) is None
+
+    def test_parse_issues_no_review_requests(self, crawler, restaurant_location, review_data):
+        """Test that bulk extraction yields the entity without per-review requests"""
+        response = makeResponse("https://www.tripadvisor.in/Restaurant_Review-g1-d2-Reviews-Gin_Gin.html", makeManifest("2", restaurant_location, review_data), meta = {"id": "4_R_1"})
+        results = list(crawler.parse(response))
+
+        assert len(results) == 1
+        assert results[0]["id"] == "4_R_1"
+        assert results[0]["properties"] == ["Mexican", "Bar"]
+        assert [review["title"] for review in results[0]["reviews"]] == ["Great food", "Okay"]
+        assert results[0]["reviews"][0]["date"] == "18 October 2019"
+
+    def test_parse_falls_back_to_review_pages(self, crawler, restaurant_location):
+        """Test that the per-review path is used when the review list is missing"""
+        body = '<div class="quote"><a href="/ShowUserReviews-g1-d2-r1-Gin_Gin.html">Great food</a></div>'
+        response = makeResponse("https://www.tripadvisor.in/Restaurant_Review-g1-d2-Reviews-Gin_Gin.html", makeManifest("2", restaurant_location), body = body, meta = {"id": "4_R_1"})
+        results = list(crawler.parse(response))
+
+        assert len(results) == 1
+        assert isinstance(results[0], Request)
+        assert results[0].url == "https://www.tripadvisor.in/ShowUserReviews-g1-d2-r1-Gin_Gin.html"
+
+
+class TestWebContext:
+    """Tests for the shared window.__WEB_CONTEXT__ extractor"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def test_manifest_is_parsed_once_per_response(self):
+        """Test that entity and review parsing share one json.loads of the manifest"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 3)), meta = {"id": "0_A_1"})
+
+        with patch("utils.crawlers.TripAdvisor.json.loads", wraps = json.loads) as mock_loads:
+            results = list(Attractions.Crawler(items = []).parse(response))
+
+        assert mock_loads.call_count == 1
+        assert len(results[0]["reviews"]) == 3
+
+    def test_review_list_page_found_in_api_responses(self):
+        """Test that the review list is found directly under redux.api.responses"""
+        manifest = makeAttractionManifest("105127", makeReviews(0, 2))
+        with patch("utils.crawlers.TripAdvisor.nested_lookup") as mock_lookup:
+            review_list_page = TripAdvisor.getReviewListPage(manifest)
+
+        mock_lookup.assert_not_called()
+        assert len(review_list_page["reviews"]) == 2
+
+    def test_review_list_page_falls_back_to_recursive_search(self):
+        """Test that a review list outside the API responses is still found"""
+        manifest = makeAttractionManifest("105127", None)
+        manifest["urqlCache"] = {"results": [{"data": {"reviewListPage": {"reviews": makeReviews(0, 1)}}}]}
+
+        assert len(TripAdvisor.getReviewListPage(manifest)["reviews"]) == 1
+
+    def test_missing_manifest_returns_none(self):
+        """Test that pages without a manifest are handled"""
+        response = makeResponse(self.URL)
+        assert TripAdvisor.getWebContext(response) is None
+        assert TripAdvisor.getReviewListPage(None) is None
+
+
+class TestReviewPageURLs:
+    """Tests for computing TripAdvisor review page URLs from the pagination offsets"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def test_computes_all_page_urls(self):
+        """Test that every review page URL is derived from the offsets"""
+        response = makeResponse(self.URL, body = makePagination(self.URL, 10, 50))
+        urls = TripAdvisor.getReviewPageURLs(response)
+
+        assert len(urls) == 5
+        assert urls[0].endswith("-Reviews-or10-Central_Park-New_York_City_New_York.html")
+        assert urls[-1].endswith("-Reviews-or50-Central_Park-New_York_City_New_York.html")
+
+    def test_no_pagination_returns_empty_list(self):
+        """Test that a single page of reviews has no further pages"""
+        assert TripAdvisor.getReviewPageURLs(makeResponse(self.URL)) == []
+
+    def test_missing_offsets_returns_none(self):
+        """Test that pagination without offsets asks for serial chaining"""
+        body = '<div class="ui_pagination"><a class="nav next" href="/next.html">Next</a></div>'
+        assert TripAdvisor.getReviewPageURLs(makeResponse(self.URL, body = body)) is None
+
+
+class TestConcurrentReviewPagination:
+    """Tests for requesting review pages in parallel and gathering them in order"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    @pytest.fixture
+    def crawler(self):
+        """Create an Attractions crawler"""
+        return Attractions.Crawler(items = [])
+
+    def test_parse_requests_all_pages_at_once(self, crawler):
+        """Test that all review pages are requested before any of them is parsed"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 30), meta = {"id": "0_A_1"})
+        requests = list(crawler.parse(response))
+
+        assert len(requests) == 3
+        assert all(isinstance(request, Request) for request in requests)
+        assert [request.cb_kwargs["index"] for request in requests] == [1, 2, 3]
+
+    def test_reviews_are_gathered_in_order(self, crawler):
+        """Test that out of order responses still yield reviews in page order"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 30), meta = {"id": "0_A_1"})
+        requests = list(crawler.parse(response))
+
+        results = []
+        for request in reversed(requests):
+            index = request.cb_kwargs["index"]
+            page = makeResponse(request.url, makeAttractionManifest("105127", makeReviews(index * 10, 10)))
+            results += list(request.callback(page, **request.cb_kwargs))
+
+        assert len(results) == 1
+        assert results[0]["id"] == "0_A_1"
+        assert [review["title"] for review in results[0]["reviews"]] == ["Review %d" % i for i in range(40)]
+
+    def test_failed_page_saves_partial_entity(self, crawler):
+        """Test that an entity with a failed review page is yielded once as a partial entity with a cursor"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 20), meta = {"id": "0_A_1"})
+        requests = list(crawler.parse(response))
+
+        failure = type("Failure", (), {"request": requests[0]})()
+        partial_items = list(crawler.failReviewPage(failure))
+
+        assert len(partial_items) == 1
+        assert [review["title"] for review in partial_items[0]["reviews"]] == ["Review %d" % i for i in range(10)]
+        assert partial_items[0]["cursor"] == {"urls": [requests[0].url, requests[1].url], "chained": False, "reviews": 10}
+
+        page = makeResponse(requests[1].url, makeAttractionManifest("105127", makeReviews(20, 10)))
+        assert list(requests[1].callback(page, **requests[1].cb_kwargs)) == []
+
+    def test_later_failure_after_partial_save_is_quiet(self, crawler, caplog):
+        """Test that a second failed page of an already saved entity yields nothing and logs no warning"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 20), meta = {"id": "0_A_1"})
+        requests = list(crawler.parse(response))
+
+        assert len(list(crawler.failReviewPage(type("Failure", (), {"request": requests[0]})()))) == 1
+        caplog.clear()
+        assert list(crawler.failReviewPage(type("Failure", (), {"request": requests[1]})())) == []
+        assert not [record for record in caplog.records if record.levelno >= logging.WARNING]
+
+    def test_chains_pages_without_offsets(self, crawler):
+        """Test that pages are followed one by one when offsets are unknown"""
+        body = '<div class="ui_pagination"><a class="nav next" href="/Attraction_Review-g60763-d105127-Reviews-or10-Central_Park.html">Next</a></div>'
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = body, meta = {"id": "0_A_1"})
+        requests = list(crawler.parse(response))
+        assert len(requests) == 1
+
+        page = makeResponse(requests[0].url, makeAttractionManifest("105127", makeReviews(10, 5)))
+        results = list(requests[0].callback(page, **requests[0].cb_kwargs))
+        assert len(results) == 1
+        assert len(results[0]["reviews"]) == 15
+
+
+def makeHotelReviewList(url, start, count, rows = None, last_offset = None):
+    """Build a booking.com reviewlist page with numbered reviews"""
+    items = "".join(['<li><h3 class="c-review-block__title">Review %d</h3><span class="c-review__body">Body %d</span><div class="bui-review-score__badge">8.0</div><span class="c-review-block__date">Reviewed: 1 January 2023</span></li>' % (i, i) for i in range(start, start + count)])
+    pagination = ""
+    if(rows is not None):
+        links = "".join(['<a href="/reviewlist.en-gb.html?rows=%d&offset=%d">%d</a>' % (rows, offset, offset // rows + 1) for offset in range(rows, last_offset + 1, rows)])
+        pagination = '<div class="bui-pagination">%s<a class="pagenext" href="/reviewlist.en-gb.html?rows=%d&offset=%d">Next</a></div>' % (links, rows, rows)
+    html = '<html><body><ul class="review_list">%s</ul>%s</body></html>' % (items, pagination)
+    return HtmlResponse(url = url, body = html.encode("utf-8"), encoding = "utf-8", request = Request(url))
+
+
+class TestHotelsReviewPagination:
+    """Tests for booking.com review list fan-out in the Hotels spider"""
+
+    URL = "https://www.booking.com/hotel/in/the-lalit-new-delhi.en-gb.html"
+
+    @pytest.fixture
+    def crawler(self):
+        """Create a Hotels crawler with 25 reviews per page"""
+        return Hotels.Crawler(items = [], rows = 25)
+
+    @pytest.fixture
+    def entity_response(self):
+        """Build a hotel entity page"""
+        html = '<html><head><script type="application/ld+json">{"name": "The Lalit", "address": {"streetAddress": "Barakhamba Avenue"}, "aggregateRating": {"ratingValue": 9.0}}</script></head><body></body></html>'
+        return HtmlResponse(url = self.URL, body = html.encode("utf-8"), encoding = "utf-8", request = Request(self.URL, meta = {"id": "123_H_1"}))
+
+    def test_first_review_page_uses_configured_rows(self, crawler, entity_response):
+        """Test that the review list is requested with the configured page size"""
+        requests = list(crawler.parse(entity_response))
+
+        assert len(requests) == 1
+        assert "rows=25" in requests[0].url
+        assert "offset=0" in requests[0].url
+
+    def test_fans_out_remaining_offsets(self, crawler, entity_response):
+        """Test that all offsets are requested once the first page is parsed"""
+        request = list(crawler.parse(entity_response))[0]
+        page = makeHotelReviewList(request.url, 0, 25, rows = 25, last_offset = 75)
+        requests = list(request.callback(page, **request.cb_kwargs))
+
+        assert len(requests) == 3
+        assert [Hotels.Parser().getOffset(request.url) for request in requests] == [25, 50, 75]
+
+    def test_gathers_reviews_in_order(self, crawler, entity_response):
+        """Test that the entity is yielded with every review in page order"""
+        request = list(crawler.parse(entity_response))[0]
+        page = makeHotelReviewList(request.url, 0, 25, rows = 25, last_offset = 50)
+        requests = list(request.callback(page, **request.cb_kwargs))
+
+        results = []
+        for request in reversed(requests):
+            offset = Hotels.Parser().getOffset(request.url)
+            results += list(request.callback(makeHotelReviewList(request.url, offset, 25), **request.cb_kwargs))
+
+        assert len(results) == 1
+        assert results[0]["name"] == "The Lalit"
+        assert [review["title"] for review in results[0]["reviews"]] == ["Review %d" % i for i in range(75)]
+
+    def test_review_fields_use_relative_selectors(self, crawler):
+        """Test that each review reads its own fields rather than the first review's"""
+        page = makeHotelReviewList("https://www.booking.com/reviewlist.en-gb.html?rows=25&offset=0&label=x", 0, 3)
+        reviews = list(crawler.getReviewItems(page))
+
+        assert [review["title"] for review in reviews] == ["Review 0", "Review 1", "Review 2"]
+        assert [review["description"] for review in reviews] == ["Body 0", "Body 1", "Body 2"]
+        assert reviews[0]["date"] == "1 January 2023"
+        assert "label" not in reviews[0]["url"]
+
+
+class TestReviewDepthLimits:
+    """Tests for --max-reviews and --reviews-since in the TripAdvisor spiders"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def makeDatedReviews(self, start, count):
+        """Build reviews one day apart, newest first, starting from 2020-01-31"""
+        reviews = makeReviews(start, count)
+        for i, review in enumerate(reviews):
+            review["publishedDate"] = (datetime.date(2020, 1, 31) - datetime.timedelta(days = start + i)).isoformat()
+        return reviews
+
+    def respond(self, request):
+        """Answer a review page request with ten dated reviews"""
+        index = request.cb_kwargs["index"]
+        page = makeResponse(request.url, makeAttractionManifest("105127", self.makeDatedReviews(index * 10, 10)))
+        return list(request.callback(page, **request.cb_kwargs))
+
+    def crawl(self, crawler, last_offset):
+        """Run the spider callbacks until no request is left, counting review page requests"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", self.makeDatedReviews(0, 10)), body = makePagination(self.URL, 10, last_offset), meta = {"id": "0_A_1"})
+        outputs = list(crawler.parse(response))
+
+        requested = 0
+        items = []
+        while(outputs):
+            output = outputs.pop(0)
+            if(isinstance(output, Request)):
+                requested += 1
+                outputs += self.respond(output)
+            else:
+                items.append(output)
+        return requested, items
+
+    def test_no_limits_fetches_every_page(self):
+        """Test that without limits every page is fetched"""
+        requested, items = self.crawl(Attractions.Crawler(items = []), 90)
+        assert requested == 9
+        assert len(items[0]["reviews"]) == 100
+
+    def test_max_reviews_bounds_requests(self):
+        """Test that pagination stops once enough reviews are fetched"""
+        requested, items = self.crawl(Attractions.Crawler(items = [], max_reviews = 25), 90)
+        assert requested == 2
+        assert [review["title"] for review in items[0]["reviews"]] == ["Review %d" % i for i in range(25)]
+
+    def test_reviews_since_stops_at_cutoff(self):
+        """Test that pagination stops at the first page older than the cutoff date"""
+        crawler = Attractions.Crawler(items = [], reviews_since = datetime.datetime(2020, 1, 17))
+        requested, items = self.crawl(crawler, 90)
+
+        assert requested < 9
+        assert len(items[0]["reviews"]) == 15
+        assert items[0]["reviews"][-1]["date"] == "17 January 2020"
+
+    def test_reviews_since_window_limits_in_flight_pages(self):
+        """Test that only a window of pages is requested ahead of the cutoff check"""
+        crawler = Attractions.Crawler(items = [], reviews_since = datetime.datetime(2019, 1, 1))
+        response = makeResponse(self.URL, makeAttractionManifest("105127", self.makeDatedReviews(0, 10)), body = makePagination(self.URL, 10, 90), meta = {"id": "0_A_1"})
+        assert len(list(crawler.parse(response))) == 4
+
+
+class TestReviewStreaming:
+    """Tests for streaming reviews to a per-entity JSONL sidecar"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def crawl(self, crawler, last_offset, fail_index = None):
+        """Run the spider callbacks out of order until no request is left"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, last_offset), meta = {"id": "0_A_1"})
+        outputs = list(crawler.parse(response))
+
+        items = []
+        while(outputs):
+            output = outputs.pop()
+            if(isinstance(output, Request)):
+                index = output.cb_kwargs["index"]
+                if(index == fail_index):
+                    items += list(crawler.failReviewPage(type("Failure", (), {"request": output})()))
+                    continue
+                page = makeResponse(output.url, makeAttractionManifest("105127", makeReviews(index * 10, 10)))
+                outputs += list(output.callback(page, **output.cb_kwargs))
+            else:
+                items.append(output)
+        return items
+
+    def test_reviews_are_written_to_sidecar_in_order(self, temp_dir):
+        """Test that the entity header carries no reviews and the sidecar has them all in order"""
+        items = self.crawl(Attractions.Crawler(items = [], review_stream_dir_path = temp_dir), 90)
+
+        assert len(items) == 1
+        assert items[0]["reviews"] == []
+        assert items[0]["reviews_file"] == "0_A_1.reviews.jsonl"
+
+        with open(temp_dir / "0" / "0_A_1.reviews.jsonl", encoding = "utf-8") as f:
+            reviews = [json.loads(line) for line in f]
+        assert [review["title"] for review in reviews] == ["Review %d" % i for i in range(100)]
+        assert reviews[0]["date"] == "18 October 2019"
+
+    def test_streaming_respects_max_reviews(self, temp_dir):
+        """Test that review limits apply to the streamed reviews"""
+        self.crawl(Attractions.Crawler(items = [], review_stream_dir_path = temp_dir, max_reviews = 35), 90)
+
+        with open(temp_dir / "0" / "0_A_1.reviews.jsonl", encoding = "utf-8") as f:
+            assert len(f.readlines()) == 35
+
+    def test_streaming_bounds_in_flight_pages(self, temp_dir):
+        """Test that only a window of pages is requested ahead of the written ones"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 90), meta = {"id": "0_A_1"})
+        requests = list(Attractions.Crawler(items = [], review_stream_dir_path = temp_dir).parse(response))
+        assert len(requests) == 4
+
+    def test_failed_entity_keeps_sidecar_prefix(self, temp_dir):
+        """Test that a partial entity keeps the reviews up to the first missing page and no temporary file"""
+        items = self.crawl(Attractions.Crawler(items = [], review_stream_dir_path = temp_dir), 90, fail_index = 3)
+
+        # Pages are answered last first, so pages 1 and 2 are still missing when page 3 fails
+        assert len(items) == 1
+        assert items[0]["cursor"]["reviews"] == 10
+        assert "-or10-" in items[0]["cursor"]["urls"][0]
+        assert [path.name for path in (temp_dir / "0").iterdir()] == ["0_A_1.reviews.jsonl"]
+        with open(temp_dir / "0" / "0_A_1.reviews.jsonl", encoding = "utf-8") as f:
+            assert [json.loads(line)["title"] for line in f] == ["Review %d" % i for i in range(10)]
+
+
+class TestCursorResume:
+    """Tests for resuming partial entities from their pagination cursor"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def run(self, crawler, outputs, fail_index = None):
+        """Answer review page requests until none is left, failing the page at fail_index"""
+        requested = []
+        items = []
+        while(outputs):
+            output = outputs.pop(0)
+            if(isinstance(output, Request)):
+                index = output.cb_kwargs["index"]
+                offset = int(output.url.split("-or")[1].split("-")[0])
+                requested.append(offset)
+                if(offset == fail_index):
+                    items += list(crawler.failReviewPage(type("Failure", (), {"request": output})()))
+                    continue
+                page = makeResponse(output.url, makeAttractionManifest("105127", makeReviews(offset, 10)))
+                outputs += list(output.callback(page, **output.cb_kwargs))
+            else:
+                items.append(output)
+        return requested, items
+
+    def fail(self, crawler):
+        """Crawl an entity with ten review pages whose fourth page fails, returning the saved partial entity"""
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 90), meta = {"id": "0_A_1"})
+        requested, items = self.run(crawler, list(crawler.parse(response)), fail_index = 30)
+        assert len(items) == 1
+        # Partial entities go through JSON on disk between runs
+        return json.loads(json.dumps(items[0]))
+
+    def test_resume_fetches_only_remaining_pages(self):
+        """Test that a resumed entity requests only the pages from its cursor on and ends up complete"""
+        partial_item = self.fail(Attractions.Crawler(items = []))
+
+        crawler = Attractions.Crawler(items = [{"id": "0_A_1", "url": self.URL, "partial": partial_item}])
+        requested, items = self.run(crawler, list(crawler.start_requests()))
+
+        assert requested == [30, 40, 50, 60, 70, 80, 90]
+        assert len(items) == 1
+        assert "cursor" not in items[0]
+        assert items[0]["name"] == "Central Park"
+        assert [review["title"] for review in items[0]["reviews"]] == ["Review %d" % i for i in range(100)]
+
+    def test_resume_respects_max_reviews(self):
+        """Test that reviews kept before the failure count towards the review limit"""
+        partial_item = self.fail(Attractions.Crawler(items = [], max_reviews = 45))
+
+        crawler = Attractions.Crawler(items = [{"id": "0_A_1", "url": self.URL, "partial": partial_item}], max_reviews = 45)
+        requested, items = self.run(crawler, list(crawler.start_requests()))
+
+        assert requested == [30, 40]
+        assert len(items[0]["reviews"]) == 45
+
+    def test_resume_continues_sidecar(self, temp_dir):
+        """Test that a streamed partial entity appends the remaining reviews to its sidecar"""
+        partial_item = self.fail(Attractions.Crawler(items = [], review_stream_dir_path = temp_dir))
+
+        crawler = Attractions.Crawler(items = [{"id": "0_A_1", "url": self.URL, "partial": partial_item}], review_stream_dir_path = temp_dir)
+        requested, items = self.run(crawler, list(crawler.start_requests()))
+
+        assert items[0]["reviews_file"] == "0_A_1.reviews.jsonl"
+        with open(temp_dir / "0" / "0_A_1.reviews.jsonl", encoding = "utf-8") as f:
+            assert [json.loads(line)["title"] for line in f] == ["Review %d" % i for i in range(100)]
+
+    def test_failure_before_any_review_page_drops_entity(self):
+        """Test that nothing is saved when no review page after the entity page was fetched"""
+        crawler = Attractions.Crawler(items = [])
+        response = makeResponse(self.URL, makeAttractionManifest("105127", makeReviews(0, 10)), body = makePagination(self.URL, 10, 20), meta = {"id": "0_A_1"})
+        review_pages = list(crawler.parse(response))[0].cb_kwargs["review_pages"]
+        review_pages.pages[0] = None
+
+        assert review_pages.collectPartial() is None
+
+    def test_hotel_resumes_at_first_review_list_page(self):
+        """Test that a hotel whose first review list page failed fans out its offsets on resume"""
+        url = "https://www.booking.com/hotel/in/the-lalit-new-delhi.en-gb.html"
+        base_url = Hotels.Parser().getBaseReviewPageUrl(url, rows = 25)
+        partial_item = {"id": "123_H_1", "name": "The Lalit", "properties": [], "description": "", "address": "", "latitude": 0.0, "longitude": 0.0, "rating": 4.5, "url": url, "reviews": [], "cursor": {"urls": [base_url], "chained": False, "reviews": 0}}
+
+        crawler = Hotels.Crawler(items = [{"id": "123_H_1", "url": url, "partial": partial_item}], rows = 25)
+        requests = list(crawler.start_requests())
+        assert [request.url for request in requests] == [base_url]
+
+        page = makeHotelReviewList(base_url, 0, 25, rows = 25, last_offset = 50)
+        requests = list(requests[0].callback(page, **requests[0].cb_kwargs))
+        assert [Hotels.Parser().getOffset(request.url) for request in requests] == [25, 50]
+
+        results = []
+        for request in requests:
+            results += list(request.callback(makeHotelReviewList(request.url, Hotels.Parser().getOffset(request.url), 25), **request.cb_kwargs))
+        assert len(results) == 1
+        assert len(results[0]["reviews"]) == 75
+
+
+class TestRefresh:
+    """Tests for refreshing known entities with only their new reviews"""
+
+    URL = "https://www.tripadvisor.in/Attraction_Review-g60763-d105127-Reviews-Central_Park-New_York_City_New_York.html"
+
+    def makeSiteReviews(self, new, old):
+        """Reviews as the site lists them now, newest first: new ones numbered from 1000, then the known ones"""
+        return makeReviews(1000, new) + makeReviews(0, old)
+
+    def writeEntity(self, temp_dir, reviews, stream = False):
+        """Write the entity as an earlier run left it, optionally with its reviews in a sidecar"""
+        processor = Attractions.Crawler(items = []).processor
+        item = {"id": "0_A_1", "name": "Central Park", "properties": ["Parks"], "description": "", "address": "Old address", "latitude": 40.78, "longitude": -73.96, "rating": 4.0, "url": self.URL, "reviews": [Attractions.Parser().getReviewItem(review) for review in reviews]}
+        entity = processor.processEntityItem(item)
+        (temp_dir / "0").mkdir(parents = True, exist_ok = True)
+        if(stream):
+            with open(temp_dir / "0" / "0_A_1.reviews.jsonl", "w", encoding = "utf-8") as f:
+                for review in entity["reviews"]:
+                    f.write(json.dumps(review) + "\n")
+            entity["reviews"] = []
+            entity["reviews_file"] = "0_A_1.reviews.jsonl"
+        with open(temp_dir / "0" / "0_A_1.json", "w", encoding = "utf-8") as f:
+            json.dump(entity, f)
+
+    def crawl(self, crawler, site_reviews):
+        """Crawl the entity against the current site reviews, counting review page requests"""
+        pages = [site_reviews[i:i + 10] for i in range(0, len(site_reviews), 10)]
+        response = makeResponse(self.URL, makeAttractionManifest("105127", pages[0]), body = makePagination(self.URL, 10, 10 * (len(pages) - 1)), meta = {"id": "0_A_1"})
+        outputs = list(crawler.parse(response))
+
+        requested = 0
+        items = []
+        while(outputs):
+            output = outputs.pop(0)
+            if(isinstance(output, Request)):
+                requested += 1
+                page = makeResponse(output.url, makeAttractionManifest("105127", pages[output.cb_kwargs["index"]]))
+                outputs += list(output.callback(page, **output.cb_kwargs))
+            else:
+                items.append(output)
+        return requested, items
+
+    def test_stops_at_first_known_review(self, temp_dir):
+        """Test that new reviews on the entity page alone need no review page requests"""
+        self.writeEntity(temp_dir, makeReviews(0, 95))
+        requested, items = self.crawl(Attractions.Crawler(items = [], refresh_dir_path = temp_dir), self.makeSiteReviews(5, 95))
+
+        assert requested == 0
+        assert len(items) == 1
+        assert [review["title"] for review in items[0]["reviews"]] == ["Review %d" % i for i in list(range(1000, 1005)) + list(range(95))]
+
+    def test_refreshes_header_fields(self, temp_dir):
+        """Test that the header fields come from the freshly fetched page"""
+        self.writeEntity(temp_dir, makeReviews(0, 20))
+        requested, items = self.crawl(Attractions.Crawler(items = [], refresh_dir_path = temp_dir), self.makeSiteReviews(0, 20))
+
+        assert items[0]["address"] == "New York City"
+        assert items[0]["rating"] == 5.0
+        assert len(items[0]["reviews"]) == 20
+
+    def test_fetches_pages_until_known_review(self, temp_dir):
+        """Test that pages are fetched one at a time only until a known review shows up"""
+        self.writeEntity(temp_dir, makeReviews(0, 80))
+        requested, items = self.crawl(Attractions.Crawler(items = [], refresh_dir_path = temp_dir), self.makeSiteReviews(15, 80))
+
+        assert requested == 1
+        assert [review["title"] for review in items[0]["reviews"]] == ["Review %d" % i for i in list(range(1000, 1015)) + list(range(80))]
+
+    def test_unknown_entity_is_fetched_in_full(self, temp_dir):
+        """Test that an entity without an earlier file is crawled as usual"""
+        requested, items = self.crawl(Attractions.Crawler(items = [], refresh_dir_path = temp_dir), makeReviews(0, 40))
+
+        assert requested == 3
+        assert len(items[0]["reviews"]) == 40
+
+    def test_refresh_with_sidecar(self, temp_dir):
+        """Test that new reviews are streamed in front of the known reviews of the sidecar"""
+        self.writeEntity(temp_dir, makeReviews(0, 30), stream = True)
+        crawler = Attractions.Crawler(items = [], refresh_dir_path = temp_dir, review_stream_dir_path = temp_dir)
+        requested, items = self.crawl(crawler, self.makeSiteReviews(12, 30))
+
+        assert requested == 1
+        assert items[0]["reviews"] == []
+        with open(temp_dir / "0" / "0_A_1.reviews.jsonl", encoding = "utf-8") as f:
+            assert [json.loads(line)["title"] for line in f] == ["Review %d" % i for i in list(range(1000, 1012)) + list(range(30))]
+
+    def test_hotel_reviews_are_known_by_content(self, temp_dir):
+        """Test that hotel reviews, which share their page URL, are matched on their content"""
+        crawler = Hotels.Crawler(items = [], rows = 25, refresh_dir_path = temp_dir)
+        page = makeHotelReviewList("https://www.booking.com/reviewlist.en-gb.html?rows=25&offset=0", 0, 3)
+        known = [crawler.processor.processReviewItem(review) for review in crawler.getReviewItems(page)]
+
+        shifted = makeHotelReviewList("https://www.booking.com/reviewlist.en-gb.html?rows=25&offset=25", 0, 1)
+        review = list(crawler.getReviewItems(shifted))[0]
+        assert crawler.getReviewKey(crawler.processor.processReviewItem(review)) in set(map(crawler.getReviewKey, known))
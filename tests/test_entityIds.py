@@ -0,0 +1,116 @@
+"""
+Tests for utils/entityIds.py
+"""
+import numpy as np
+import pytest
+from utils import entityIds
+from utils.entityIds import EntityTable
+
+
+@pytest.fixture
+def entities():
+    """Entities of two cities and all three types"""
+    return {
+        "0_R_1": {"id": "0_R_1", "name": "Cafe", "location": [1.0, 2.0]},
+        "0_H_2": {"id": "0_H_2", "name": "Grand Hotel", "location": [3.0, 4.0]},
+        "1_A_001": {"id": "1_A_001", "name": "Fort", "location": None},
+        "1_R_7995": {"id": "1_R_7995", "name": "Café Noir", "location": [5.0, 6.0]},
+    }
+
+
+class TestEncode:
+    """Tests for packing entity ids into integers"""
+
+    def test_round_trip(self):
+        """Test that decoding an encoded id gives back the same string"""
+        for id in ["0_R_7995", "123_H_001", "0_A_0", "262143_Z_68719476735"]:
+            assert entityIds.decode(entityIds.encode(id)) == id
+
+    def test_many_round_trip(self):
+        """Test that the vectorized conversions agree with the scalar ones"""
+        ids = ["0_R_7995", "123_H_001", "4_A_12"]
+        codes = entityIds.encodeMany(ids)
+        assert codes.dtype == np.int64
+        assert codes.tolist() == [entityIds.encode(id) for id in ids]
+        assert entityIds.decodeMany(codes) == ids
+
+    def test_codes_order_by_city_then_type(self):
+        """Test that codes sort by city first and type letter second"""
+        codes = entityIds.encodeMany(["1_A_1", "0_R_1", "0_A_9"])
+        assert np.argsort(codes).tolist() == [2, 1, 0]
+
+    def test_fields(self):
+        """Test that cities, types and numbers are read from the codes"""
+        codes = entityIds.encodeMany(["12_H_34", "5_R_007"])
+        assert entityIds.getCities(codes).tolist() == [12, 5]
+        assert entityIds.getTypeCodes(codes).tolist() == [entityIds.TYPE_CODES["H"], entityIds.TYPE_CODES["R"]]
+        assert entityIds.getNumbers(codes).tolist() == [34, 7]
+
+    @pytest.mark.parametrize("id", ["1_R", "1_R_2_3", "01_R_1", "1_r_1", "a_R_1", "1_R_-1", "1_R_ 1", "1_R_", "1_RH_1", "262144_R_1"])
+    def test_invalid_ids(self, id):
+        """Test that ids which cannot be packed raise ValueError"""
+        with pytest.raises(ValueError):
+            entityIds.encode(id)
+
+    def test_invalid_ids_reported_together(self):
+        """Test that encoding a list names every invalid id instead of stopping at the first"""
+        ids = ["0_R_1", "01_R_1", "0_r_1", "0_R_1", None]
+        assert entityIds.getInvalidIds(ids) == ["01_R_1", "0_r_1", None]
+        assert not entityIds.isValid("x_R_1")
+        with pytest.raises(ValueError, match = "3 invalid entity ids: '01_R_1', '0_r_1', None"):
+            entityIds.encodeMany(ids)
+
+    def test_mask(self):
+        """Test that type and city filters are masks over the codes"""
+        codes = entityIds.encodeMany(["0_R_1", "0_H_1", "1_R_1", "2_A_1"])
+        assert entityIds.getMask(codes, types = ["R"]).tolist() == [True, False, True, False]
+        assert entityIds.getMask(codes, types = ["R", "A"], cities = ["1", "2"]).tolist() == [False, False, True, True]
+
+    def test_string_helpers(self):
+        """Test the city and type of an id string"""
+        assert entityIds.getCity("123_R_001") == "123"
+        assert entityIds.getType("123_R_001") == "R"
+
+
+class TestEntityTable:
+    """Tests for the columnar entity table"""
+
+    def test_columns(self, entities):
+        """Test that every entity becomes one row"""
+        table = EntityTable.fromEntities(entities)
+        assert len(table) == 4
+        assert table.getIds() == list(entities)
+        assert table.cities.tolist() == [0, 0, 1, 1]
+        assert table.locations.tolist() == [[1.0, 2.0], [3.0, 4.0], [0.0, 0.0], [5.0, 6.0]]
+        assert table.getNameLengths().tolist() == [4, 11, 4, 9]
+
+    def test_names(self, entities):
+        """Test that names are sliced back out of the name column"""
+        table = EntityTable.fromEntities(entities)
+        assert table.getName(3) == "Café Noir"
+        assert table.getNames([1, 0]) == ["Grand Hotel", "Cafe"]
+
+    def test_index_of(self, entities):
+        """Test that ids are found by row, and unknown ids give -1"""
+        table = EntityTable.fromEntities(entities)
+        assert table.indexOf(["1_A_001", "0_R_1", "9_R_1", "1_A_1"]).tolist() == [2, 0, -1, -1]
+        assert EntityTable.fromEntities({}).indexOf(["0_R_1"]).tolist() == [-1]
+
+    def test_select(self, entities):
+        """Test that a masked table keeps only the selected rows"""
+        table = EntityTable.fromEntities(entities)
+        restaurants = table.select(table.getMask(types = ["R"]))
+        assert restaurants.getIds() == ["0_R_1", "1_R_7995"]
+        assert restaurants.getNames() == ["Cafe", "Café Noir"]
+        assert table.select([2]).getIds() == ["1_A_001"]
+
+    def test_city_entities(self, entities):
+        """Test that a table is built over all cities of a city entities structure"""
+        city_entities = {"0": {"0_R_1": entities["0_R_1"]}, "1": {"1_A_001": entities["1_A_001"]}}
+        assert EntityTable.fromCityEntities(city_entities).getIds() == ["0_R_1", "1_A_001"]
+
+    def test_smaller_than_dicts(self):
+        """Test that a table takes a fraction of the memory of the entity dicts"""
+        table = EntityTable.fromEntities({"0_R_%d" % number: {"id": "0_R_%d" % number, "name": "Entity %d" % number, "location": [1.0, 2.0]} for number in range(1000)})
+        assert table.nbytes / len(table) < 100
+
@@ -0,0 +1,156 @@
+"""
+Tests for utils/entityStore.py
+"""
+import json
+from utils import common, entityStore
+from utils.entityStore import EntityStore
+from utils.crawlers import Manifest, Reviews
+from utils.crawlers.Pipelines import EntityWriterPipeline
+from utils.crawlers.Processor import Processor
+from utils.generateCityEntitiesFile import generate
+
+
+def makeEntity(id, name = "Entity", reviews = None):
+    """Build a minimal entity item"""
+    return {"id": id, "name": name, "properties": [], "latitude": 1.0, "longitude": 2.0, "reviews": reviews or []}
+
+
+class TestEntityStore:
+    """Tests for the packed per-city entity store"""
+
+    def test_append_and_get(self, temp_dir):
+        """Test that appended entities can be looked up by id"""
+        store = EntityStore(temp_dir / "123")
+        store.append([makeEntity("123_R_1"), makeEntity("123_R_2", name = "Café")])
+
+        assert store.get("123_R_2")["name"] == "Café"
+        assert store.get("123_R_3") is None
+        assert "123_R_1" in store
+        assert len(store) == 2
+
+    def test_latest_record_wins(self, temp_dir):
+        """Test that appending an id again supersedes its earlier record"""
+        store = EntityStore(temp_dir / "123")
+        store.append([makeEntity("123_R_1", name = "Old"), makeEntity("123_R_2")])
+        store.append([makeEntity("123_R_1", name = "New")])
+
+        assert store.get("123_R_1")["name"] == "New"
+        assert [item["id"] for item in store] == ["123_R_2", "123_R_1"]
+
+    def test_reopened_store_reads_index(self, temp_dir):
+        """Test that a new store instance sees everything written by another one"""
+        writer = EntityStore(temp_dir / "123")
+        writer.append([makeEntity("123_R_1")])
+        reader = EntityStore(temp_dir / "123")
+        writer.append([makeEntity("123_R_2")])
+        writer.close()
+
+        assert reader.ids() == {"123_R_1", "123_R_2"}
+        assert reader.get("123_R_2")["id"] == "123_R_2"
+
+    def test_recovers_unindexed_records(self, temp_dir):
+        """Test that records whose index line was never written are found by scanning the data tail"""
+        store = EntityStore(temp_dir / "123")
+        store.append([makeEntity("123_R_1")])
+        with open(store.data_path, "a", encoding = "utf-8") as file:
+            file.write(json.dumps(makeEntity("123_R_2")) + "\n")
+
+        reopened = EntityStore(temp_dir / "123")
+        assert reopened.ids() == {"123_R_1", "123_R_2"}
+
+        reopened.append([makeEntity("123_R_3")])
+        with open(reopened.index_path, encoding = "utf-8") as file:
+            assert len(file.readlines()) == 3
+
+    def test_repairs_torn_writes(self, temp_dir):
+        """Test that a torn data line and a torn index line are cut before the next append"""
+        store = EntityStore(temp_dir / "123")
+        store.append([makeEntity("123_R_1")])
+        store.close()
+        with open(store.data_path, "a", encoding = "utf-8") as file:
+            file.write('{"id": "123_R_2", "na')
+        with open(store.index_path, "a", encoding = "utf-8") as file:
+            file.write("123_R_2 4")
+
+        reopened = EntityStore(temp_dir / "123")
+        assert reopened.ids() == {"123_R_1"}
+
+        reopened.append([makeEntity("123_R_3")])
+        reopened.close()
+
+        fresh = EntityStore(temp_dir / "123")
+        assert [item["id"] for item in fresh] == ["123_R_1", "123_R_3"]
+        with open(fresh.data_path, encoding = "utf-8") as file:
+            assert all(json.loads(line) for line in file)
+
+    def test_compact_drops_superseded_records(self, temp_dir):
+        """Test that compaction keeps only the latest record of every id"""
+        store = EntityStore(temp_dir / "123")
+        store.append([makeEntity("123_R_1", name = "Old"), makeEntity("123_R_2")])
+        store.append([makeEntity("123_R_1", name = "New")])
+        size = store.data_path.stat().st_size
+
+        store.compact()
+
+        assert store.data_path.stat().st_size < size
+        assert store.get("123_R_1")["name"] == "New"
+        assert len(store) == 2
+        assert not list(temp_dir.glob("*.tmp*"))
+
+    def test_get_stores(self, temp_dir):
+        """Test that every city store in a directory is found"""
+        EntityStore(temp_dir / "123").append([makeEntity("123_R_1")])
+        EntityStore(temp_dir / "456").append([makeEntity("456_H_1")])
+
+        assert sorted(entityStore.getStores(temp_dir)) == ["123", "456"]
+        assert entityStore.getStores(temp_dir / "missing") == {}
+
+    def test_pack_entity_files(self, temp_dir):
+        """Test that one file per entity is packed into one store per city"""
+        for id in ["123_R_1", "123_R_2", "456_A_1"]:
+            common.dumpJSON(makeEntity(id), temp_dir / id.split("_")[0] / ("%s.json" % id))
+
+        assert entityStore.pack(temp_dir, batch_size = 1) == 3
+        assert entityStore.getStores(temp_dir)["123"].ids() == {"123_R_1", "123_R_2"}
+        assert entityStore.loadEntity(temp_dir, "456_A_1")["id"] == "456_A_1"
+
+
+class TestPackedOutput:
+    """Tests for crawling into and reading from packed stores"""
+
+    def test_pipeline_appends_to_store(self, temp_dir):
+        """Test that the packed pipeline appends entities instead of writing files"""
+        pipeline = EntityWriterPipeline(temp_dir, packed = True)
+        pipeline.process_item(makeEntity("123_R_1"), None)
+        pipeline.process_item(makeEntity("456_R_1"), None)
+        pipeline.close_spider(None)
+
+        assert not (temp_dir / "123" / "123_R_1.json").exists()
+        assert EntityStore(temp_dir / "123").get("123_R_1")["id"] == "123_R_1"
+        assert Manifest.Manifest(Manifest.getManifestPath(temp_dir)).load() == {"123_R_1", "456_R_1"}
+
+    def test_manifest_bootstrap_scans_stores(self, temp_dir):
+        """Test that an output directory without a manifest finds packed entities too"""
+        EntityStore(temp_dir / "123").append([makeEntity("123_R_1")])
+        common.dumpJSON(makeEntity("456_R_1"), temp_dir / "456" / "456_R_1.json")
+
+        assert Manifest.loadCompleted(temp_dir) == {"123_R_1", "456_R_1"}
+
+    def test_generate_reads_stores(self, temp_dir):
+        """Test that the city entities file includes packed entities"""
+        EntityStore(temp_dir / "data" / "123").append([makeEntity("123_R_1", name = "Packed")])
+        common.dumpJSON(makeEntity("123_R_2", name = "Loose"), temp_dir / "data" / "123" / "123_R_2.json")
+
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        data = common.loadJSON(temp_dir / "city_entities.json")
+        assert data["123"]["123_R_1"]["name"] == "Packed"
+        assert data["123"]["123_R_2"]["name"] == "Loose"
+
+    def test_refresh_finds_packed_reviews(self, temp_dir):
+        """Test that a refresh knows the reviews of a packed entity"""
+        EntityStore(temp_dir / "123").append([makeEntity("123_R_1", reviews = [{"title": "t", "description": "d", "rating": "5", "date": "", "url": "u1"}])])
+
+        known = Reviews.getKnownReviews(temp_dir, "123_R_1", Processor(), lambda review: review["url"])
+
+        assert known.keys == {"u1"}
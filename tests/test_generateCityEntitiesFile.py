@@ -0,0 +1,101 @@
+"""
+Tests for utils/generateCityEntitiesFile.py
+"""
+import os
+from utils import common
+from utils.entityStore import EntityStore
+from utils.generateCityEntitiesFile import generate, getManifestPath
+
+
+def makeEntity(id, name = "Entity"):
+    """Build a minimal entity item"""
+    return {"id": id, "name": name, "properties": ["Pool"], "latitude": 1.0, "longitude": 2.0, "reviews": []}
+
+
+def writeEntity(dir_path, item):
+    """Write one entity file the way the crawler does"""
+    path = dir_path / item["id"].split("_")[0] / ("%s.json" % item["id"])
+    common.dumpJSON(item, path)
+    return path
+
+
+class TestIncrementalGenerate:
+    """Tests for regenerating the city entities file from changed entities only"""
+
+    def test_summaries(self, temp_dir):
+        """Test that entities are summarized by city"""
+        writeEntity(temp_dir / "data", makeEntity("123_R_1", name = "Cafe"))
+
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        data = common.loadJSON(temp_dir / "city_entities.json")
+        assert data == {"123": {"123_R_1": {"id": "123_R_1", "name": "Cafe", "categories": ["Pool"], "location": [1.0, 2.0]}}}
+        assert getManifestPath(temp_dir / "city_entities.json").exists()
+
+    def test_rereads_only_changed_files(self, temp_dir):
+        """Test that a second run reads only new and changed files and drops deleted ones"""
+        paths = [writeEntity(temp_dir / "data", makeEntity("123_R_%d" % index)) for index in range(3)]
+        assert generate(temp_dir / "data", temp_dir / "city_entities.json") == 3
+        assert generate(temp_dir / "data", temp_dir / "city_entities.json") == 0
+
+        writeEntity(temp_dir / "data", makeEntity("123_R_0", name = "Renamed Entity"))
+        writeEntity(temp_dir / "data", makeEntity("456_A_1"))
+        os.remove(paths[2])
+
+        assert generate(temp_dir / "data", temp_dir / "city_entities.json") == 2
+
+        data = common.loadJSON(temp_dir / "city_entities.json")
+        assert data["123"]["123_R_0"]["name"] == "Renamed Entity"
+        assert sorted(data["123"]) == ["123_R_0", "123_R_1"]
+        assert list(data["456"]) == ["456_A_1"]
+
+    def test_rebuild_ignores_manifest(self, temp_dir):
+        """Test that a rebuild reads every file again"""
+        writeEntity(temp_dir / "data", makeEntity("123_R_1"))
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        assert generate(temp_dir / "data", temp_dir / "city_entities.json", rebuild = True) == 1
+
+    def test_reads_store_tail(self, temp_dir):
+        """Test that a grown store is read from where the last run stopped"""
+        store = EntityStore(temp_dir / "data" / "123")
+        store.append([makeEntity("123_R_1"), makeEntity("123_R_2")])
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        store.append([makeEntity("123_R_1", name = "Refreshed"), makeEntity("123_R_3")])
+        # Corrupting the head proves the second run never reads it again
+        with open(store.data_path, "r+b") as file:
+            file.write(b"#")
+
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        data = common.loadJSON(temp_dir / "city_entities.json")
+        assert sorted(data["123"]) == ["123_R_1", "123_R_2", "123_R_3"]
+        assert data["123"]["123_R_1"]["name"] == "Refreshed"
+
+    def test_compacted_store_is_read_whole(self, temp_dir):
+        """Test that a store replaced by compaction is read from the start"""
+        store = EntityStore(temp_dir / "data" / "123")
+        store.append([makeEntity("123_R_1"), makeEntity("123_R_2")])
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        store.append([makeEntity("123_R_1", name = "Refreshed")])
+        store.compact()
+        store.append([makeEntity("123_R_3")])
+
+        generate(temp_dir / "data", temp_dir / "city_entities.json")
+
+        data = common.loadJSON(temp_dir / "city_entities.json")
+        assert sorted(data["123"]) == ["123_R_1", "123_R_2", "123_R_3"]
+        assert data["123"]["123_R_1"]["name"] == "Refreshed"
+
+    def test_parallel_matches_serial(self, temp_dir):
+        """Test that reading on a process pool gives the same file as reading in one process"""
+        for index in range(20):
+            writeEntity(temp_dir / "data", makeEntity("%d_R_%d" % (index % 3, index), name = "Entity %d" % index))
+        EntityStore(temp_dir / "data" / "7").append([makeEntity("7_H_1")])
+
+        generate(temp_dir / "data", temp_dir / "serial.json", workers = 1)
+        generate(temp_dir / "data", temp_dir / "parallel.json", workers = 4)
+
+        assert common.loadJSON(temp_dir / "serial.json") == common.loadJSON(temp_dir / "parallel.json")
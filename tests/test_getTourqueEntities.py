@@ -4,7 +4,21 @@ Tests for src/tourque/entities/getTourqueEntities.py
 import json
 import pytest
 from unittest.mock import patch, MagicMock
-from src.tourque.entities.getTourqueEntities import TourqueEntitiesCrawler
+from scrapy.exceptions import NotConfigured, DropItem
+from collections import Counter
+from src.tourque.entities.getTourqueEntities import TourqueEntitiesCrawler, splitWork, splitByType, getWorkerPath, loadDemand, prioritize
+from utils.crawlers.Pipelines import EntityWriterPipeline
+from utils.crawlers import Manifest
+from utils.crawlers.URLs import normalizeURL, groupByURL
+
+
+def reportingWorker(kwargs, data, output_dir_path, queue):
+    """Stand-in worker that reports every id and fails when asked to"""
+    for item in data:
+        for id in item["ids"]:
+            queue.put(1)
+    if(any(item["id"] == "123_R_999" for item in data)):
+        raise SystemExit(3)
 
 
 class TestTourqueEntitiesCrawler:
@@ -17,7 +31,7 @@ class TestTourqueEntitiesCrawler:
             assert hasattr(crawler, 'process')
 
     def test_crawler_process_settings(self):
-        """Test that CrawlerProcess is initialized with correct settings"""
+        """Test that CrawlerProcess is initialized with the entity writer pipeline and no feed"""
         with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess') as mock_process:
             TourqueEntitiesCrawler()
 
@@ -25,8 +39,15 @@ class TestTourqueEntitiesCrawler:
             mock_process.assert_called_once()
             call_args = mock_process.call_args
             assert 'settings' in call_args.kwargs
-            assert 'FEEDS' in call_args.kwargs['settings']
-            assert 'items.json' in call_args.kwargs['settings']['FEEDS']
+            assert 'utils.crawlers.Pipelines.EntityWriterPipeline' in call_args.kwargs['settings']['ITEM_PIPELINES']
+            assert 'FEEDS' not in call_args.kwargs['settings']
+
+    def test_feed_only_when_requested(self):
+        """Test that the duplicate items feed is written only when asked for"""
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess') as mock_process:
+            TourqueEntitiesCrawler(feed_file_path = "items.json")
+
+            assert 'items.json' in mock_process.call_args.kwargs['settings']['FEEDS']
 
 
 class TestEntityTypeFiltering:
@@ -71,6 +92,13 @@ class TestEntityTypeFiltering:
         total_filtered = len(restaurants) + len(hotels) + len(attractions)
         assert total_filtered == len(sample_entities)
 
+    def test_split_by_type(self, sample_entities):
+        """Test that one pass over the packed ids splits entities by type in input order"""
+        items = splitByType(sample_entities)
+        assert [item["id"] for item in items["R"]] == ["123_R_001", "123_R_002"]
+        assert [item["id"] for item in items["H"]] == ["123_H_001", "123_H_002"]
+        assert [item["id"] for item in items["A"]] == ["123_A_001", "123_A_002"]
+
 
 class TestEntityIDParsing:
     """Tests for entity ID parsing logic"""
@@ -267,8 +295,8 @@ class TestTourqueEntitiesCrawlerCall:
             assert len(call_args) == 2
             assert all(item["id"] != "123_R_001" for item in call_args)
 
-    def test_saves_fetched_entities(self, temp_dir, mock_crawler):
-        """Test that fetched entities are saved correctly"""
+    def test_passes_output_dir_to_fetch(self, temp_dir, mock_crawler):
+        """Test that entities are handed to the pipeline's output directory rather than collected"""
         # Create input file
         input_data = [
             {"id": "123_R_001", "url": "https://example.com/1"},
@@ -279,24 +307,229 @@ class TestTourqueEntitiesCrawlerCall:
 
         output_dir = temp_dir / "output"
 
-        # Mock fetch to return a processed entity
+        with patch.object(mock_crawler, 'fetch', return_value=1):
+            mock_crawler(input_file, output_dir)
+
+            assert mock_crawler.fetch.call_args.kwargs['output_dir_path'] == output_dir
+
+    def test_resumes_from_manifest_without_stat(self, temp_dir, mock_crawler):
+        """Test that ids listed in the completion manifest are skipped without looking for their files"""
+        input_data = [
+            {"id": "123_R_001", "url": "https://example.com/1"},
+            {"id": "123_R_002", "url": "https://example.com/2"},
+        ]
+        input_file = temp_dir / "input.json"
+        with open(input_file, "w") as f:
+            json.dump(input_data, f)
+
+        output_dir = temp_dir / "output"
+        manifest = Manifest.Manifest(Manifest.getManifestPath(output_dir))
+        manifest.add(["123_R_002"])
+        manifest.close()
+
+        with patch.object(mock_crawler, 'fetch', return_value=1):
+            with patch('pathlib.Path.exists', side_effect=AssertionError("stat per entity")):
+                with patch.object(Manifest.Manifest, 'exists', return_value=True):
+                    mock_crawler(input_file, output_dir)
+
+            call_args = mock_crawler.fetch.call_args[0][0]
+            assert [item["id"] for item in call_args] == ["123_R_001"]
+
+    def test_attaches_partial_entities(self, temp_dir, mock_crawler):
+        """Test that entities saved as partial are handed to the spiders with their partial entity"""
+        input_data = [
+            {"id": "123_H_001", "url": "https://example.com/1"},
+            {"id": "123_H_002", "url": "https://example.com/2"},
+        ]
+        input_file = temp_dir / "input.json"
+        with open(input_file, "w") as f:
+            json.dump(input_data, f)
+
+        output_dir = temp_dir / "output"
+        partial_entity = {"id": "123_H_002", "reviews": [], "cursor": {"urls": ["https://example.com/2?offset=25"], "chained": False, "reviews": 25}}
+        partial_path = Manifest.getPartialPath(output_dir, "123_H_002")
+        partial_path.parent.mkdir(parents=True)
+        partial_path.write_text(json.dumps(partial_entity))
+
+        with patch.object(mock_crawler, 'fetch', return_value=1):
+            mock_crawler(input_file, output_dir)
+
+            call_args = mock_crawler.fetch.call_args[0][0]
+            assert "partial" not in call_args[0]
+            assert call_args[1]["partial"] == partial_entity
+            assert groupByURL(call_args)[1]["partial"] == partial_entity
+
+    def test_refresh_revisits_finished_entities(self, temp_dir):
+        """Test that a refresh hands finished entities to the spiders again"""
+        input_data = [
+            {"id": "123_R_001", "url": "https://example.com/1"},
+            {"id": "123_R_002", "url": "https://example.com/2"},
+        ]
+        input_file = temp_dir / "input.json"
+        with open(input_file, "w") as f:
+            json.dump(input_data, f)
+
+        output_dir = temp_dir / "output"
+        manifest = Manifest.Manifest(Manifest.getManifestPath(output_dir))
+        manifest.add(["123_R_001"])
+        manifest.close()
+
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess'):
+            crawler = TourqueEntitiesCrawler(refresh = True)
+        with patch.object(crawler, 'fetch', return_value=2):
+            crawler(input_file, output_dir)
+
+            assert len(crawler.fetch.call_args[0][0]) == 2
+
+
+class TestCompletionManifest:
+    """Tests for the append-only completion manifest"""
+
+    def test_add_and_load(self, temp_dir):
+        """Test that recorded ids are loaded back as a set"""
+        manifest = Manifest.Manifest(temp_dir / "manifest.jsonl")
+        manifest.add(["123_R_001"])
+        manifest.add(["123_H_002", "123_A_003"])
+        manifest.close()
+
+        assert Manifest.Manifest(temp_dir / "manifest.jsonl").load() == {"123_R_001", "123_H_002", "123_A_003"}
+
+    def test_ignores_truncated_lines(self, temp_dir):
+        """Test that a line cut short by a killed run is ignored"""
+        path = temp_dir / "manifest.jsonl"
+        path.write_text('{"id": "123_R_001"}\n{"id": "123_R_0')
+
+        assert Manifest.Manifest(path).load() == {"123_R_001"}
+
+    def test_bootstraps_from_existing_files(self, temp_dir):
+        """Test that an output directory without a manifest is scanned once and recorded"""
+        for id in ["123_R_001", "456_H_002"]:
+            path = temp_dir / id.split("_")[0] / (id + ".json")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("{}")
+        (temp_dir / "123" / "123_R_001.reviews.jsonl").write_text("")
+        Manifest.getPartialPath(temp_dir, "789_H_003").parent.mkdir()
+        Manifest.getPartialPath(temp_dir, "789_H_003").write_text("{}")
+
+        assert Manifest.loadCompleted(temp_dir) == {"123_R_001", "456_H_002"}
+        assert Manifest.Manifest(Manifest.getManifestPath(temp_dir)).load() == {"123_R_001", "456_H_002"}
+
+    def test_missing_output_dir(self, temp_dir):
+        """Test that a fresh output directory has nothing completed"""
+        assert Manifest.loadCompleted(temp_dir / "missing") == set()
+
+
+class TestURLGrouping:
+    """Tests for fetching each page once for all the ids that share it"""
+
+    def test_normalizes_url(self):
+        """Test that case of scheme and host, trailing slashes and fragments are ignored"""
+        assert normalizeURL(" HTTPS://WWW.TripAdvisor.in/Hotel_Review-g1-d2.html#REVIEWS ") == "https://www.tripadvisor.in/Hotel_Review-g1-d2.html"
+        assert normalizeURL("https://example.com/a/") == normalizeURL("https://example.com/a")
+        assert normalizeURL("https://example.com/a?x=1") != normalizeURL("https://example.com/a?x=2")
+
+    def test_groups_ids_by_url(self):
+        """Test that ids sharing a page are grouped in input order"""
+        data = [
+            {"id": "123_R_001", "url": "https://example.com/1"},
+            {"id": "123_R_002", "url": "https://example.com/2"},
+            {"id": "456_R_003", "url": "https://example.com/1/"},
+            {"id": "123_R_001", "url": "https://example.com/1"},
+        ]
+
+        groups = groupByURL(data)
+
+        assert [group["ids"] for group in groups] == [["123_R_001", "456_R_003"], ["123_R_002"]]
+        assert [group["id"] for group in groups] == ["123_R_001", "123_R_002"]
+        assert groups[0]["url"] == "https://example.com/1"
+
+    def test_fetch_requests_shared_page_once(self):
+        """Test that fetch hands each page to the spider once and counts every id in the progress bar"""
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess'):
+            crawler = TourqueEntitiesCrawler()
+
+            test_data = [
+                {"id": "123_R_001", "url": "https://tripadvisor.com/r1"},
+                {"id": "123_R_002", "url": "https://tripadvisor.com/r1"},
+            ]
+
+            with patch.object(crawler.process, 'crawl') as mock_crawl:
+                with patch.object(crawler.process, 'start'):
+                    with patch('src.tourque.entities.getTourqueEntities.tqdm.tqdm') as mock_tqdm:
+                        with patch('src.tourque.entities.getTourqueEntities.dispatcher.connect'):
+                            crawler.fetch(test_data)
+
+                            mock_tqdm.assert_called_once_with(total=2)
+                            restaurants = mock_crawl.call_args_list[0].kwargs['items']
+                            assert restaurants == [{"id": "123_R_001", "ids": ["123_R_001", "123_R_002"], "url": "https://tripadvisor.com/r1"}]
+
+
+class TestEntityWriterPipeline:
+    """Tests for the item pipeline that writes entities as they are scraped"""
+
+    def test_writes_entity_file(self, temp_dir):
+        """Test that each scraped entity is saved to <city>/<id>.json"""
+        pipeline = EntityWriterPipeline(temp_dir)
         fetched_entity = {
             "id": "123_R_001",
             "name": "Test Restaurant",
             "rating": 4.5
         }
 
-        with patch.object(mock_crawler, 'fetch', return_value=[fetched_entity]):
-            mock_crawler(input_file, output_dir)
+        assert pipeline.process_item(fetched_entity, spider=None) is fetched_entity
+
+        expected_path = temp_dir / "123" / "123_R_001.json"
+        with open(expected_path, "r") as f:
+            saved_entity = json.load(f)
+        assert saved_entity["id"] == "123_R_001"
+        assert saved_entity["name"] == "Test Restaurant"
+
+    def test_leaves_no_temporary_files(self, temp_dir):
+        """Test that the atomic write leaves only the final file behind"""
+        pipeline = EntityWriterPipeline(temp_dir)
+        pipeline.process_item({"id": "123_R_001", "name": "Test Restaurant"}, spider=None)
+
+        assert [path.name for path in (temp_dir / "123").iterdir()] == ["123_R_001.json"]
+
+    def test_records_entity_in_manifest(self, temp_dir):
+        """Test that every written entity is appended to the completion manifest"""
+        pipeline = EntityWriterPipeline(temp_dir)
+        pipeline.process_item({"id": "123_R_001", "name": "A"}, spider=None)
+        pipeline.process_item({"id": "123_R_002", "name": "B"}, spider=None)
+        pipeline.close_spider(spider=None)
+
+        assert Manifest.loadCompleted(temp_dir) == {"123_R_001", "123_R_002"}
+
+    def test_partial_entity_is_kept_aside(self, temp_dir):
+        """Test that a partial entity is saved with its cursor, dropped and not recorded as complete"""
+        pipeline = EntityWriterPipeline(temp_dir)
+        partial_entity = {"id": "123_H_001", "name": "Test Hotel", "reviews": [], "cursor": {"urls": ["https://example.com/r?offset=25"], "chained": False, "reviews": 25}}
 
-            # Verify entity was saved
-            expected_path = output_dir / "123" / "123_R_001.json"
-            assert expected_path.exists()
+        with pytest.raises(DropItem):
+            pipeline.process_item(partial_entity, spider=None)
+        pipeline.close_spider(spider=None)
 
-            with open(expected_path, "r") as f:
-                saved_entity = json.load(f)
-            assert saved_entity["id"] == "123_R_001"
-            assert saved_entity["name"] == "Test Restaurant"
+        assert Manifest.loadPartials(temp_dir)["123_H_001"]["cursor"]["reviews"] == 25
+        assert not (temp_dir / "123" / "123_H_001.json").exists()
+        assert Manifest.loadCompleted(temp_dir) == set()
+
+    def test_complete_entity_removes_partial(self, temp_dir):
+        """Test that finishing a resumed entity removes its partial file"""
+        pipeline = EntityWriterPipeline(temp_dir)
+        with pytest.raises(DropItem):
+            pipeline.process_item({"id": "123_H_001", "cursor": {"urls": ["u"], "chained": False, "reviews": 0}}, spider=None)
+        pipeline.process_item({"id": "123_H_001", "name": "Test Hotel"}, spider=None)
+        pipeline.close_spider(spider=None)
+
+        assert Manifest.loadPartials(temp_dir) == {}
+        assert Manifest.loadCompleted(temp_dir) == {"123_H_001"}
+
+    def test_not_configured_without_output_dir(self):
+        """Test that the pipeline disables itself when no output directory is set"""
+        crawler = MagicMock()
+        crawler.settings.get.return_value = None
+        with pytest.raises(NotConfigured):
+            EntityWriterPipeline.from_crawler(crawler)
 
 
 class TestFetchMethod:
@@ -354,3 +587,107 @@ class TestFetchMethod:
                             assert 2 in items_counts  # 2 restaurants
                             assert 1 in items_counts  # 1 hotel
                             assert 1 in items_counts  # 1 attraction
+
+
+class TestWorkers:
+    """Tests for splitting a crawl across worker processes"""
+
+    def test_split_keeps_shared_pages_together(self):
+        """Test that ids sharing a page land in the same worker and no entity is lost"""
+        data = [
+            {"id": "123_R_001", "url": "https://example.com/1"},
+            {"id": "123_H_001", "url": "https://example.com/2"},
+            {"id": "456_R_001", "url": "https://example.com/1/"},
+            {"id": "123_A_001", "url": "https://example.com/3"},
+        ]
+
+        chunks = splitWork(data, 2)
+
+        assert len(chunks) == 2
+        ids = [sorted(item["ids"]) for chunk in chunks for item in chunk]
+        assert sorted(ids) == [["123_A_001"], ["123_H_001"], ["123_R_001", "456_R_001"]]
+
+    def test_split_regroups_grouped_items(self):
+        """Test that already grouped items keep all their ids"""
+        data = [{"id": "123_R_001", "ids": ["123_R_001", "456_R_001"], "url": "https://example.com/1"}]
+
+        assert groupByURL(data)[0]["ids"] == ["123_R_001", "456_R_001"]
+
+    def test_worker_paths(self):
+        """Test that every worker writes its own feed file"""
+        assert getWorkerPath(None, 0) is None
+        assert str(getWorkerPath("out/items.json", 1)) == "out/items.worker1.json"
+
+    def test_aggregates_progress_and_status(self, temp_dir):
+        """Test that progress from every worker is counted and one failing worker fails the run"""
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess'):
+            crawler = TourqueEntitiesCrawler(stats_dir_path = temp_dir / "stats")
+
+        data = [{"id": "123_R_%03d" % index, "url": "https://example.com/%d" % index} for index in range(6)]
+
+        count, status = crawler.fetchInWorkers(data, 3, output_dir_path = temp_dir, target = reportingWorker)
+        assert (count, status) == (6, 0)
+
+        count, status = crawler.fetchInWorkers(data + [{"id": "123_R_999", "url": "https://example.com/999"}], 3, output_dir_path = temp_dir, target = reportingWorker)
+        assert (count, status) == (7, 1)
+
+    def test_call_returns_worker_status(self, temp_dir):
+        """Test that __call__ hands the entities to the workers and returns their combined status"""
+        input_file = temp_dir / "input.json"
+        with open(input_file, "w") as f:
+            json.dump([{"id": "123_R_001", "url": "https://example.com/1"}], f)
+
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess'):
+            crawler = TourqueEntitiesCrawler()
+
+        with patch.object(crawler, 'fetchInWorkers', return_value=(0, 1)) as mock_fetch:
+            assert crawler(input_file, temp_dir / "output", workers = 2) == 1
+            assert mock_fetch.call_args[0][1] == 2
+
+
+class TestPriority:
+    """Tests for ordering the crawl by question demand"""
+
+    def test_counts_references_across_help_files(self, temp_dir):
+        """Test that every question referencing an entity counts once per help file"""
+        for split, questions in [("test", [{"url": "q1", "answer_entity_ids": ["0_R_1", "0_R_2"]}]), ("validation", [{"url": "q2", "answer_entity_ids": ["0_R_2"]}])]:
+            with open(temp_dir / ("%s_question_urls_to_answer_entity_ids.json" % split), "w") as f:
+                json.dump(questions, f)
+
+        demand = loadDemand(sorted(temp_dir.glob("*_question_urls_to_answer_entity_ids.json")))
+
+        assert demand["0_R_1"] == 1
+        assert demand["0_R_2"] == 2
+        assert demand["0_R_3"] == 0
+
+    def test_most_referenced_first(self):
+        """Test that entities are ordered by demand, shared pages sum their ids and ties keep input order"""
+        data = [
+            {"id": "0_R_1", "url": "https://example.com/1"},
+            {"id": "0_R_2", "url": "https://example.com/2"},
+            {"id": "0_R_3", "url": "https://example.com/3"},
+            {"id": "0_R_4", "url": "https://example.com/4"},
+            {"id": "1_R_1", "url": "https://example.com/3"},
+        ]
+        demand = {"0_R_1": 1, "0_R_2": 3, "0_R_3": 2, "1_R_1": 2}
+
+        ordered = prioritize(data, Counter(demand))
+
+        assert [item["id"] for item in ordered] == ["0_R_3", "0_R_2", "0_R_1", "0_R_4"]
+        assert ordered[0]["ids"] == ["0_R_3", "1_R_1"]
+
+    def test_call_prioritizes_when_asked(self, temp_dir):
+        """Test that __call__ hands the entities to fetch in demand order"""
+        input_file = temp_dir / "input.json"
+        with open(input_file, "w") as f:
+            json.dump([{"id": "0_R_1", "url": "https://example.com/1"}, {"id": "0_R_2", "url": "https://example.com/2"}], f)
+        help_file = temp_dir / "test_question_urls_to_answer_entity_ids.json"
+        with open(help_file, "w") as f:
+            json.dump([{"url": "q1", "answer_entity_ids": ["0_R_2"]}], f)
+
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess'):
+            crawler = TourqueEntitiesCrawler(priority_file_paths = [help_file])
+
+        with patch.object(crawler, 'fetch', return_value=2) as mock_fetch:
+            crawler(input_file, temp_dir / "output")
+            assert [item["id"] for item in mock_fetch.call_args[0][0]] == ["0_R_2", "0_R_1"]
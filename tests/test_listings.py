@@ -0,0 +1,177 @@
+"""
+Tests for utils/crawlers/Listings.py and src/custom/fetch/entities/getEntityURLs.py
+"""
+import json
+import pytest
+from unittest.mock import patch
+from scrapy.http import HtmlResponse, Request
+from utils.crawlers import Listings
+from src.custom.fetch.entities.getEntityURLs import EntityURLsCrawler, addEntityURLs
+
+
+RESTAURANTS_URL = "https://www.tripadvisor.in/Restaurants-g60763-New_York_City_New_York.html"
+HOTELS_URL = "https://www.booking.com/searchresults.en-gb.html?city=20088325"
+
+
+def makeRestaurantListing(url, start, count, page_size = None, last_offset = None):
+    """Build a TripAdvisor restaurant listing page linking each restaurant twice"""
+    links = "".join(['<a href="/Restaurant_Review-g60763-d%d-Reviews-Restaurant_%d-New_York.html"><img/></a><a href="/Restaurant_Review-g60763-d%d-Reviews-Restaurant_%d-New_York.html#REVIEWS">Restaurant %d</a>' % (i, i, i, i, i) for i in range(start, start + count)])
+    pagination = ""
+    if(page_size is not None):
+        pages = [page_size, 2 * page_size, last_offset]
+        pagination = "".join(['<a class="pageNum" href="/Restaurants-g60763-oa%d-New_York_City_New_York.html">%d</a>' % (offset, offset // page_size + 1) for offset in pages])
+    html = "<html><body>%s%s<a href=\"/Tourism-g60763-New_York.html\">Tourism</a></body></html>" % (links, pagination)
+    return HtmlResponse(url = url, body = html.encode("utf-8"), encoding = "utf-8", request = Request(url))
+
+
+def makeHotelListing(url, start, count, rows = None, last_offset = None):
+    """Build a booking.com search results page"""
+    links = "".join(['<a href="/hotel/us/hotel-%d.en-gb.html?label=x&sid=y">Hotel %d</a>' % (i, i) for i in range(start, start + count)])
+    pagination = ""
+    if(rows is not None):
+        pagination = "".join(['<a href="/searchresults.en-gb.html?city=20088325&offset=%d">%d</a>' % (offset, offset // rows + 1) for offset in [rows, last_offset]])
+    html = "<html><body>%s%s</body></html>" % (links, pagination)
+    return HtmlResponse(url = url, body = html.encode("utf-8"), encoding = "utf-8", request = Request(url))
+
+
+def crawl(crawler, responder):
+    """Run the spider callbacks until no request is left, answering requests last first"""
+    outputs = list(crawler.start_requests())
+    requested = []
+    items = []
+    while(outputs):
+        output = outputs.pop()
+        if(isinstance(output, Request)):
+            requested.append(output.url)
+            outputs += list(output.callback(responder(output.url), **output.cb_kwargs))
+        else:
+            items.append(output)
+    return requested, items
+
+
+class TestListingsParser:
+    """Tests for reading entity links and pagination from listing pages"""
+
+    @pytest.fixture
+    def parser(self):
+        """Create a listings parser"""
+        return Listings.Parser()
+
+    def test_reads_unique_restaurant_urls_in_order(self, parser):
+        """Test that each restaurant is read once, in listing order, without fragments"""
+        urls = parser.getEntityURLs(makeRestaurantListing(RESTAURANTS_URL, 0, 3), "R")
+
+        assert urls == ["https://www.tripadvisor.in/Restaurant_Review-g60763-d%d-Reviews-Restaurant_%d-New_York.html" % (i, i) for i in range(3)]
+
+    def test_reads_hotel_urls_without_tracking_parameters(self, parser):
+        """Test that booking.com hotel links lose their query string"""
+        urls = parser.getEntityURLs(makeHotelListing(HOTELS_URL, 0, 2), "H")
+
+        assert urls == ["https://www.booking.com/hotel/us/hotel-0.en-gb.html", "https://www.booking.com/hotel/us/hotel-1.en-gb.html"]
+
+    def test_derives_every_tripadvisor_page(self, parser):
+        """Test that pages hidden behind the ellipsis are derived from the last offset"""
+        urls = parser.getListingPageURLs(makeRestaurantListing(RESTAURANTS_URL, 0, 3, page_size = 30, last_offset = 150))
+
+        assert [parser.getOffset(url) for url in urls] == [30, 60, 90, 120, 150]
+        assert urls[0] == "https://www.tripadvisor.in/Restaurants-g60763-oa30-New_York_City_New_York.html"
+
+    def test_derives_every_booking_page(self, parser):
+        """Test that booking.com search result pages are derived from the offset parameter"""
+        urls = parser.getListingPageURLs(makeHotelListing(HOTELS_URL, 0, 2, rows = 25, last_offset = 100))
+
+        assert [parser.getOffset(url) for url in urls] == [25, 50, 75, 100]
+        assert "city=20088325" in urls[0]
+
+    def test_single_page_listing(self, parser):
+        """Test that a listing without pagination has no further pages"""
+        assert parser.getListingPageURLs(makeRestaurantListing(RESTAURANTS_URL, 0, 3)) == []
+
+
+class TestListingsCrawler:
+    """Tests for paging through listings concurrently"""
+
+    def respond(self, url):
+        """Answer a restaurant listing page with ten restaurants numbered by its offset"""
+        offset = Listings.Parser().getOffset(url) or 0
+        if(offset == 0):
+            return makeRestaurantListing(url, 0, 10, page_size = 10, last_offset = 40)
+        return makeRestaurantListing(url, offset, 10)
+
+    def test_requests_all_pages_at_once(self):
+        """Test that every remaining page is requested as soon as the first page is parsed"""
+        crawler = Listings.Crawler(listings = [])
+        listing = {"type": "R", "city": "New York", "url": RESTAURANTS_URL}
+        outputs = list(crawler.parse(self.respond(RESTAURANTS_URL), listing = listing))
+
+        assert len(outputs) == 4
+        assert all(isinstance(output, Request) for output in outputs)
+
+    def test_gathers_urls_in_listing_order(self):
+        """Test that out of order pages still give entities in listing order"""
+        crawler = Listings.Crawler(listings = [{"type": "R", "city": "New York", "url": RESTAURANTS_URL}])
+        requested, items = crawl(crawler, self.respond)
+
+        assert len(requested) == 5
+        assert len(items) == 1
+        assert items[0]["city"] == "New York"
+        assert [url.split("-")[2] for url in items[0]["urls"]] == ["d%d" % i for i in range(50)]
+
+    def test_limit_bounds_requested_pages(self):
+        """Test that a per-city limit requests only the pages holding the top entities"""
+        crawler = Listings.Crawler(listings = [{"type": "R", "city": "New York", "url": RESTAURANTS_URL}], limit = 15)
+        requested, items = crawl(crawler, self.respond)
+
+        assert len(requested) == 2
+        assert [url.split("-")[2] for url in items[0]["urls"]] == ["d%d" % i for i in range(15)]
+
+
+class TestAddEntityURLs:
+    """Tests for numbering discovered entities incrementally"""
+
+    CITIES = ["New York", "Washington"]
+
+    def test_numbers_new_entities_per_city_and_type(self):
+        """Test that ids use the city index and count up per city and type"""
+        data = []
+        results = [
+            {"type": "H", "city": "Washington", "urls": ["https://b.com/hotel/us/w1.en-gb.html"]},
+            {"type": "R", "city": "New York", "urls": ["https://t.com/r1", "https://t.com/r2"]},
+        ]
+
+        assert addEntityURLs(data, results, self.CITIES) == 3
+        assert data == [
+            {"id": "0_R_1", "url": "https://t.com/r1"},
+            {"id": "0_R_2", "url": "https://t.com/r2"},
+            {"id": "1_H_1", "url": "https://b.com/hotel/us/w1.en-gb.html"},
+        ]
+
+    def test_keeps_known_entities(self):
+        """Test that an incremental run only adds pages not seen before and keeps existing ids"""
+        data = [{"id": "0_R_7", "url": "https://t.com/r1"}]
+        results = [{"type": "R", "city": "New York", "urls": ["https://t.com/r1/", "https://t.com/r3"]}]
+
+        assert addEntityURLs(data, results, self.CITIES) == 1
+        assert data == [{"id": "0_R_7", "url": "https://t.com/r1"}, {"id": "0_R_8", "url": "https://t.com/r3"}]
+
+
+class TestEntityURLsCrawlerCall:
+    """Tests for the discovery entry point"""
+
+    def test_writes_entity_ids_to_entity_urls_file(self, temp_dir):
+        """Test that listings are selected by type and city and the output file is extended"""
+        urls_file = temp_dir / "city.entities.urls.json"
+        urls_file.write_text(json.dumps({"R": {"New York": "https://t.com/ny", "Washington": "https://t.com/dc"}, "H": {"New York": "https://b.com/ny"}, "A": {}}))
+        cities_file = temp_dir / "cities.json"
+        cities_file.write_text(json.dumps(["New York", "Washington"]))
+        output_file = temp_dir / "entity_ids_to_entity_urls.json"
+        output_file.write_text(json.dumps([{"id": "0_R_1", "url": "https://t.com/r1"}]))
+
+        with patch('src.custom.fetch.entities.getEntityURLs.CrawlerProcess'):
+            crawler = EntityURLsCrawler()
+        with patch.object(crawler, 'fetch', return_value=[{"type": "R", "city": "New York", "urls": ["https://t.com/r1", "https://t.com/r2"]}]):
+            assert crawler(urls_file, cities_file, output_file, entity_types = ["R"], cities = ["New York"]) == 1
+            assert crawler.fetch.call_args[0][0] == [{"type": "R", "city": "New York", "url": "https://t.com/ny"}]
+
+        with open(output_file) as f:
+            assert json.load(f) == [{"id": "0_R_1", "url": "https://t.com/r1"}, {"id": "0_R_2", "url": "https://t.com/r2"}]
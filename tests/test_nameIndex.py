@@ -0,0 +1,98 @@
+"""
+Tests for utils/nameIndex.py
+"""
+import random
+import string
+import pytest
+from unittest.mock import patch
+from fuzzywuzzy import fuzz
+from utils.nameIndex import NameIndex
+from src.custom.process.Processor2 import Processor as Processor2
+
+WORDS = ["Taj", "Grand", "Hotel", "Cafe", "Palace", "Oberoi", "Spice", "Garden", "Royal", "The", "Inn", "Bistro", "Kitchen", "Bar", "House", "Mahal"]
+
+
+def makeNames(size, seed = 0):
+    """Build entity names out of a few common words, so many names share n-grams"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + ("" if rng.random() < 0.5 else " %d" % rng.randrange(100)) for _ in range(size)]
+
+
+def perturb(name, rng):
+    """Insert, delete or replace up to two characters"""
+    characters = list(name)
+    for _ in range(rng.randint(0, 2)):
+        index = rng.randrange(len(characters))
+        operation = rng.choice(["insert", "delete", "replace"])
+        if(operation == "insert"):
+            characters.insert(index, rng.choice(string.ascii_letters + " "))
+        elif(operation == "delete" and len(characters) > 1):
+            del characters[index]
+        else:
+            characters[index] = rng.choice(string.ascii_letters)
+    return "".join(characters)
+
+
+class TestNameIndex:
+    """Tests for blocking fuzzy name matching candidates"""
+
+    def test_matches_equal_scan(self):
+        """Test that the index finds exactly the names a scan over every name finds"""
+        rng = random.Random(1)
+        names = makeNames(300)
+        index = NameIndex(range(len(names)), names)
+        tokens = [perturb(rng.choice(names), rng) for _ in range(60)] + WORDS + ["", "a", "Ta", "Tajj", "The Grand"]
+
+        assert sum(len(index.scan(token)) > 0 for token in tokens) > 10
+        for token in tokens:
+            assert index.findMatches(token) == index.scan(token)
+
+    def test_long_names_with_typos(self):
+        """Test that long names a few typos away still match"""
+        name = "The Grand Royal Palace Hotel and Spice Garden Kitchen"
+        index = NameIndex(["0_R_1", "0_R_2"], [name, "Royal Palace"])
+        token = name.replace("Grand", "Grnad").replace("Kitchen", "Kitchn")
+        assert fuzz.ratio(token, name) > 95
+        assert index.findMatches(token) == [0]
+
+    def test_length_window(self):
+        """Test that names of a very different length are never scored"""
+        index = NameIndex(["0_R_1", "0_R_2", "0_R_3"], ["Taj Mahal Palace", "Taj", "Taj Mahal Palace Hotel"])
+        assert index.getCandidates("Taj Mahal Palace").tolist() == [0]
+
+    def test_matches_are_memoized(self):
+        """Test that a repeated token is answered from the cache"""
+        index = NameIndex(["0_R_1"], ["Grand Cafe"])
+        index.getMatches("Grand Cafe")
+        index.getMatches("Grand Cafe")
+        assert index.getMatches.cache_info().hits == 1
+
+    def test_empty_index(self):
+        """Test that an index without names matches nothing"""
+        assert NameIndex([], []).findMatches("Grand Cafe") == []
+
+
+class TestProcessorMatching:
+    """Tests for Processor2 finding entities through the name index"""
+
+    def test_counts_equal_scan(self):
+        """Test that entity counts are those of scoring every token against every entity"""
+        names = makeNames(200, seed = 2)
+        city_entities = {"0": {"0_R_%d" % number: {"id": "0_R_%d" % number, "name": name} for number, name in enumerate(names)}}
+        rng = random.Random(3)
+        tokens = [perturb(rng.choice(names), rng) for _ in range(20)]
+        chunk = [(token, "NN") for token in tokens]
+
+        expected = {}
+        for token in tokens:
+            for entity_id, entity_item in city_entities["0"].items():
+                if(fuzz.ratio(token, entity_item["name"]) > 95):
+                    expected[entity_id] = expected.get(entity_id, 0) + 1
+
+        processor = Processor2(cities = ["Paris"], city_entities = city_entities, neighborhood_words = [])
+        post = {"city": "Paris", "answers": [{"body": "-"}]}
+        with patch("src.custom.process.Processor2.nltk.word_tokenize", return_value = []), patch("src.custom.process.Processor2.nltk.pos_tag", return_value = []), patch("src.custom.process.Processor2.nltk.ne_chunk", return_value = chunk):
+            post_entities = processor.getEntitiesForPost(post)
+
+        assert len(expected) > 0
+        assert {entity_id: entity_item["count"] for entity_id, entity_item in post_entities.items()} == expected
@@ -0,0 +1,110 @@
+"""
+Tests for utils/planner.py and the --plan mode of the crawlers
+"""
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from utils import planner
+from src.custom.fetch.posts.getPostsURLs import PostURLsCrawler
+
+
+class TestSample:
+    """Tests for sample function"""
+
+    def test_returns_all_items_when_size_exceeds_length(self):
+        """Test that all items are returned when the sample is larger than the input"""
+        assert planner.sample([1, 2, 3], 10) == [1, 2, 3]
+
+    def test_returns_requested_size(self):
+        """Test that the sample has the requested size"""
+        result = planner.sample(range(100), 10, seed = 0)
+        assert len(result) == 10
+        assert len(set(result)) == 10
+
+    def test_seed_is_reproducible(self):
+        """Test that the same seed gives the same sample"""
+        assert planner.sample(range(100), 10, seed = 1) == planner.sample(range(100), 10, seed = 1)
+
+
+class TestCrawlPlanner:
+    """Tests for CrawlPlanner extrapolation"""
+
+    @pytest.fixture
+    def crawl_planner(self):
+        """Create a planner that sampled 2 of 100 units"""
+        crawl_planner = planner.CrawlPlanner(total = 100, sampled = 2, concurrency = 4, delay = 0.5)
+        for _ in range(6):
+            crawl_planner.record(1000, 0.5)
+        crawl_planner.add(20)
+        crawl_planner.add(40)
+        return crawl_planner
+
+    def test_extrapolates_requests_and_bytes(self, crawl_planner):
+        """Test that totals scale with the sampled fraction"""
+        estimate = crawl_planner.estimate()
+        assert estimate["requests_per_item"] == 3
+        assert estimate["total_requests"] == 300
+        assert estimate["total_bytes"] == 300000
+        assert estimate["total_reviews"] == 3000
+
+    def test_wall_clock_is_bounded_by_delay(self, crawl_planner):
+        """Test that a download delay allows one request per delay, whatever the concurrency"""
+        estimate = crawl_planner.estimate()
+        # 4 concurrent requests of 0.5s could do 8 requests/s, but a 0.5s delay allows 2
+        assert estimate["requests_per_second"] == pytest.approx(2)
+        assert estimate["total_seconds"] == pytest.approx(300 / 2)
+
+    def test_wall_clock_uses_concurrency_without_delay(self):
+        """Test that without a delay, throughput is concurrency over latency"""
+        crawl_planner = planner.CrawlPlanner(total = 10, sampled = 1, concurrency = 4)
+        crawl_planner.record(1000, 0.5)
+        assert crawl_planner.estimate()["total_seconds"] == pytest.approx(10 / 8)
+
+    def test_wall_clock_is_bounded_by_autothrottle(self):
+        """Test that AutoThrottle caps throughput at its target concurrency over latency"""
+        crawl_planner = planner.CrawlPlanner(total = 10, sampled = 1, concurrency = 16, target_concurrency = 2.0)
+        crawl_planner.record(1000, 0.5)
+        assert crawl_planner.estimate()["requests_per_second"] == pytest.approx(4)
+
+    def test_sequential_sleep_adds_to_latency(self):
+        """Test that a sequential crawler sleeping after each request spends latency plus sleep per request"""
+        crawl_planner = planner.CrawlPlanner(total = 10, sampled = 1, sleep = 0.5)
+        crawl_planner.record(1000, 0.5)
+        assert crawl_planner.estimate()["total_seconds"] == pytest.approx(10)
+
+    def test_empty_planner_does_not_fail(self):
+        """Test that a planner without samples reports zeros"""
+        estimate = planner.CrawlPlanner(total = 10, sampled = 0).estimate()
+        assert estimate["total_requests"] == 0
+        assert estimate["total_seconds"] == 0
+
+    def test_report_mentions_totals(self, crawl_planner):
+        """Test that the report is human readable"""
+        report = crawl_planner.report(name = "restaurants")
+        assert "restaurants" in report
+        assert "300 requests" in report
+
+
+class TestPostURLsCrawlerPlan:
+    """Tests for PostURLsCrawler.plan"""
+
+    def test_plan_samples_cities_and_records_requests(self, temp_dir):
+        """Test that plan crawls only the sample and measures every request"""
+        city_urls_file = temp_dir / "city_urls.json"
+        with open(city_urls_file, "w") as f:
+            json.dump({"City %d" % i: "https://example.com/%d" % i for i in range(10)}, f)
+
+        html = b'<table class="topics"><tr></tr><tr><td></td><td><a href="/post1">Post</a></td></tr></table>'
+        response = MagicMock()
+        response.read.return_value = html
+
+        crawler = PostURLsCrawler(sleep = 0, retries = 1, num_posts = 5)
+        with patch("src.custom.fetch.posts.getPostsURLs.urllib.request.urlopen", return_value = response) as mock_urlopen:
+            with patch("src.custom.fetch.posts.getPostsURLs.tqdm.tqdm"):
+                estimate = crawler.plan(city_urls_file, sample_size = 3, seed = 0)
+
+        assert mock_urlopen.call_count == 3
+        assert estimate["sampled"] == 3
+        assert estimate["total_requests"] == 10
+        assert estimate["total_bytes"] == 10 * len(html)
+        assert estimate["total_posts"] == 10
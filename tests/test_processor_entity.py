@@ -1,9 +1,13 @@
 """
 Tests for utils/crawlers/Processor.py
 """
+import re
+import random
+import string
+import dateparser
 import pytest
 from collections import OrderedDict
-from utils.crawlers.Processor import Processor
+from utils.crawlers.Processor import Processor, DATE_FORMATS
 
 
 class TestProcessorStringProcessing:
@@ -110,6 +114,57 @@ class TestProcessReviewItem:
             assert result["date"] == expected_date
 
 
+class TestBatchProcessing:
+    """Tests for memoized date parsing and batched normalization"""
+
+    @pytest.fixture
+    def processor(self):
+        """Create a Processor instance"""
+        return Processor()
+
+    def legacyProcessString(self, s):
+        """The original chain of substitutions the single pass must reproduce"""
+        s = re.sub(r"\s+", " ", s)
+        s = re.sub(r"\.+", ".", s)
+        s = re.sub(r"\?+", "?", s)
+        return s.strip(string.punctuation + " ")
+
+    def test_process_string_matches_legacy_substitutions(self, processor):
+        """Test that the single-pass normalization equals the sequential substitutions on random text"""
+        rng = random.Random(0)
+        alphabet = "ab .?!,\n\t\u00a0\u2003-'"
+        for _ in range(2000):
+            s = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            assert processor.processString(s) == self.legacyProcessString(s)
+
+    def test_process_strings_matches_process_string(self, processor):
+        """Test that batch normalization equals normalizing each string on its own"""
+        rng = random.Random(1)
+        alphabet = "ab .?!\n"
+        strings = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20))) for _ in range(500)]
+        assert processor.processStrings(strings) == [processor.processString(s) for s in strings]
+
+    def test_process_strings_handles_separator_and_empty_batch(self, processor):
+        """Test that strings containing the batch separator and empty batches are handled"""
+        assert processor.processStrings([]) == []
+        assert processor.processStrings(["a\x00b..", "  c  "]) == ["a\x00b", "c"]
+
+    def test_parse_date_matches_dateparser(self, processor):
+        """Test that the strptime fast path agrees with dateparser on the known formats"""
+        for s in ["01 January 2023", "5 March 2019", "January 01, 2023", "December 31, 2020", "2023-01-01", "2018-07-09"]:
+            assert processor.parseDate(s) == dateparser.parse(s, date_formats = DATE_FORMATS)
+
+    def test_parse_date_falls_back_to_dateparser(self, processor):
+        """Test that dates outside the known formats are still parsed"""
+        assert processor.parseDate("  Jan 5 2021 ").strftime("%d %B %Y") == "05 January 2021"
+
+    def test_process_review_items_matches_process_review_item(self, processor):
+        """Test that batch review processing equals processing each review"""
+        items = [{"title": " T%d... " % i, "description": "Nice   place??? %d" % i, "rating": i % 5 + 1, "date": ["01 January 2023", "January 02, 2023", "2023-01-03"][i % 3], "url": " https://example.com/%d " % i} for i in range(30)]
+        assert processor.processReviewItems(items) == [processor.processReviewItem(item) for item in items]
+        assert processor.processReviewItems([]) == []
+
+
 class TestProcessEntityItem:
     """Tests for processEntityItem method"""
 
@@ -191,3 +246,24 @@ class TestProcessEntityItem:
             "latitude", "longitude", "rating", "url", "reviews"
         ]
         assert keys == expected_order
+
+    def test_fans_out_entity_to_every_id(self, processor, sample_entity):
+        """Test that an entity shared by several ids is copied out to each id"""
+        sample_entity["ids"] = [sample_entity["id"], "999_R_002"]
+
+        results = processor.processEntityItems(sample_entity)
+
+        assert [result["id"] for result in results] == [sample_entity["id"], "999_R_002"]
+        assert results[0]["name"] == results[1]["name"]
+        assert list(results[1].keys())[0] == "id"
+
+    def test_fan_out_points_to_shared_reviews_file(self, processor, sample_entity):
+        """Test that copies in another city refer back to the streamed reviews sidecar"""
+        sample_entity["ids"] = [sample_entity["id"], "999_R_002"]
+        sample_entity["reviews_file"] = sample_entity["id"] + ".reviews.jsonl"
+
+        results = processor.processEntityItems(sample_entity)
+
+        city = sample_entity["id"].split("_")[0]
+        assert results[0]["reviews_file"] == sample_entity["id"] + ".reviews.jsonl"
+        assert results[1]["reviews_file"] == "../%s/%s.reviews.jsonl" % (city, sample_entity["id"])
@@ -0,0 +1,86 @@
+"""
+Tests for utils/resolveEntities.py
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+from utils import resolveEntities
+from src.custom.process.Processor2 import Processor as Processor2
+
+
+def makeEntity(id, name, location = (40.7128, -74.0060)):
+    """Build a city entities summary"""
+    return {"id": id, "name": name, "categories": [], "location": list(location)}
+
+
+class TestTFIDF:
+    """Tests for the character n-gram vectors"""
+
+    def test_rows_are_normalized(self):
+        """Test that identical names have cosine 1 and unrelated names a low cosine"""
+        tfidf, df = resolveEntities.getTFIDF(["Joe's Pizza", "joes pizza!", "Grand Hotel"])
+        cosines = (tfidf @ tfidf.T).toarray()
+        assert np.allclose(np.diag(cosines), 1.0)
+        assert cosines[0, 1] > 0.6
+        assert cosines[0, 2] < 0.1
+
+    def test_candidates_share_a_blocking_key(self):
+        """Test that only names sharing an n-gram are compared, each pair once"""
+        tfidf, df = resolveEntities.getTFIDF(["abcdef", "abcxyz", "qrstuv"])
+        pairs = resolveEntities.getCandidatePairs(resolveEntities.getBlockingKeys(tfidf, df), chunk_size = 1)
+        assert pairs.tolist() == [[0, 1]]
+
+
+class TestResolve:
+    """Tests for mapping duplicate entities to canonical ids"""
+
+    def test_maps_duplicates_to_lowest_id(self):
+        """Test that near identical names close together map to the lowest numbered id"""
+        city_entities = {"0": {
+            "0_R_12": makeEntity("0_R_12", "The Grand Cafe"),
+            "0_R_3": makeEntity("0_R_3", "Grand Cafe, The", (40.7130, -74.0061)),
+            "0_R_7": makeEntity("0_R_7", "Sushi Palace"),
+        }}
+        assert resolveEntities.resolve(city_entities) == {"0_R_12": "0_R_3"}
+
+    def test_far_apart_entities_stay_apart(self):
+        """Test that branches of a chain in different places are not merged"""
+        city_entities = {"0": {
+            "0_R_1": makeEntity("0_R_1", "Starbucks Coffee"),
+            "0_R_2": makeEntity("0_R_2", "Starbucks Coffee", (40.7580, -73.9855)),
+        }}
+        assert resolveEntities.resolve(city_entities) == {}
+
+    def test_missing_locations_need_near_identical_names(self):
+        """Test that entities without coordinates are merged only on near identical names"""
+        city_entities = {"0": {
+            "0_H_1": makeEntity("0_H_1", "Hotel Royal Garden", (0.0, 0.0)),
+            "0_H_2": makeEntity("0_H_2", "Hotel Royal Garden", (0.0, 0.0)),
+            "0_H_3": makeEntity("0_H_3", "Royal Garden Inn", (0.0, 0.0)),
+        }}
+        assert resolveEntities.resolve(city_entities) == {"0_H_2": "0_H_1"}
+
+    def test_blocks_by_city_and_type(self):
+        """Test that entities of other cities or types are never merged"""
+        city_entities = {
+            "0": {"0_R_1": makeEntity("0_R_1", "Taj Palace"), "0_H_2": makeEntity("0_H_2", "Taj Palace")},
+            "1": {"1_R_1": makeEntity("1_R_1", "Taj Palace")},
+        }
+        assert resolveEntities.resolve(city_entities) == {}
+        assert resolveEntities.resolve(city_entities, by_type = False) == {"0_R_1": "0_H_2"}
+
+
+class TestCanonicalCounts:
+    """Tests for applying the canonical id mapping in Processor2"""
+
+    def test_duplicates_count_as_canonical_entity(self):
+        """Test that a mention of a duplicate counts for its canonical entity"""
+        city_entities = {"0": {"0_R_1": {"id": "0_R_1", "name": "Grand Cafe"}, "0_R_2": {"id": "0_R_2", "name": "Grand Cafe"}}}
+        processor = Processor2(cities = ["Paris"], city_entities = city_entities, neighborhood_words = [], canonical_ids = {"0_R_2": "0_R_1"})
+        post = {"city": "Paris", "answers": [{"body": "Try the Grand Cafe"}]}
+
+        with patch("src.custom.process.Processor2.nltk.word_tokenize", return_value = []), patch("src.custom.process.Processor2.nltk.pos_tag", return_value = []), patch("src.custom.process.Processor2.nltk.ne_chunk", return_value = [("Try", "VB")]):
+            post_entities = processor.getEntitiesForPost(post)
+
+        assert list(post_entities) == ["0_R_1"]
+        assert post_entities["0_R_1"]["count"] == 2
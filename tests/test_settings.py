@@ -0,0 +1,55 @@
+"""
+Tests for utils/crawlers/Settings.py
+"""
+import pytest
+from unittest.mock import patch
+from utils.crawlers import Settings
+from src.tourque.entities.getTourqueEntities import TourqueEntitiesCrawler
+
+
+class TestGetSettings:
+    """Tests for building crawl settings from a profile and overrides"""
+
+    def test_default_profile_is_empty(self):
+        """Test that the default profile keeps scrapy defaults"""
+        assert Settings.getSettings() == {}
+
+    def test_unknown_profile_raises(self):
+        """Test that an unknown profile name is rejected"""
+        with pytest.raises(ValueError):
+            Settings.getSettings(profile = "turbo")
+
+    def test_local_rerun_serves_only_from_cache(self):
+        """Test that the local rerun profile never goes to the network"""
+        settings = Settings.getSettings(profile = "local_rerun")
+        assert settings["HTTPCACHE_ENABLED"] is True
+        assert settings["HTTPCACHE_IGNORE_MISSING"] is True
+        assert settings["HTTPCACHE_EXPIRATION_SECS"] == 0
+        assert settings["AUTOTHROTTLE_ENABLED"] is False
+
+    def test_overrides_take_precedence_over_profile(self):
+        """Test that explicit options override the profile values"""
+        settings = Settings.getSettings(profile = "polite", concurrent_requests = 8, concurrent_requests_per_domain = 2, autothrottle_target_concurrency = 1.5)
+        assert settings["CONCURRENT_REQUESTS"] == 8
+        assert settings["CONCURRENT_REQUESTS_PER_DOMAIN"] == 2
+        assert settings["AUTOTHROTTLE_TARGET_CONCURRENCY"] == 1.5
+
+    def test_httpcache_backends(self):
+        """Test that the cache backend option selects the storage class"""
+        assert Settings.getSettings(httpcache = "dbm")["HTTPCACHE_STORAGE"] == "scrapy.extensions.httpcache.DbmCacheStorage"
+        assert Settings.getSettings(httpcache = "filesystem", httpcache_dir = "/tmp/cache")["HTTPCACHE_DIR"] == "/tmp/cache"
+        assert Settings.getSettings(profile = "cached", httpcache = "none")["HTTPCACHE_ENABLED"] is False
+
+    def test_dns_cache_and_reactor(self):
+        """Test that DNS cache and reactor options are mapped to scrapy settings"""
+        settings = Settings.getSettings(dns_cache = False, reactor = "asyncio")
+        assert settings["DNSCACHE_ENABLED"] is False
+        assert settings["TWISTED_REACTOR"] == "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+
+    def test_settings_are_passed_to_crawler_process(self):
+        """Test that TourqueEntitiesCrawler forwards the settings to CrawlerProcess"""
+        with patch("src.tourque.entities.getTourqueEntities.CrawlerProcess") as mock_process:
+            TourqueEntitiesCrawler(settings = Settings.getSettings(profile = "local_rerun"))
+
+        settings = mock_process.call_args.kwargs["settings"]
+        assert settings["HTTPCACHE_IGNORE_MISSING"] is True
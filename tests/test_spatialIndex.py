@@ -0,0 +1,95 @@
+"""
+Tests for utils/spatialIndex.py
+"""
+import numpy as np
+import pytest
+from utils import spatialIndex
+from utils.spatialIndex import SpatialIndex
+
+
+@pytest.fixture
+def index():
+    """Entities along the equator, one degree (about 111 km) apart, and one without coordinates"""
+    ids = ["0_R_%d" % number for number in range(5)] + ["0_R_9"]
+    locations = [[0.0, float(number)] for number in range(1, 6)] + [[0.0, 0.0]]
+    return SpatialIndex(ids, locations)
+
+
+class TestHaversine:
+    """Tests for the vectorized great circle distance"""
+
+    def test_known_distance(self):
+        """Test the distance between two cities"""
+        # New York to London is about 5570 km
+        assert spatialIndex.haversine(40.7128, -74.0060, 51.5074, -0.1278) == pytest.approx(5570, rel = 0.01)
+
+    def test_vectorized(self):
+        """Test that arrays of points give one distance each"""
+        distances = spatialIndex.haversine([0.0, 0.0], [0.0, 0.0], [0.0, 1.0], [0.0, 0.0])
+        assert distances[0] == 0.0
+        assert distances[1] == pytest.approx(111.2, rel = 0.01)
+
+    def test_pairwise_matrix(self):
+        """Test that the pairwise matrix is symmetric with a zero diagonal"""
+        distances = spatialIndex.pairwiseDistances([[0.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+        assert distances.shape == (3, 3)
+        assert np.allclose(distances, distances.T)
+        assert np.allclose(np.diag(distances), 0.0)
+
+
+class TestSpatialIndex:
+    """Tests for radius and nearest neighbour queries"""
+
+    def test_skips_entities_without_location(self, index):
+        """Test that (0, 0) locations are not indexed"""
+        assert len(index) == 5
+        assert "0_R_9" not in index
+
+    def test_query_radius(self, index):
+        """Test that a radius query returns the entities within it, nearest first"""
+        result = index.queryRadius(0.0, 3.1, 150)
+        assert [id for id, distance in result] == ["0_R_2", "0_R_3", "0_R_1"]
+        assert result[0][1] == pytest.approx(11.1, rel = 0.01)
+
+    def test_query_radius_matches_linear_scan(self):
+        """Test that the tree finds exactly the entities a linear haversine scan finds"""
+        rng = np.random.default_rng(0)
+        locations = np.stack([rng.uniform(40.5, 41.0, 2000), rng.uniform(-74.3, -73.7, 2000)], axis = 1)
+        index = SpatialIndex(["0_R_%d" % number for number in range(2000)], locations)
+
+        for lat, lon, km in [(40.75, -74.0, 1.0), (40.6, -73.8, 5.0), (40.9, -74.2, 0.2)]:
+            expected = {"0_R_%d" % number for number in np.flatnonzero(spatialIndex.haversine(lat, lon, locations[:, 0], locations[:, 1]) <= km)}
+            assert {id for id, distance in index.queryRadius(lat, lon, km)} == expected
+
+    def test_query_nearest(self, index):
+        """Test that the k nearest entities come back in order"""
+        assert [id for id, distance in index.queryNearest(0.0, 4.8, k = 2)] == ["0_R_4", "0_R_3"]
+        assert len(index.queryNearest(0.0, 4.8, k = 10)) == 5
+
+    def test_query_radius_many(self, index):
+        """Test that many centers are answered in one call"""
+        assert index.queryRadiusMany([[0.0, 1.0], [0.0, 10.0]], 50) == [["0_R_0"], []]
+
+    def test_pairs(self, index):
+        """Test that pairs within a distance are found"""
+        assert len(index.getPairs(120)) == 4
+        assert len(index.getPairs(50)) == 0
+
+    def test_distances_for_candidates(self, index):
+        """Test the pairwise distances of a post's candidate entities"""
+        distances = index.getDistances(["0_R_0", "0_R_2", "0_R_9"])
+        assert distances[0, 1] == pytest.approx(222.4, rel = 0.01)
+        assert np.isnan(distances[0, 2])
+
+    def test_city_indexes(self):
+        """Test that every city of a city entities structure gets its own index"""
+        city_entities = {"0": {"0_R_1": {"id": "0_R_1", "location": [1.0, 1.0]}}, "1": {"1_H_1": {"id": "1_H_1", "location": [2.0, 2.0]}}}
+        indexes = spatialIndex.getCityIndexes(city_entities)
+        assert sorted(indexes) == ["0", "1"]
+        assert indexes["1"].getLocation("1_H_1") == [2.0, 2.0]
+
+    def test_empty_index(self):
+        """Test that an index without located entities answers with nothing"""
+        index = SpatialIndex(["0_R_1"], [[0.0, 0.0]])
+        assert index.queryRadius(1.0, 1.0, 10) == []
+        assert index.queryNearest(1.0, 1.0) == []
@@ -0,0 +1,140 @@
+"""
+Tests for utils/crawlers/Stats.py
+"""
+import json
+import asyncio
+import pytest
+from unittest.mock import patch
+from scrapy import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from utils.crawlers import Stats
+from src.tourque.entities.getTourqueEntities import TourqueEntitiesCrawler
+
+
+class HotelsSpider(Spider):
+    """A stand-in for the hotels spider"""
+
+    name = "hotels"
+
+    def parseReviewPage(self, response):
+        """Yield two items"""
+        yield {"id": "1"}
+        yield {"id": "2"}
+
+
+def makeResponse(callback = None, body = b"<html></html>", latency = 0.5):
+    """Build a response whose request carries the callback and download latency"""
+    request = Request("https://www.booking.com/reviewlist.en-gb.html", callback = callback, meta = {"download_latency": latency})
+    return HtmlResponse(url = request.url, body = body, request = request)
+
+
+@pytest.fixture
+def crawler(temp_dir):
+    """Create a crawler with crawl stats enabled"""
+    return get_crawler(HotelsSpider, {"CRAWL_STATS_DIR_PATH": str(temp_dir), "CRAWL_STATS_INTERVAL": 0})
+
+
+class TestCallbackTimerMiddleware:
+    """Tests for timing spider callbacks"""
+
+    def test_records_calls_and_cpu_time_per_callback(self, crawler):
+        """Test that each callback's output is passed through and timed under its name"""
+        middleware = Stats.CallbackTimerMiddleware.from_crawler(crawler)
+        spider = HotelsSpider()
+        response = makeResponse(callback = spider.parseReviewPage)
+
+        outputs = list(middleware.process_spider_output(response, spider.parseReviewPage(response)))
+
+        assert outputs == [{"id": "1"}, {"id": "2"}]
+        assert crawler.stats.get_value("crawlstats/callback/parseReviewPage/calls") == 1
+        assert crawler.stats.get_value("crawlstats/callback/parseReviewPage/cpu_seconds") >= 0
+
+    def test_defaults_to_parse(self, crawler):
+        """Test that requests without an explicit callback are counted as parse"""
+        middleware = Stats.CallbackTimerMiddleware.from_crawler(crawler)
+        list(middleware.process_spider_output(makeResponse(), iter([])))
+
+        assert crawler.stats.get_value("crawlstats/callback/parse/calls") == 1
+
+    def test_times_async_output(self, crawler):
+        """Test that asynchronous spider output is timed too"""
+        middleware = Stats.CallbackTimerMiddleware.from_crawler(crawler)
+
+        async def output():
+            yield {"id": "1"}
+
+        async def collect():
+            return [item async for item in middleware.process_spider_output_async(makeResponse(), output())]
+
+        assert asyncio.run(collect()) == [{"id": "1"}]
+        assert crawler.stats.get_value("crawlstats/callback/parse/calls") == 1
+
+    def test_not_configured_without_stats_dir(self):
+        """Test that the middleware disables itself when no stats directory is set"""
+        with pytest.raises(NotConfigured):
+            Stats.CallbackTimerMiddleware.from_crawler(get_crawler(HotelsSpider))
+
+
+class TestCrawlStats:
+    """Tests for the per spider crawl stats extension"""
+
+    def test_summary_and_textfile(self, crawler, temp_dir):
+        """Test that responses, items and callbacks end up in the JSON summary and the Prometheus textfile"""
+        extension = Stats.CrawlStats.from_crawler(crawler)
+        spider = HotelsSpider()
+        extension.spider_opened(spider)
+
+        for size, latency in [(100, 0.5), (300, 1.5)]:
+            response = makeResponse(body = b"x" * size, latency = latency)
+            extension.response_received(response, response.request, spider)
+        extension.item_scraped({"id": "1"}, None, spider)
+        extension.item_dropped({"id": "2"}, None, Exception(), spider)
+        Stats.CallbackTimerMiddleware.from_crawler(crawler).record("parseReviewPage", 0.25)
+
+        extension.spider_closed(spider, "finished")
+
+        with open(temp_dir / "hotels.json") as f:
+            summary = json.load(f)
+        assert summary["spider"] == "hotels"
+        assert summary["responses"] == 2
+        assert summary["response_bytes"] == 400
+        assert summary["response_bytes_max"] == 300
+        assert summary["latency_seconds_mean"] == 1.0
+        assert summary["latency_seconds_max"] == 1.5
+        assert summary["items"] == 1
+        assert summary["items_dropped"] == 1
+        assert summary["callbacks"]["parseReviewPage"]["cpu_seconds"] == 0.25
+        assert summary["finish_reason"] == "finished"
+
+        text = (temp_dir / "hotels.prom").read_text()
+        assert 'tourque_crawl_responses_total{spider="hotels"} 2' in text
+        assert 'tourque_crawl_callback_cpu_seconds_total{spider="hotels",callback="parseReviewPage"} 0.25' in text
+        assert not list(temp_dir.glob("*.tmp"))
+
+    def test_snapshots_are_appended(self, crawler, temp_dir):
+        """Test that every snapshot adds a line to the snapshots file"""
+        extension = Stats.CrawlStats.from_crawler(crawler)
+        spider = HotelsSpider()
+        extension.spider_opened(spider)
+
+        extension.snapshot(spider)
+        extension.snapshot(spider)
+
+        with open(temp_dir / "hotels.snapshots.jsonl") as f:
+            assert len(f.readlines()) == 2
+
+    def test_enabled_from_entities_crawler(self, temp_dir):
+        """Test that TourqueEntitiesCrawler enables the extension and middleware only when asked"""
+        with patch('src.tourque.entities.getTourqueEntities.CrawlerProcess') as mock_process:
+            TourqueEntitiesCrawler(stats_dir_path = temp_dir, stats_interval = 10)
+            settings = mock_process.call_args.kwargs['settings']
+
+            assert 'utils.crawlers.Stats.CrawlStats' in settings['EXTENSIONS']
+            assert 'utils.crawlers.Stats.CallbackTimerMiddleware' in settings['SPIDER_MIDDLEWARES']
+            assert settings['CRAWL_STATS_DIR_PATH'] == str(temp_dir)
+            assert settings['CRAWL_STATS_INTERVAL'] == 10
+
+            TourqueEntitiesCrawler()
+            assert 'EXTENSIONS' not in mock_process.call_args.kwargs['settings']
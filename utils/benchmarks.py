@@ -0,0 +1,284 @@
+import re
+import copy
+import time
+import random
+import string
+import argparse
+import tracemalloc
+import dateparser
+from collections import OrderedDict
+
+from utils import common, entityIds
+from utils import nameIndex
+from utils.nameIndex import NameIndex
+from utils.crawlers import Processor
+
+def measure(function, repeat = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def makeReviews(size, seed = None):
+    rng = random.Random(seed)
+    months = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+    words = ["great", "food", "view", "staff", "room", "clean", "friendly", "location", "price", "service"]
+
+    def makeText(count):
+        text = " ".join(rng.choice(words) + rng.choice(["", "", ".", "...", "?", "!!", ",", "  \n"]) for _ in range(count))
+        return rng.choice(["", " ", "\n", "..."]) + text
+
+    def makeDate():
+        day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2010, 2020)
+        return rng.choice(["%02d %s %d" % (day, months[month - 1], year), "%s %02d, %d" % (months[month - 1], day, year), "%d-%02d-%02d" % (year, month, day)])
+
+    reviews = []
+    for index in range(size):
+        reviews.append({"title": makeText(rng.randint(2, 8)), "description": makeText(rng.randint(40, 120)), "rating": rng.choice([1, 2, 3, 4, 5]), "date": makeDate(), "url": "https://www.tripadvisor.in/ShowUserReviews-g1-d1-r%d-Review.html" % index})
+    return reviews
+
+class LegacyProcessor:
+    # The review processing as it was before formats were memoized and normalization was batched
+    def processString(self, s):
+        s = re.sub(r"\s+", " ", s)
+        s = re.sub(r"\.+", ".", s)
+        s = re.sub(r"\?+", "?", s)
+        s = s.strip(string.punctuation + " ")
+        return s
+
+    def processReviewItem(self, item):
+        ordered_item = OrderedDict()
+
+        ordered_item["title"] = self.processString(item["title"])
+        ordered_item["description"] = self.processString(item["description"])
+        ordered_item["rating"] = float(item["rating"])
+        ordered_item["date"] = dateparser.parse(item["date"].strip(), date_formats = ["%d %B %Y", "%B %d, %Y", "%Y-%m-%d"]).strftime("%d %B %Y")
+        ordered_item["url"] = self.processString(item["url"])
+
+        return ordered_item
+
+def benchmarkProcessor(size, page_size, repeat, seed = None):
+    reviews = makeReviews(size, seed = seed)
+    pages = [reviews[index:index + page_size] for index in range(0, size, page_size)]
+
+    legacy_processor = LegacyProcessor()
+    processor = Processor.Processor()
+
+    if(list(map(legacy_processor.processReviewItem, reviews)) != processor.processReviewItems(reviews)):
+        raise AssertionError("Processor output differs from the legacy processor")
+
+    results = OrderedDict()
+    results["legacy"] = size / measure(lambda: [legacy_processor.processReviewItem(review) for review in reviews], repeat = repeat)
+    results["per_review"] = size / measure(lambda: [processor.processReviewItem(review) for review in reviews], repeat = repeat)
+    results["batched"] = size / measure(lambda: [processor.processReviewItems(page) for page in pages], repeat = repeat)
+
+    print("Processed %d reviews (%d per page, best of %d)" % (size, page_size, repeat))
+    for name, rate in results.items():
+        print("%-12s %12.0f reviews/s  %6.1fx" % (name, rate, rate / results["legacy"]))
+
+    return results
+
+def legacyUpdate(d, u):
+    # utils.common.update as it was before merges became hash based
+    for k, v in u.items():
+        if(isinstance(v, dict)):
+            d[k] = legacyUpdate(d[k], v)
+        else:
+            if(isinstance(v, list)):
+                for e in v:
+                    if(e not in d[k]):
+                        d[k].append(e)
+            else:
+                d[k] = v
+    return d
+
+def makeCityEntities(cities, entities, seed = None):
+    rng = random.Random(seed)
+    categories = ["Wifi", "Pool", "Parking", "Bar", "Spa", "Gym", "Vegetarian", "Seafood", "Museum", "Park", "Tours", "Nightlife"]
+
+    city_entities = OrderedDict()
+    for city in range(cities):
+        city_entities[str(city)] = OrderedDict()
+        for index in range(entities):
+            id = "%d_%s_%d" % (city, rng.choice("RHA"), index)
+            city_entities[str(city)][id] = {"id": id, "name": "Entity %d" % index, "categories": rng.sample(categories, rng.randint(1, 6)), "location": [rng.uniform(-90, 90), rng.uniform(-180, 180)]}
+    return city_entities
+
+def makeUpdates(city_entities, size, new, seed = None):
+    # A crawl's worth of changes: new categories on known entities, plus new entities when asked for
+    rng = random.Random(seed)
+    cities = list(city_entities)
+    updates = []
+    for index in range(size):
+        city = rng.choice(cities)
+        if(index < new):
+            id = "%s_R_new%d" % (city, index)
+            updates.append({city: {id: {"id": id, "name": "New %d" % index, "categories": ["Bar"], "location": [0.0, 0.0]}}})
+        else:
+            id = rng.choice(list(city_entities[city]))
+            updates.append({city: {id: {"categories": ["Rooftop", rng.choice(["Bar", "Pool"])]}}})
+    return updates
+
+def benchmarkUpdate(cities, entities, size, repeat, seed = None):
+    city_entities = makeCityEntities(cities, entities, seed = seed)
+    updates = makeUpdates(city_entities, size, 0, seed = seed)
+    updates_with_new = makeUpdates(city_entities, size, size // 10, seed = seed)
+    # A city level list of every entity id, the shape where list merges were quadratic
+    index = {city: list(city_entities[city]) for city in city_entities}
+    index_updates = []
+    for number in range(size):
+        city = list(index)[number % len(index)]
+        index_updates.append({city: ["%s_R_new%d" % (city, number)] + index[city][number % 50:number % 50 + 5]})
+
+    if(legacyUpdate(copy.deepcopy(city_entities), updates[0]) != common.update(copy.deepcopy(city_entities), updates[0])):
+        raise AssertionError("update output differs from the legacy update")
+
+    def run(function, data, batch):
+        copies = [copy.deepcopy(data) for _ in range(repeat)]
+        return size / measure(lambda: function(copies.pop(), batch), repeat = repeat)
+
+    def legacyMany(d, batch):
+        for u in batch:
+            legacyUpdate(d, u)
+        return d
+
+    def many(d, batch):
+        for u in batch:
+            common.update(d, u)
+        return d
+
+    legacy_index = legacyMany(copy.deepcopy(index), index_updates)
+    if(legacy_index != common.updateMany(copy.deepcopy(index), index_updates)):
+        raise AssertionError("updateMany output differs from the legacy update")
+
+    results = OrderedDict()
+    results["entities/legacy"] = run(legacyMany, city_entities, updates)
+    results["entities/update"] = run(many, city_entities, updates)
+    results["entities/many"] = run(common.updateMany, city_entities, updates)
+    results["entities+new/many"] = run(common.updateMany, city_entities, updates_with_new)
+    results["id_lists/legacy"] = run(legacyMany, index, index_updates)
+    results["id_lists/update"] = run(many, index, index_updates)
+    results["id_lists/many"] = run(common.updateMany, index, index_updates)
+
+    print("Merged %d updates into %d cities x %d entities (best of %d)" % (size, cities, entities, repeat))
+    for name, rate in results.items():
+        baseline = results[name.split("/")[0].replace("entities+new", "entities") + "/legacy"]
+        print("%-20s %12.0f updates/s  %6.1fx" % (name, rate, rate / baseline))
+
+    return results
+
+def makeIds(size, seed = None):
+    rng = random.Random(seed)
+    return ["%d_%s_%s" % (rng.randrange(300), rng.choice("RHA"), rng.choice(["%d", "%03d"]) % rng.randrange(100000)) for _ in range(size)]
+
+def benchmarkIds(size, repeat, seed = None):
+    ids = makeIds(size, seed = seed)
+    codes = entityIds.encodeMany(ids)
+    if(entityIds.decodeMany(codes) != ids):
+        raise AssertionError("Decoded ids differ from the encoded ones")
+
+    # Packing pays off only for work repeated over ids already held as codes; the conversions themselves parse every string
+    results = OrderedDict()
+    results["split_filters"] = size / measure(lambda: [[id for id in ids if id.split("_")[1] == type] for type in "RHA"], repeat = repeat)
+    results["encodeMany"] = size / measure(lambda: entityIds.encodeMany(ids), repeat = repeat)
+    results["decodeMany"] = size / measure(lambda: entityIds.decodeMany(codes), repeat = repeat)
+    results["code_masks"] = size / measure(lambda: [entityIds.getMask(codes, types = [type]) for type in "RHA"], repeat = repeat)
+
+    entities = {id: {"id": id, "name": "Entity %d" % index, "location": [1.0, 2.0]} for index, id in enumerate(ids)}
+    tracemalloc.start()
+    copied = {id: {"id": entity["id"], "name": "".join(entity["name"]), "location": list(entity["location"])} for id, entity in entities.items()}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    table = entityIds.EntityTable.fromEntities(entities)
+
+    print("Converted %d entity ids (best of %d)" % (size, repeat))
+    for name, rate in results.items():
+        print("%-14s %12.0f ids/s  %6.1fx" % (name, rate, rate / results["split_filters"]))
+    print("%-14s %12.0f bytes/entity (dicts %.0f)" % ("EntityTable", table.nbytes / len(table), dict_bytes / len(copied)))
+
+    return results
+
+def makeNames(size, seed = None):
+    rng = random.Random(seed)
+    words = ["The", "Grand", "Royal", "Hotel", "Cafe", "Palace", "Spice", "Garden", "Inn", "Bistro", "Kitchen", "Bar", "House", "Residency", "Tandoor", "Dhaba"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) + " " + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8))) for _ in range(size)]
+
+def makeTokens(names, size, seed = None):
+    # Chunks as Processor2 sees them: entity names with a typo, and plain nouns that match nothing
+    rng = random.Random(seed)
+    tokens = []
+    for _ in range(size):
+        if(rng.random() < 0.5):
+            name = list(rng.choice(names))
+            name[rng.randrange(len(name))] = rng.choice(string.ascii_lowercase)
+            tokens.append("".join(name))
+        else:
+            tokens.append(rng.choice(["food", "view", "Hotel", "breakfast", "Garden", "station", "market", "Spice Kitchen"]))
+    return tokens
+
+def benchmarkNames(sizes, tokens, scanned_tokens, repeat, seed = None):
+    print("Matched %d tokens against entity names (best of %d, scan over %d tokens)" % (tokens, repeat, scanned_tokens))
+
+    results = OrderedDict()
+    for size in sizes:
+        names = makeNames(size, seed = seed)
+        token_list = makeTokens(names, tokens, seed = seed)
+        index = NameIndex(range(size), names)
+
+        # The scan scores every token against every name, so it is timed on the first few tokens only
+        if([index.scan(token) for token in token_list[:scanned_tokens]] != [index.findMatches(token) for token in token_list[:scanned_tokens]]):
+            raise AssertionError("Name index matches differ from the scan")
+
+        def match():
+            # Every run starts with cold memoized scores, so repeats measure the same work
+            nameIndex.getRatio.cache_clear()
+            return [index.findMatches(token) for token in token_list]
+
+        build = measure(lambda: NameIndex(range(size), names), repeat = repeat)
+        scan = scanned_tokens / measure(lambda: [index.scan(token) for token in token_list[:scanned_tokens]], repeat = 1)
+        indexed = tokens / measure(match, repeat = repeat)
+        results[size] = {"build": build, "scan": scan, "index": indexed}
+
+        print("%-8d build %7.2fs  scan %10.1f tokens/s  index %10.1f tokens/s  %8.1fx" % (size, build, scan, indexed, indexed / scan))
+
+    return results
+
+if(__name__ == "__main__"):
+    defaults = {}
+
+    defaults["size"] = 20000
+    defaults["page_size"] = 20
+    defaults["repeat"] = 3
+    defaults["seed"] = 0
+    defaults["cities"] = 50
+    defaults["entities"] = 4000
+    defaults["sizes"] = [1000, 5000, 10000, 50000]
+    defaults["tokens"] = 1000
+    defaults["scanned_tokens"] = 20
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("benchmark", type = str, choices = ["processor", "update", "names", "ids"])
+    parser.add_argument("--size", type = int, default = defaults["size"])
+    parser.add_argument("--page_size", type = int, default = defaults["page_size"])
+    parser.add_argument("--repeat", type = int, default = defaults["repeat"])
+    parser.add_argument("--seed", type = int, default = defaults["seed"])
+    parser.add_argument("--cities", type = int, default = defaults["cities"])
+    parser.add_argument("--entities", type = int, default = defaults["entities"])
+    parser.add_argument("--sizes", type = int, nargs = "+", default = defaults["sizes"])
+    parser.add_argument("--tokens", type = int, default = defaults["tokens"])
+    parser.add_argument("--scanned_tokens", type = int, default = defaults["scanned_tokens"])
+
+    options = parser.parse_args()
+
+    if(options.benchmark == "processor"):
+        benchmarkProcessor(options.size, options.page_size, options.repeat, seed = options.seed)
+    elif(options.benchmark == "update"):
+        benchmarkUpdate(options.cities, options.entities, options.size, options.repeat, seed = options.seed)
+    elif(options.benchmark == "names"):
+        benchmarkNames(options.sizes, options.tokens, options.scanned_tokens, options.repeat, seed = options.seed)
+    elif(options.benchmark == "ids"):
+        benchmarkIds(options.size, options.repeat, seed = options.seed)
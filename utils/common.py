@@ -1,3 +1,5 @@
+import os
+import re
 import json
 import pickle
 from pathlib import Path
@@ -12,23 +14,180 @@ def create(path) -> None:
 def loadJSON(path) -> None:
     return json.load(open(path, "r", encoding = "utf-8"))
 
-def dumpJSON(data, path, sort_keys = False) -> None:
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+def readJSONFields(file, fields, chunk_size = 65536) -> dict:
+    # Decodes the top-level object one member at a time and stops once every wanted field is read, so later members (entity reviews) are never parsed
+    decoder = json.JSONDecoder()
+    fields = set(fields)
+    buffer = ""
+    index = 0
+    eof = False
+
+    def fill(size):
+        nonlocal buffer, index, eof
+        chunk = file.read(max(size, chunk_size))
+        eof = (chunk == "")
+        buffer = buffer[index:] + chunk
+        index = 0
+
+    def skip(expected = None):
+        nonlocal index
+        while(True):
+            index = WHITESPACE.match(buffer, index).end()
+            if(index < len(buffer) or eof):
+                break
+            fill(chunk_size)
+        if(index >= len(buffer)):
+            raise json.JSONDecodeError("Unexpected end of data", buffer, index)
+        if(expected is not None):
+            if(buffer[index] not in expected):
+                raise json.JSONDecodeError("Expecting one of %r" % expected, buffer, index)
+            index += 1
+            return buffer[index - 1]
+
+    def decode():
+        nonlocal index
+        skip()
+        while(True):
+            # A value cut by the end of the buffer (incomplete, or a number that may go on) is decoded again with more data; the buffer doubles, so this stays linear
+            try:
+                value, end = decoder.raw_decode(buffer, index)
+                if(eof or (end < len(buffer) and not (isinstance(value, (int, float)) and buffer[end] in "0123456789+-.eE"))):
+                    index = end
+                    return value
+            except json.JSONDecodeError:
+                if(eof):
+                    raise
+            fill(len(buffer))
+
+    values = {}
+    skip("{")
+    skip()
+    if(buffer[index] == "}"):
+        return values
+
+    while(len(values) < len(fields)):
+        key = decode()
+        skip(":")
+        value = decode()
+        if(key in fields):
+            values[key] = value
+        if(skip(",}") == "}"):
+            break
+
+    return values
+
+def loadJSONFields(path, fields) -> dict:
+    with open(path, "r", encoding = "utf-8") as file:
+        return readJSONFields(file, fields)
+
+def dumpJSON(data, path, sort_keys = False, atomic = False) -> None:
     create(Path(path).parent)
-    json.dump(data, open(path, "w", encoding = "utf-8"), indent = 4, ensure_ascii = False, sort_keys = sort_keys)
+    if(not atomic):
+        json.dump(data, open(path, "w", encoding = "utf-8"), indent = 4, ensure_ascii = False, sort_keys = sort_keys)
+        return
+
+    # Write next to the target and rename over it, so readers never see a half-written file
+    temp_path = Path(path).with_name("%s.%d.tmp" % (Path(path).name, os.getpid()))
+    with open(temp_path, "w", encoding = "utf-8") as file:
+        json.dump(data, file, indent = 4, ensure_ascii = False, sort_keys = sort_keys)
+    os.replace(temp_path, path)
 
 def dumpPickle(data, path) -> None:
     create(Path(path).parent)
     pickle.dump(data, open(path, "wb"))
 
-def update(d, u):
-    for k, v in u.items():
-        if(isinstance(v, dict)):
-            d[k] = update(d[k], v)
-        else:
-            if(isinstance(v, list)):
-                for e in v:
-                    if(e not in d[k]):
-                        d[k].append(e)
+MERGE_POLICIES = ["union", "append", "replace", "keep"]
+
+# Lists up to this size are searched directly, which is cheaper than hashing them
+SMALL_LIST_SIZE = 16
+
+# Tags the JSON key of an unhashable element, so it never equals a hashable element such as that JSON string itself
+_UNHASHABLE = object()
+
+def getMergeKey(e):
+    try:
+        hash(e)
+        return e
+    except TypeError:
+        return (_UNHASHABLE, json.dumps(e, sort_keys = True, default = str))
+
+def getMergeKeys(values):
+    try:
+        return set(values)
+    except TypeError:
+        return set(map(getMergeKey, values))
+
+def update(d, u, policies = None):
+    return updateMany(d, [u], policies = policies)
+
+def updateMany(d, updates, policies = None):
+    # Policies are looked up by dotted key path, then by key name; a callable policy gets (old, new) and returns the merged value
+    policies = policies or {}
+    for policy in policies.values():
+        if(not callable(policy) and policy not in MERGE_POLICIES):
+            raise ValueError("Unknown merge policy %s (expected one of %s or a callable)" % (policy, ", ".join(MERGE_POLICIES)))
+
+    # A large list merged into more than once in the batch remembers what it holds, so each element is hashed once however many updates touch it
+    seen = {}
+    touched = set()
+
+    def union(target, values):
+        if(id(target) not in seen):
+            # A direct search is cheaper than hashing the list until it is searched for many values
+            if(len(target) <= SMALL_LIST_SIZE or (len(values) <= SMALL_LIST_SIZE and id(target) not in touched)):
+                touched.add(id(target))
+                for e in values:
+                    if(e not in target):
+                        target.append(e)
+                return
+            seen[id(target)] = (target, getMergeKeys(target))
+        keys = seen[id(target)][1]
+        for e in values:
+            key = getMergeKey(e)
+            if(key not in keys):
+                keys.add(key)
+                target.append(e)
+
+    def check(d, k, kind):
+        # A value of another type is only replaced when a replace or callable policy asks for it
+        if(k not in d):
+            d[k] = kind()
+        elif(not isinstance(d[k], kind)):
+            raise TypeError("Cannot merge a %s into the %s at key %s" % (kind.__name__, type(d[k]).__name__, k))
+
+    def merge(d, u, path):
+        for k, v in u.items():
+            policy = None
+            if(policies):
+                path_k = "%s.%s" % (path, k) if path else str(k)
+                policy = policies.get(path_k, policies.get(k))
+            else:
+                path_k = None
+
+            if(policy is None or policy == "union"):
+                if(isinstance(v, dict)):
+                    check(d, k, dict)
+                    merge(d[k], v, path_k)
+                elif(isinstance(v, list)):
+                    check(d, k, list)
+                    union(d[k], v)
+                else:
+                    d[k] = v
+            elif(policy == "append" and isinstance(v, list)):
+                check(d, k, list)
+                d[k].extend(v)
+                if(id(d[k]) in seen):
+                    seen[id(d[k])][1].update(getMergeKeys(v))
+            elif(policy == "keep"):
+                if(k not in d):
+                    d[k] = v
+            elif(callable(policy)):
+                d[k] = policy(d.get(k), v)
             else:
                 d[k] = v
+
+    for u in updates:
+        merge(d, u, None)
     return d
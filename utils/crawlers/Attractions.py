@@ -1,11 +1,5 @@
-import os
-import json
-import scrapy
-from utils import common
-from nested_lookup import nested_lookup
-from inline_requests import inline_requests
 
-from . import Processor
+from . import Reviews, TripAdvisor
 
 class Parser:
     def __init__(self):
@@ -25,56 +19,30 @@ class Parser:
     def getEntityItem(self, response):
         item = {}
 
-        data = json.loads(response.css('script::text').re_first(r'window.__WEB_CONTEXT__=\{pageManifest:\s*(\{.*?)\}\s*;\s*'))
-        id = data["redux"]["route"]["detail"]
+        data = TripAdvisor.getWebContext(response)
+        id = TripAdvisor.getLocationId(data)
 
-        subdata = data["redux"]["api"]["responses"]["/data/1.0/location/" + id]["data"]
+        subdata = TripAdvisor.getAPIData(data, "/data/1.0/location/" + id)
         item["name"] = subdata["name"]
         item["address"] = subdata["address"]
         item["latitude"] = subdata["latitude"]
         item["longitude"] = subdata["longitude"]
         item["rating"] = subdata["rating"]
 
-        subdata = data["redux"]["api"]["responses"]["/data/1.0/attraction/about/" + id]["data"]
+        subdata = TripAdvisor.getAPIData(data, "/data/1.0/attraction/about/" + id)
         item["properties"] = list(map(lambda d: d["name"], subdata["taxonomyInfos"]))
         item["description"] = subdata["description"]["text"] if "description" in subdata else ""
         item["url"] = response.url
 
         return item
 
-class Crawler(scrapy.Spider):
+class Crawler(Reviews.ReviewSpider):
     name = "attractions"
-
-    def __init__(self, items):
-        self.items = items
-        self.parser = Parser()
-        self.processor = Processor.Processor()
-
-    def start_requests(self):
-        for item in self.items:
-            yield scrapy.Request(item["url"], meta = {"id": item["id"]})
+    parser_class = Parser
 
     def getReviewItems(self, response):
-        reviews = nested_lookup("reviewListPage", json.loads(response.css('script::text').re_first(r'window.__WEB_CONTEXT__=\{pageManifest:\s*(\{.*?)\}\s*;\s*')))[0]["reviews"]
-        for review in reviews:
+        review_list_page = TripAdvisor.getReviewListPage(TripAdvisor.getWebContext(response))
+        if(review_list_page is None):
+            return
+        for review in review_list_page["reviews"]:
             yield self.parser.getReviewItem(review)
-
-    @inline_requests
-    def parse(self, response):
-        item = self.parser.getEntityItem(response)
-        item["id"] = response.meta["id"]
-
-        reviews = []
-        while(1):
-            for review in self.getReviewItems(response):
-                reviews.append(review)
-
-            next_page_href = response.xpath('//div[contains(@class, "ui_pagination")]/a[contains(@class, "next")]/@href').get()
-            if(not next_page_href):
-                break
-
-            url = response.urljoin(next_page_href)
-            response = yield scrapy.Request(url)
-
-        item["reviews"] = reviews
-        yield self.processor.processEntityItem(item)
@@ -1,12 +1,11 @@
 import os
 import re
 import json
-import scrapy
 from urllib.parse import urlencode, parse_qs, urlunparse, urlparse
-from nested_lookup import nested_lookup
-from inline_requests import inline_requests
 
-from . import Processor
+from . import Reviews
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.117 Safari/537.36", "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8"}
 
 class Parser:
     def __init__(self):
@@ -22,22 +21,48 @@ class Parser:
         url = urlunparse(parsed_url)
         return url
 
-    def getBaseReviewPageUrl(self, hotel_url):
+    def getBaseReviewPageUrl(self, hotel_url, rows = 10, offset = 0, recent = False):
         cc1 = hotel_url.split("/")[-2]
         pagename = hotel_url.split("/")[-1].split(".")[0]
-        params = {"cc1": cc1, "pagename": pagename, "rows": 10, "offset": 0}
+        params = {"cc1": cc1, "pagename": pagename, "rows": rows, "offset": offset}
+        if(recent):
+            params["sort"] = "f_recent_desc"
         base_review_page_url = "https://www.booking.com/reviewlist.en-gb.html?" + urlencode(params)
         return base_review_page_url
 
+    def getOffset(self, url):
+        offsets = parse_qs(urlparse(url).query).get("offset")
+        return int(offsets[0]) if offsets else None
+
+    def setOffset(self, url, offset):
+        parsed_url = list(urlparse(url))
+        qs = parse_qs(parsed_url[4], keep_blank_values = True)
+        qs["offset"] = [str(offset)]
+        parsed_url[4] = urlencode(qs, doseq = True)
+        return urlunparse(parsed_url)
+
+    def getReviewPageUrls(self, response):
+        next_page_href = response.xpath('//a[@class="pagenext"]/@href').get()
+        if(not next_page_href):
+            return []
+
+        next_page_url = response.urljoin(next_page_href)
+        page_size = self.getOffset(next_page_url)
+        offsets = list(filter(lambda offset: offset is not None, map(lambda href: self.getOffset(response.urljoin(href)), response.xpath('//a[contains(@href, "offset=")]/@href').extract())))
+        if(not page_size or len(offsets) == 0):
+            return None
+
+        return [self.setOffset(next_page_url, offset) for offset in range(page_size, max(offsets) + 1, page_size)]
+
     def getReviewItem(self, selector, url):
         item = {}
 
-        item["title"] = selector.xpath('//h3[contains(@class,"c-review-block__title")]/text()').get() or ""
-        item["description"] = " ".join(selector.xpath('//span[@class="c-review__body"]//text()').extract())
-        item["rating"] = selector.xpath('//div[@class="bui-review-score__badge"]/text()').get() or "0"
+        item["title"] = selector.xpath('.//h3[contains(@class,"c-review-block__title")]/text()').get() or ""
+        item["description"] = " ".join(selector.xpath('.//span[@class="c-review__body"]//text()').extract())
+        item["rating"] = selector.xpath('.//div[@class="bui-review-score__badge"]/text()').get() or "0"
 
         # Handle date extraction with multiple possible formats
-        date_text = selector.xpath('//span[@class="c-review-block__date"]//text()').get()
+        date_text = selector.xpath('.//span[@class="c-review-block__date"]//text()').get()
         if date_text:
             # Try splitting by ": " first (e.g., "Reviewed: 1 January 2023")
             if ": " in date_text:
@@ -91,43 +116,42 @@ class Parser:
 
         return item
 
-class Crawler(scrapy.Spider):
+class Crawler(Reviews.ReviewSpider):
     name = "hotels"
+    parser_class = Parser
+    headers = HEADERS
+    # Every review on a booking.com review list page carries the page URL, so reviews are told apart by their content
+    review_key = ("title", "description", "date")
 
-    def __init__(self, items):
-        self.items = items
-        self.parser = Parser()
-        self.processor = Processor.Processor()
-
-    def start_requests(self):
-        for item in self.items:
-            yield scrapy.Request(item["url"], meta = {"id": item["id"]})
+    def __init__(self, items, rows = 25, **kwargs):
+        super().__init__(items, **kwargs)
+        self.rows = rows
 
     def getReviewItems(self, response):
         url = self.parser.cleanURL(response.url)
         review_selectors = response.xpath('//ul[@class="review_list"]/li')
         for review_selector in review_selectors:
-            yield self.parser.getReviewItem(scrapy.Selector(text = review_selector.extract()), url)
+            yield self.parser.getReviewItem(review_selector, url)
 
-    @inline_requests
     def parse(self, response):
         item = self.parser.getEntityItem(response)
         item["id"] = response.meta["id"]
+        item["ids"] = response.meta.get("ids", [item["id"]])
+
+        review_pages = self.getReviewPages(item)
+        review_pages.add(0, [])
+        yield from review_pages.extend([self.parser.getBaseReviewPageUrl(response.url, rows = self.rows, recent = (self.max_reviews is not None or self.reviews_since is not None or self.refresh_dir_path is not None))])
+
+    def extendReviewPages(self, response, review_pages, index):
+        # The first review list page tells us the total, so the remaining offsets are requested together (a resumed entity already knows them)
+        if(index == 1 and not review_pages.chained and len(review_pages.urls) == 2):
+            urls = self.parser.getReviewPageUrls(response)
+            if(urls is None):
+                review_pages.chained = True
+            else:
+                yield from review_pages.extend(urls)
 
-        base_review_page_url = self.parser.getBaseReviewPageUrl(response.url)
-        response = yield scrapy.Request(base_review_page_url, headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.117 Safari/537.36", "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8"})
-
-        reviews = []
-        while(1):
-            for review in self.getReviewItems(response):
-                reviews.append(review)
-
+        if(review_pages.chained):
             next_page_href = response.xpath('//a[@class="pagenext"]/@href').get()
-            if(not next_page_href):
-                break
-
-            url = response.urljoin(next_page_href)
-            response = yield scrapy.Request(url, headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.117 Safari/537.36", "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8"})
-
-        item["reviews"] = reviews
-        yield self.processor.processEntityItem(item)
+            if(next_page_href):
+                yield from review_pages.extend([response.urljoin(next_page_href)])
@@ -0,0 +1,119 @@
+import re
+import math
+import scrapy
+from urllib.parse import urlsplit, urlunsplit
+
+from . import Hotels
+
+ENTITY_PATH_PATTERNS = {
+    "R": re.compile(r"^/Restaurant_Review-g\d+-d\d+-Reviews-.+\.html$"),
+    "H": re.compile(r"^/hotel/[a-z]{2}/[^/]+\.html$"),
+    "A": re.compile(r"^/Attraction_Review-g\d+-d\d+-Reviews-.+\.html$"),
+}
+
+OFFSET_PATTERN = re.compile(r"-oa(\d+)-")
+
+class Parser:
+    def __init__(self):
+        self.hotels_parser = Hotels.Parser()
+
+    def getEntityURLs(self, response, entity_type):
+        # Listings link every entity several times (photo, name, reviews anchor), so links are reduced to unique pages in listing order
+        urls = []
+        seen = set()
+        for href in response.xpath('//a/@href').extract():
+            parts = urlsplit(response.urljoin(href.strip()))
+            if(ENTITY_PATH_PATTERNS[entity_type].match(parts.path)):
+                url = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+                if(url not in seen):
+                    seen.add(url)
+                    urls.append(url)
+        return urls
+
+    def getOffset(self, url):
+        match = OFFSET_PATTERN.search(url)
+        if(match is not None):
+            return int(match.group(1))
+        return self.hotels_parser.getOffset(url)
+
+    def setOffset(self, url, offset):
+        if(OFFSET_PATTERN.search(url) is not None):
+            return OFFSET_PATTERN.sub("-oa%d-" % offset, url, count = 1)
+        return self.hotels_parser.setOffset(url, offset)
+
+    def getListingPageURLs(self, response):
+        # Listings link a few pages and the last one, which is enough to derive every page from the offsets
+        urls = {}
+        for href in response.xpath('//a[contains(@href, "-oa") or contains(@href, "offset=")]/@href').extract():
+            url = response.urljoin(href)
+            offset = self.getOffset(url)
+            if(offset is not None and offset > 0):
+                urls[offset] = url
+
+        if(len(urls) == 0):
+            return []
+
+        page_size = min(urls)
+        last_offset = max(urls)
+        return [self.setOffset(urls[last_offset], offset) for offset in range(page_size, last_offset + 1, page_size)]
+
+class Crawler(scrapy.Spider):
+    name = "listings"
+
+    def __init__(self, listings, limit = None):
+        self.listings = listings
+        self.limit = limit
+        self.parser = Parser()
+
+    def getHeaders(self, listing):
+        return Hotels.HEADERS if listing["type"] == "H" else None
+
+    def start_requests(self):
+        for listing in self.listings:
+            yield scrapy.Request(listing["url"], callback = self.parse, errback = self.failListing, headers = self.getHeaders(listing), dont_filter = True, cb_kwargs = {"listing": listing})
+
+    def parse(self, response, listing):
+        urls = self.parser.getEntityURLs(response, listing["type"])
+        page_urls = self.parser.getListingPageURLs(response)
+
+        # With a per-city limit only the pages that can hold the first entities are requested
+        if(self.limit is not None):
+            page_urls = page_urls[:max(math.ceil(self.limit / len(urls)) - 1, 0)] if len(urls) > 0 else []
+
+        listing_pages = {"listing": listing, "pages": [urls] + [None] * len(page_urls), "pending": len(page_urls)}
+        for index, page_url in enumerate(page_urls, 1):
+            yield scrapy.Request(page_url, callback = self.parseListingPage, errback = self.failListingPage, headers = self.getHeaders(listing), priority = 1, dont_filter = True, cb_kwargs = {"listing_pages": listing_pages, "index": index})
+
+        yield from self.finish(listing_pages)
+
+    def parseListingPage(self, response, listing_pages, index):
+        listing_pages["pages"][index] = self.parser.getEntityURLs(response, listing_pages["listing"]["type"])
+        listing_pages["pending"] -= 1
+        yield from self.finish(listing_pages)
+
+    def failListingPage(self, failure):
+        listing_pages = failure.request.cb_kwargs["listing_pages"]
+        listing_pages["pages"][failure.request.cb_kwargs["index"]] = []
+        listing_pages["pending"] -= 1
+        self.logger.warning("Skipping listing page %s of %s (%s)" % (failure.request.url, listing_pages["listing"]["city"], listing_pages["listing"]["type"]))
+        yield from self.finish(listing_pages)
+
+    def finish(self, listing_pages):
+        if(listing_pages["pending"] > 0):
+            return
+
+        # Entities are emitted in listing order, so a limit keeps the top ranked ones
+        urls = []
+        seen = set()
+        for page in listing_pages["pages"]:
+            for url in page:
+                if(url not in seen):
+                    seen.add(url)
+                    urls.append(url)
+
+        item = {"type": listing_pages["listing"]["type"], "city": listing_pages["listing"]["city"], "urls": urls[:self.limit] if self.limit is not None else urls}
+        yield item
+
+    def failListing(self, failure):
+        listing = failure.request.cb_kwargs["listing"]
+        self.logger.warning("Skipping listing %s of %s (%s)" % (failure.request.url, listing["city"], listing["type"]))
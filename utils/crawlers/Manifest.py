@@ -0,0 +1,94 @@
+import os
+import json
+from pathlib import Path
+
+from utils import common, entityStore
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+PARTIAL_DIR_NAME = ".partial"
+
+class Manifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = None
+
+    def exists(self):
+        return self.path.exists()
+
+    def load(self):
+        ids = set()
+        try:
+            file = open(self.path, "r", encoding = "utf-8")
+        except FileNotFoundError:
+            return ids
+
+        with file:
+            for line in file:
+                # A run killed mid-write can leave a truncated last line, which only means that entity is fetched again
+                try:
+                    ids.add(json.loads(line)["id"])
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+        return ids
+
+    def add(self, ids):
+        if(self.file is None):
+            self.path.parent.mkdir(parents = True, exist_ok = True)
+            self.file = open(self.path, "a", encoding = "utf-8")
+        # One flushed write per batch keeps the lines of the spiders sharing this manifest from interleaving
+        self.file.write("".join(json.dumps({"id": id}) + "\n" for id in ids))
+        self.file.flush()
+
+    def close(self):
+        if(self.file is not None):
+            self.file.close()
+            self.file = None
+
+def getManifestPath(output_dir_path):
+    return Path(output_dir_path) / MANIFEST_FILE_NAME
+
+def getPartialPath(output_dir_path, id):
+    return (Path(output_dir_path) / PARTIAL_DIR_NAME / id).with_suffix(".json")
+
+def loadPartials(output_dir_path):
+    # Partial entities are few, so they are all read up front
+    partials = {}
+    partial_dir_path = Path(output_dir_path) / PARTIAL_DIR_NAME
+    if(not partial_dir_path.is_dir()):
+        return partials
+
+    for entry in os.scandir(partial_dir_path):
+        if(entry.name.endswith(".json")):
+            partials[entry.name[:-len(".json")]] = common.loadJSON(entry.path)
+
+    return partials
+
+def scan(output_dir_path):
+    # One directory listing per city instead of one stat per entity
+    ids = set()
+    if(not Path(output_dir_path).is_dir()):
+        return ids
+
+    for city_entry in os.scandir(output_dir_path):
+        if(city_entry.is_dir() and not city_entry.name.startswith(".")):
+            for entry in os.scandir(city_entry.path):
+                if(entry.name.endswith(".json") and entry.is_file()):
+                    ids.add(entry.name[:-len(".json")])
+
+    for store in entityStore.getStores(output_dir_path).values():
+        ids.update(store.ids())
+
+    return ids
+
+def loadCompleted(output_dir_path):
+    manifest = Manifest(getManifestPath(output_dir_path))
+    if(manifest.exists()):
+        return manifest.load()
+
+    # Output directories from before the manifest are scanned once and recorded, so later runs only read the manifest
+    ids = scan(output_dir_path)
+    if(len(ids) > 0):
+        manifest.add(sorted(ids))
+        manifest.close()
+    return ids
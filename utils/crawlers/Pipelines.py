@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+from scrapy.exceptions import NotConfigured, DropItem
+
+from utils import common, entityStore
+from . import Manifest
+
+class EntityWriterPipeline:
+    def __init__(self, output_dir_path, manifest_file_path = None, packed = False):
+        self.output_dir_path = Path(output_dir_path)
+        self.manifest = Manifest.Manifest(manifest_file_path or Manifest.getManifestPath(output_dir_path))
+        self.packed = packed
+        self.stores = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        output_dir_path = crawler.settings.get("ENTITIES_OUTPUT_DIR_PATH")
+        if(not output_dir_path):
+            raise NotConfigured("ENTITIES_OUTPUT_DIR_PATH is not set")
+        return cls(output_dir_path, manifest_file_path = crawler.settings.get("ENTITIES_MANIFEST_FILE_PATH"), packed = crawler.settings.getbool("ENTITIES_PACKED"))
+
+    def getPath(self, id):
+        return (self.output_dir_path / id.split("_")[0] / id).with_suffix(".json")
+
+    def getStore(self, id):
+        city = id.split("_")[0]
+        if(city not in self.stores):
+            self.stores[city] = entityStore.EntityStore(entityStore.getStorePath(self.output_dir_path, city))
+        return self.stores[city]
+
+    def process_item(self, item, spider):
+        partial_path = Manifest.getPartialPath(self.output_dir_path, item["id"])
+
+        # A partial entity is kept aside with its cursor for the next run and goes no further
+        if("cursor" in item):
+            common.dumpJSON(item, partial_path, atomic = True)
+            raise DropItem("Saved partial entity %s to resume from %s" % (item["id"], item["cursor"]["urls"][0]))
+
+        if(self.packed):
+            self.getStore(item["id"]).append([item])
+        else:
+            common.dumpJSON(item, self.getPath(item["id"]), atomic = True)
+        # The entity is recorded only once its file is in place, so the manifest never lists a missing entity
+        self.manifest.add([item["id"]])
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
+        return item
+
+    def close_spider(self, spider):
+        self.manifest.close()
+        for store in self.stores.values():
+            store.close()
@@ -1,29 +1,67 @@
 import re
 import string
+import datetime
+import functools
 import dateparser
 from collections import OrderedDict
 
+DATE_FORMATS = ["%d %B %Y", "%B %d, %Y", "%Y-%m-%d"]
+
+# Whitespace, dot and question mark runs are disjoint, so one pass collapses all three
+RUNS_PATTERN = re.compile(r"\s+|\.+|\?+")
+PUNCTUATION = string.punctuation + " "
+SEPARATOR = "\x00"
+
+def collapseRun(match):
+    c = match.group(0)[0]
+    return c if c in ".?" else " "
+
+@functools.lru_cache(maxsize = 65536)
+def parseDate(s):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(s, date_format)
+        except ValueError:
+            pass
+    return dateparser.parse(s, date_formats = DATE_FORMATS)
+
 class Processor:
     def __init__(self):
         pass
 
     def processString(self, s):
-        s = re.sub(r"\s+", " ", s)
-        s = re.sub(r"\.+", ".", s)
-        s = re.sub(r"\?+", "?", s)
-        s = s.strip(string.punctuation + " ")
+        s = RUNS_PATTERN.sub(collapseRun, s)
+        s = s.strip(PUNCTUATION)
         return s
 
+    def processStrings(self, strings):
+        # Normalize a whole batch in one regex pass; the separator survives since it is neither whitespace nor punctuation
+        if(any(SEPARATOR in s for s in strings)):
+            return list(map(self.processString, strings))
+        return [s.strip(PUNCTUATION) for s in RUNS_PATTERN.sub(collapseRun, SEPARATOR.join(strings)).split(SEPARATOR)] if strings else []
+
+    def parseDate(self, s):
+        return parseDate(s.strip())
+
     def processReviewItem(self, item):
-        ordered_item = OrderedDict()
+        return self.processReviewItems([item])[0]
 
-        ordered_item["title"] = self.processString(item["title"])
-        ordered_item["description"] = self.processString(item["description"])
-        ordered_item["rating"] = float(item["rating"])
-        ordered_item["date"] = dateparser.parse(item["date"].strip(), date_formats = ["%d %B %Y", "%B %d, %Y", "%Y-%m-%d"]).strftime("%d %B %Y")
-        ordered_item["url"] = self.processString(item["url"])
+    def processReviewItems(self, items):
+        strings = self.processStrings([s for item in items for s in (item["title"], item["description"], item["url"])])
 
-        return ordered_item
+        ordered_items = []
+        for index, item in enumerate(items):
+            ordered_item = OrderedDict()
+
+            ordered_item["title"] = strings[3 * index]
+            ordered_item["description"] = strings[3 * index + 1]
+            ordered_item["rating"] = float(item["rating"])
+            ordered_item["date"] = self.parseDate(item["date"]).strftime("%d %B %Y")
+            ordered_item["url"] = strings[3 * index + 2]
+
+            ordered_items.append(ordered_item)
+
+        return ordered_items
 
     def processEntityItem(self, item):
         ordered_item = OrderedDict()
@@ -37,8 +75,25 @@ class Processor:
         ordered_item["longitude"] = float(item["longitude"])
         ordered_item["rating"] = float(item["rating"])
         ordered_item["url"] = self.processString(item["url"])
-        ordered_item["reviews"] = []
-        for review in item["reviews"]:
-            ordered_item["reviews"].append(self.processReviewItem(review))
+        ordered_item["reviews"] = self.processReviewItems(item["reviews"])
+        if("reviews_file" in item):
+            ordered_item["reviews_file"] = item["reviews_file"]
+        if("cursor" in item):
+            ordered_item["cursor"] = item["cursor"]
 
         return ordered_item
+
+    def processEntityItems(self, item):
+        # Several entity ids can share one page, so the processed entity is copied out to each of them
+        ordered_item = self.processEntityItem(item)
+        city = ordered_item["id"].split("_")[0]
+
+        ordered_items = []
+        for id in item.get("ids", [item["id"]]):
+            copied_item = OrderedDict(ordered_item)
+            copied_item["id"] = id
+            if("reviews_file" in copied_item and id.split("_")[0] != city):
+                copied_item["reviews_file"] = "../%s/%s" % (city, ordered_item["reviews_file"])
+            ordered_items.append(copied_item)
+
+        return ordered_items
@@ -1,10 +1,7 @@
-import os
 import json
 import scrapy
-from nested_lookup import nested_lookup
-from inline_requests import inline_requests
 
-from . import Processor
+from . import Reviews, TripAdvisor
 
 class Parser:
     def __init__(self):
@@ -23,12 +20,22 @@ class Parser:
 
         return item
 
+    def getReviewItemFromData(self, data):
+        item = {}
+
+        item["title"] = data["title"]
+        item["description"] = data["text"]
+        item["rating"] = data["rating"]
+        item["date"] = data["publishedDate"]
+        item["url"] = "https://www.tripadvisor.in" + data["url"]
+
+        return item
+
     def getEntityItem(self, response):
         item = {}
 
-        data = json.loads(response.css('script::text').re_first(r'window.__WEB_CONTEXT__=\{pageManifest:\s*(\{.*?)\}\s*;\s*'))
-        print(json.dumps(data, indent = 4), file = open("sorry", "w"))
-        subdata = data["redux"]["api"]["responses"]["/data/1.0/location/" + data["redux"]["route"]["detail"]]["data"]
+        data = TripAdvisor.getWebContext(response)
+        subdata = TripAdvisor.getAPIData(data, "/data/1.0/location/" + TripAdvisor.getLocationId(data))
 
         item["name"] = subdata["name"]
         item["properties"] = list(map(lambda d: d["name"], subdata["cuisine"]))
@@ -42,38 +49,52 @@ class Parser:
 
         return item
 
-class Crawler(scrapy.Spider):
+class Crawler(Reviews.ReviewSpider):
     name = "restaurants"
-
-    def __init__(self, items):
-        self.items = items
-        self.parser = Parser()
-        self.processor = Processor.Processor()
-
-    def start_requests(self):
-        for item in self.items:
-            yield scrapy.Request(item["url"], meta = {"id": item["id"]})
-
-    @inline_requests
-    def parse(self, response):
-        item = self.parser.getEntityItem(response)
-        item["id"] = response.meta["id"]
-
-        reviews = []
-        while(1):
-            hrefs = response.xpath('//div[@class = "quote"]//a//@href').extract()
-            for href in hrefs:
-                url = response.urljoin(href)
-                res = yield scrapy.Request(url)
-                review = self.parser.getReviewItem(res)
-                reviews.append(review)
-
-            next_page_href = response.xpath('//div[contains(@class, "ui_pagination")]/a[contains(@class, "next")]/@href').get()
-            if(not next_page_href):
-                break
-
-            url = response.urljoin(next_page_href)
-            response = yield scrapy.Request(url)
-
-        item["reviews"] = reviews
-        yield self.processor.processEntityItem(item)
+    parser_class = Parser
+
+    def getReviewItems(self, response):
+        review_list_page = TripAdvisor.getReviewListPage(TripAdvisor.getWebContext(response))
+        if(review_list_page is None or not review_list_page.get("reviews")):
+            return None
+
+        return [self.parser.getReviewItemFromData(review) for review in review_list_page["reviews"]]
+
+    def parseReviewPage(self, response, review_pages, index):
+        yield from self.extendReviewPages(response, review_pages, index)
+
+        reviews = self.getReviewItems(response)
+        if(reviews is not None):
+            yield from self.addReviewPage(review_pages, index, reviews)
+            return
+
+        # Fall back to one request per review when the listing page carries no review list
+        urls = [response.urljoin(href) for href in response.xpath('//div[@class = "quote"]//a//@href').extract()]
+        if(len(urls) == 0):
+            yield from self.addReviewPage(review_pages, index, [])
+            return
+
+        page = {"reviews": [None] * len(urls), "pending": len(urls), "failed": False}
+        for position, url in enumerate(urls):
+            yield scrapy.Request(url, callback = self.parseReview, errback = self.failReview, priority = 1, dont_filter = True, cb_kwargs = {"review_pages": review_pages, "index": index, "page": page, "position": position})
+
+    def parseReview(self, response, review_pages, index, page, position):
+        page["reviews"][position] = self.parser.getReviewItem(response)
+        yield from self.finishReview(review_pages, index, page)
+
+    def failReview(self, failure):
+        kwargs = failure.request.cb_kwargs
+        kwargs["page"]["failed"] = True
+        self.logger.warning("Review %s of entity %s failed" % (failure.request.url, kwargs["review_pages"].item["id"]))
+        yield from self.finishReview(kwargs["review_pages"], kwargs["index"], kwargs["page"])
+
+    def finishReview(self, review_pages, index, page):
+        page["pending"] -= 1
+        if(page["pending"] > 0):
+            return
+
+        if(page["failed"]):
+            review_pages.fail(index)
+            yield from self.savePartial(review_pages, review_pages.urls[index] or review_pages.item["url"])
+        else:
+            yield from self.addReviewPage(review_pages, index, page["reviews"])
@@ -0,0 +1,372 @@
+import os
+import math
+import json
+import shutil
+import scrapy
+from pathlib import Path
+
+from utils import common, entityStore
+
+from . import Processor, TripAdvisor
+
+class ReviewStream:
+    def __init__(self, path, processor, source_path = None):
+        self.path = Path(path)
+        self.temp_path = self.path.with_name("%s.%d.tmp" % (self.path.name, os.getpid()))
+        self.processor = processor
+        self.source_path = source_path
+        self.file = None
+        self.count = 0
+
+    def write(self, reviews):
+        if(self.file is None):
+            self.path.parent.mkdir(parents = True, exist_ok = True)
+            # A resumed entity continues the sidecar its partial run left behind
+            if(self.source_path is not None and Path(self.source_path).exists()):
+                shutil.copyfile(self.source_path, self.temp_path)
+                self.file = open(self.temp_path, "a", encoding = "utf-8")
+            else:
+                self.file = open(self.temp_path, "w", encoding = "utf-8")
+        for review in self.processor.processReviewItems(reviews):
+            self.file.write(json.dumps(review, ensure_ascii = False) + "\n")
+            self.count += 1
+
+    def close(self, tail_path = None):
+        self.write([])
+        # A refreshed entity keeps its known reviews after the new ones
+        if(tail_path is not None and Path(tail_path).exists()):
+            with open(tail_path, "r", encoding = "utf-8") as file:
+                for line in file:
+                    self.file.write(line)
+                    self.count += 1
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        if(self.file is not None):
+            self.file.close()
+            self.temp_path.unlink()
+            self.file = None
+
+def getReviewStream(dir_path, id, processor, partial_item = None):
+    if(dir_path is None):
+        return None
+
+    source_path = None
+    if(partial_item is not None and "reviews_file" in partial_item):
+        source_path = Path(dir_path) / partial_item["id"].split("_")[0] / partial_item["reviews_file"]
+
+    return ReviewStream((Path(dir_path) / id.split("_")[0] / id).with_suffix(".reviews.jsonl"), processor, source_path = source_path)
+
+class KnownReviews:
+    def __init__(self, reviews, review_key, processor, reviews_path = None):
+        self.reviews = reviews
+        self.review_key = review_key
+        self.processor = processor
+        self.reviews_path = reviews_path
+
+        self.keys = set(map(review_key, reviews))
+        for review in self.readSidecar():
+            self.keys.add(review_key(review))
+
+    def readSidecar(self):
+        if(self.reviews_path is None or not Path(self.reviews_path).exists()):
+            return
+        with open(self.reviews_path, "r", encoding = "utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def getReviews(self):
+        return self.reviews + list(self.readSidecar())
+
+    def isKnown(self, review):
+        return self.review_key(self.processor.processReviewItem(review)) in self.keys
+
+def getKnownReviews(dir_path, id, processor, review_key):
+    if(dir_path is None):
+        return None
+
+    path = (Path(dir_path) / id.split("_")[0] / id).with_suffix(".json")
+    if(path.exists()):
+        entity = common.loadJSON(path)
+    else:
+        entity = entityStore.loadEntity(dir_path, id)
+        if(entity is None):
+            return None
+
+    reviews_path = path.parent / entity["reviews_file"] if "reviews_file" in entity else None
+    return KnownReviews(entity.get("reviews", []), review_key, processor, reviews_path = reviews_path)
+
+class ReviewPages:
+    def __init__(self, item, callback, errback, headers = None, max_reviews = None, since = None, parse_date = None, window = 4, stream = None, known = None):
+        self.item = item
+        self.callback = callback
+        self.errback = errback
+        self.headers = headers
+        self.max_reviews = max_reviews
+        self.since = since
+        self.parse_date = parse_date
+        self.window = window
+        self.stream = stream
+        self.known = known
+        self.chained = False
+        self.failed = False
+        self.stopped = False
+        self.collected = False
+
+        # Page 0 is the entity page itself and is added by the spider once it is parsed
+        self.urls = [None]
+        self.pages = [None]
+        self.pending = 1
+        self.queue = []
+        self.in_flight = 0
+        self.received = 0
+        self.page_size = 0
+
+        # Reviews are kept or dropped strictly in page order, optionally streaming each finished page out of memory
+        self.flushed = 0
+        self.kept = 0
+        self.cut = False
+
+    def extend(self, urls):
+        if(not self.stopped):
+            for url in urls:
+                self.urls.append(url)
+                self.pages.append(None)
+                self.queue.append(len(self.pages) - 1)
+        return self.schedule()
+
+    def getAllowance(self):
+        # Reviews come newest first, so a refresh checks page 0 for known reviews and then fetches one page at a time
+        if(self.known is not None):
+            return 0 if self.pages[0] is None else 1
+
+        allowance = math.inf
+        if(self.since is not None or self.stream is not None):
+            allowance = self.window
+        if(self.max_reviews is not None and self.page_size > 0):
+            allowance = min(allowance, math.ceil((self.max_reviews - self.received) / self.page_size))
+        elif(self.max_reviews is not None):
+            allowance = min(allowance, 1)
+        return max(allowance, 1)
+
+    def schedule(self):
+        requests = []
+        while(len(self.queue) > 0 and not self.stopped and self.in_flight < self.getAllowance()):
+            index = self.queue.pop(0)
+            self.pending += 1
+            self.in_flight += 1
+            requests.append(scrapy.Request(self.urls[index], callback = self.callback, errback = self.errback, headers = self.headers, priority = 1, dont_filter = True, cb_kwargs = {"review_pages": self, "index": index}))
+        return requests
+
+    def isOld(self, review):
+        if(self.since is None or self.parse_date is None):
+            return False
+        try:
+            date = self.parse_date(review["date"])
+        except Exception:
+            return False
+        return date is not None and date < self.since
+
+    def isKnown(self, review):
+        return self.known is not None and self.known.isKnown(review)
+
+    def isStale(self, review):
+        return self.isOld(review) or self.isKnown(review)
+
+    def stop(self):
+        self.stopped = True
+        self.queue = []
+
+    def add(self, index, reviews):
+        self.pages[index] = reviews
+        self.pending -= 1
+        if(index > 0):
+            self.in_flight -= 1
+
+        self.received += len(reviews)
+        self.page_size = max(self.page_size, len(reviews))
+
+        # Queued pages always come after the ones already received, so once the limit or the cutoff date is met they are not needed
+        if((self.max_reviews is not None and self.received >= self.max_reviews) or any(self.isStale(review) for review in reviews)):
+            self.stop()
+
+        if(self.stream is not None and not self.failed):
+            self.flush()
+
+    def keep(self, reviews):
+        kept_reviews = []
+        for review in reviews:
+            if(self.cut or (self.max_reviews is not None and self.kept >= self.max_reviews) or self.isStale(review)):
+                self.cut = True
+                break
+            kept_reviews.append(review)
+            self.kept += 1
+        return kept_reviews
+
+    def flush(self):
+        while(self.flushed < len(self.pages) and self.pages[self.flushed] is not None):
+            self.stream.write(self.keep(self.pages[self.flushed]))
+            self.pages[self.flushed] = []
+            self.flushed += 1
+
+    def resume(self):
+        # The partial entity stands in for page 0 and the cursor holds the pages still to fetch
+        cursor = self.item.pop("cursor")
+        reviews = self.item.pop("reviews", [])
+        self.item.pop("reviews_file", None)
+        self.chained = cursor["chained"]
+
+        requests = self.extend(cursor["urls"])
+        if(self.stream is not None):
+            self.received = self.kept = cursor["reviews"]
+            self.add(0, [])
+        else:
+            self.add(0, reviews)
+        return requests + self.schedule()
+
+    def fail(self, index):
+        self.failed = True
+        self.pending -= 1
+        if(index > 0):
+            self.in_flight -= 1
+        self.stop()
+
+    def done(self):
+        return self.pending == 0 and len(self.queue) == 0
+
+    def complete(self):
+        return self.done() and not self.failed
+
+    def collectPartial(self):
+        if(self.collected):
+            return None
+        self.collected = True
+
+        # Everything before the first missing page is kept; the missing page and all after it become the cursor
+        index = self.pages.index(None) if None in self.pages else 0
+        if(index == 0):
+            if(self.stream is not None):
+                self.stream.discard()
+            return None
+
+        if(self.stream is not None):
+            self.flush()
+            self.stream.close()
+            self.item["reviews"] = []
+            self.item["reviews_file"] = self.stream.path.name
+        else:
+            reviews = []
+            for page in self.pages[:index]:
+                reviews += self.keep(page)
+            self.item["reviews"] = reviews
+
+        self.item["cursor"] = {"urls": self.urls[index:], "chained": self.chained, "reviews": self.kept}
+        return self.item
+
+    def collect(self):
+        self.collected = True
+        if(self.stream is not None):
+            self.flush()
+            if(self.known is not None):
+                self.stream.write(self.known.reviews)
+            self.stream.close(tail_path = self.known.reviews_path if self.known is not None else None)
+            self.item["reviews"] = []
+            self.item["reviews_file"] = self.stream.path.name
+            return self.item
+
+        reviews = []
+        for page in self.pages:
+            reviews += self.keep(page or [])
+
+        # New reviews go in front of the ones the entity already had
+        if(self.known is not None):
+            reviews += self.known.getReviews()
+
+        self.item["reviews"] = reviews
+        return self.item
+
+class ReviewSpider(scrapy.Spider):
+    # Crawls entity pages and then their review pages through ReviewPages; the defaults follow TripAdvisor pages
+    parser_class = None
+    headers = None
+    review_key = ("url",)
+
+    def __init__(self, items, max_reviews = None, reviews_since = None, review_stream_dir_path = None, refresh_dir_path = None):
+        self.items = items
+        self.max_reviews = max_reviews
+        self.reviews_since = reviews_since
+        self.review_stream_dir_path = review_stream_dir_path
+        self.refresh_dir_path = refresh_dir_path
+        self.parser = self.parser_class()
+        self.processor = Processor.Processor()
+
+    def start_requests(self):
+        for item in self.items:
+            if("partial" in item):
+                yield from self.resume(item)
+            else:
+                yield scrapy.Request(item["url"], meta = {"id": item["id"], "ids": item.get("ids", [item["id"]])})
+
+    def getReviewKey(self, review):
+        return tuple(review[field] for field in self.review_key)
+
+    def getReviewPages(self, item, partial_item = None):
+        if(partial_item is not None):
+            stream, known = getReviewStream(self.review_stream_dir_path, item["id"], self.processor, partial_item = partial_item), None
+        else:
+            stream, known = getReviewStream(self.review_stream_dir_path, item["id"], self.processor), getKnownReviews(self.refresh_dir_path, item["id"], self.processor, self.getReviewKey)
+        return ReviewPages(item, callback = self.parseReviewPage, errback = self.failReviewPage, headers = self.headers, max_reviews = self.max_reviews, since = self.reviews_since, parse_date = self.processor.parseDate, stream = stream, known = known)
+
+    def resume(self, item):
+        partial_item = dict(item["partial"], id = item["id"], ids = item.get("ids", [item["id"]]))
+        return self.getReviewPages(partial_item, partial_item = item["partial"]).resume()
+
+    def parse(self, response):
+        item = self.parser.getEntityItem(response)
+        item["id"] = response.meta["id"]
+        item["ids"] = response.meta.get("ids", [item["id"]])
+
+        review_pages = self.getReviewPages(item)
+
+        urls = TripAdvisor.getReviewPageURLs(response)
+        if(urls is None):
+            review_pages.chained = True
+        else:
+            yield from review_pages.extend(urls)
+
+        yield from self.parseReviewPage(response, review_pages = review_pages, index = 0)
+
+    def extendReviewPages(self, response, review_pages, index):
+        if(review_pages.chained):
+            next_page_url = TripAdvisor.getNextReviewPageURL(response)
+            if(next_page_url is not None):
+                yield from review_pages.extend([next_page_url])
+
+    def parseReviewPage(self, response, review_pages, index):
+        yield from self.extendReviewPages(response, review_pages, index)
+        yield from self.addReviewPage(review_pages, index, list(self.getReviewItems(response)))
+
+    def addReviewPage(self, review_pages, index, reviews):
+        review_pages.add(index, reviews)
+        yield from review_pages.schedule()
+
+        if(review_pages.complete()):
+            yield from self.processor.processEntityItems(review_pages.collect())
+
+    def failReviewPage(self, failure):
+        review_pages = failure.request.cb_kwargs["review_pages"]
+        review_pages.fail(failure.request.cb_kwargs["index"])
+        yield from self.savePartial(review_pages, failure.request.url)
+
+    def savePartial(self, review_pages, url):
+        if(review_pages.collected):
+            # A later in-flight page of an entity that was already saved
+            self.logger.debug("Entity %s already saved: review page %s failed" % (review_pages.item["id"], url))
+            return
+        partial_item = review_pages.collectPartial()
+        if(partial_item is None):
+            self.logger.warning("Dropping entity %s: review page %s failed" % (review_pages.item["id"], url))
+            return
+        self.logger.warning("Saving partial entity %s: review page %s failed" % (review_pages.item["id"], url))
+        yield from self.processor.processEntityItems(partial_item)
@@ -0,0 +1,85 @@
+HTTPCACHE_STORAGES = {
+    "filesystem": "scrapy.extensions.httpcache.FilesystemCacheStorage",
+    "dbm": "scrapy.extensions.httpcache.DbmCacheStorage",
+}
+
+REACTORS = {
+    "asyncio": "twisted.internet.asyncioreactor.AsyncioSelectorReactor",
+    "epoll": "twisted.internet.epollreactor.EPollReactor",
+    "select": "twisted.internet.selectreactor.SelectReactor",
+}
+
+PROFILES = {
+    # Scrapy defaults
+    "default": {},
+
+    # Stay gentle with the sites on long unattended runs
+    "polite": {
+        "CONCURRENT_REQUESTS": 16,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+        "DOWNLOAD_DELAY": 0.25,
+        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": 2.0,
+        "DNSCACHE_ENABLED": True,
+    },
+
+    # Crawl as fast as the sites allow and keep every response in the HTTP cache for later reruns
+    "cached": {
+        "CONCURRENT_REQUESTS": 64,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
+        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": 8.0,
+        "DNSCACHE_ENABLED": True,
+        "HTTPCACHE_ENABLED": True,
+        "HTTPCACHE_EXPIRATION_SECS": 0,
+        "HTTPCACHE_STORAGE": HTTPCACHE_STORAGES["filesystem"],
+        "HTTPCACHE_IGNORE_HTTP_CODES": [429, 500, 502, 503, 504],
+    },
+
+    # Serve everything from the HTTP cache filled by an earlier run; requests missing from the cache are dropped, never sent
+    "local_rerun": {
+        "CONCURRENT_REQUESTS": 256,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 256,
+        "DOWNLOAD_DELAY": 0,
+        "AUTOTHROTTLE_ENABLED": False,
+        "RETRY_ENABLED": False,
+        "ROBOTSTXT_OBEY": False,
+        "HTTPCACHE_ENABLED": True,
+        "HTTPCACHE_EXPIRATION_SECS": 0,
+        "HTTPCACHE_IGNORE_MISSING": True,
+        "HTTPCACHE_STORAGE": HTTPCACHE_STORAGES["filesystem"],
+    },
+}
+
+def getSettings(profile = "default", concurrent_requests = None, concurrent_requests_per_domain = None, httpcache = None, httpcache_dir = None, autothrottle_target_concurrency = None, dns_cache = None, reactor = None):
+    if(profile not in PROFILES):
+        raise ValueError("Unknown settings profile %s (expected one of %s)" % (profile, ", ".join(PROFILES)))
+
+    settings = dict(PROFILES[profile])
+
+    if(concurrent_requests is not None):
+        settings["CONCURRENT_REQUESTS"] = concurrent_requests
+
+    if(concurrent_requests_per_domain is not None):
+        settings["CONCURRENT_REQUESTS_PER_DOMAIN"] = concurrent_requests_per_domain
+
+    if(httpcache == "none"):
+        settings["HTTPCACHE_ENABLED"] = False
+    elif(httpcache is not None):
+        settings["HTTPCACHE_ENABLED"] = True
+        settings["HTTPCACHE_STORAGE"] = HTTPCACHE_STORAGES[httpcache]
+
+    if(httpcache_dir is not None):
+        settings["HTTPCACHE_DIR"] = str(httpcache_dir)
+
+    if(autothrottle_target_concurrency is not None):
+        settings["AUTOTHROTTLE_ENABLED"] = autothrottle_target_concurrency > 0
+        settings["AUTOTHROTTLE_TARGET_CONCURRENCY"] = autothrottle_target_concurrency
+
+    if(dns_cache is not None):
+        settings["DNSCACHE_ENABLED"] = dns_cache
+
+    if(reactor is not None):
+        settings["TWISTED_REACTOR"] = REACTORS[reactor]
+
+    return settings
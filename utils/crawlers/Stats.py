@@ -0,0 +1,179 @@
+import os
+import json
+import time
+from pathlib import Path
+from collections import OrderedDict
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from utils import common
+
+PREFIX = "crawlstats/"
+
+def getCallbackName(response):
+    callback = response.request.callback if response.request is not None else None
+    return getattr(callback, "__name__", "parse")
+
+def getStatsDirPath(crawler):
+    stats_dir_path = crawler.settings.get("CRAWL_STATS_DIR_PATH")
+    if(not stats_dir_path):
+        raise NotConfigured("CRAWL_STATS_DIR_PATH is not set")
+    return Path(stats_dir_path)
+
+class CallbackTimerMiddleware:
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        getStatsDirPath(crawler)
+        return cls(crawler.stats)
+
+    def record(self, name, seconds):
+        self.stats.inc_value(PREFIX + "callback/%s/calls" % name)
+        self.stats.inc_value(PREFIX + "callback/%s/cpu_seconds" % name, seconds)
+        self.stats.max_value(PREFIX + "callback/%s/cpu_seconds_max" % name, seconds)
+
+    # Callbacks are generators, so their work happens while their output is iterated; only the time spent inside them is counted
+    def process_spider_output(self, response, result, spider = None):
+        seconds = 0.0
+        iterator = iter(result)
+        try:
+            while(True):
+                start = time.process_time()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.process_time() - start
+                yield output
+        finally:
+            self.record(getCallbackName(response), seconds)
+
+    async def process_spider_output_async(self, response, result, spider = None):
+        seconds = 0.0
+        iterator = result.__aiter__()
+        try:
+            while(True):
+                start = time.process_time()
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    seconds += time.process_time() - start
+                yield output
+        finally:
+            self.record(getCallbackName(response), seconds)
+
+class CrawlStats:
+    def __init__(self, crawler, stats_dir_path, interval):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.stats_dir_path = Path(stats_dir_path)
+        self.interval = interval
+        self.task = None
+        self.start = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler, getStatsDirPath(crawler), crawler.settings.getfloat("CRAWL_STATS_INTERVAL", 60.0))
+        crawler.signals.connect(extension.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal = signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal = signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal = signals.item_scraped)
+        crawler.signals.connect(extension.item_dropped, signal = signals.item_dropped)
+        return extension
+
+    def spider_opened(self, spider):
+        self.start = time.time()
+        if(self.interval > 0):
+            self.task = task.LoopingCall(self.snapshot, spider)
+            self.task.start(self.interval, now = False)
+
+    def spider_closed(self, spider, reason):
+        if(self.task is not None and self.task.running):
+            self.task.stop()
+        summary = self.snapshot(spider)
+        summary["finish_reason"] = reason
+        common.dumpJSON(summary, self.stats_dir_path / ("%s.json" % spider.name), atomic = True)
+
+    def response_received(self, response, request, spider):
+        size = len(response.body)
+        latency = request.meta.get("download_latency", 0.0)
+        self.stats.inc_value(PREFIX + "responses")
+        self.stats.inc_value(PREFIX + "response_bytes", size)
+        self.stats.max_value(PREFIX + "response_bytes_max", size)
+        self.stats.inc_value(PREFIX + "latency_seconds", latency)
+        self.stats.max_value(PREFIX + "latency_seconds_max", latency)
+
+    def item_scraped(self, item, response, spider):
+        self.stats.inc_value(PREFIX + "items")
+
+    def item_dropped(self, item, response, exception, spider):
+        self.stats.inc_value(PREFIX + "items_dropped")
+
+    def getSnapshot(self, spider):
+        elapsed = max(time.time() - self.start, 1e-9) if self.start is not None else 1e-9
+        get = lambda key: self.stats.get_value(PREFIX + key, 0)
+
+        snapshot = OrderedDict()
+        snapshot["spider"] = spider.name
+        snapshot["time"] = time.time()
+        snapshot["elapsed_seconds"] = elapsed
+        snapshot["responses"] = get("responses")
+        snapshot["responses_per_second"] = get("responses") / elapsed
+        snapshot["response_bytes"] = get("response_bytes")
+        snapshot["response_bytes_mean"] = get("response_bytes") / get("responses") if get("responses") else 0.0
+        snapshot["response_bytes_max"] = get("response_bytes_max")
+        snapshot["bytes_per_second"] = get("response_bytes") / elapsed
+        snapshot["latency_seconds_mean"] = get("latency_seconds") / get("responses") if get("responses") else 0.0
+        snapshot["latency_seconds_max"] = get("latency_seconds_max")
+        snapshot["items"] = get("items")
+        snapshot["items_per_second"] = get("items") / elapsed
+        snapshot["items_dropped"] = get("items_dropped")
+
+        callbacks = OrderedDict()
+        for key in sorted(self.stats.get_stats()):
+            if(key.startswith(PREFIX + "callback/") and key.endswith("/calls")):
+                name = key[len(PREFIX + "callback/"):-len("/calls")]
+                callbacks[name] = OrderedDict()
+                callbacks[name]["calls"] = get("callback/%s/calls" % name)
+                callbacks[name]["cpu_seconds"] = get("callback/%s/cpu_seconds" % name)
+                callbacks[name]["cpu_seconds_mean"] = callbacks[name]["cpu_seconds"] / callbacks[name]["calls"]
+                callbacks[name]["cpu_seconds_max"] = get("callback/%s/cpu_seconds_max" % name)
+        snapshot["callbacks"] = callbacks
+
+        return snapshot
+
+    def getPrometheusText(self, snapshot):
+        lines = []
+        labels = 'spider="%s"' % snapshot["spider"]
+        for key in ["responses", "response_bytes", "items", "items_dropped"]:
+            lines.append("tourque_crawl_%s_total{%s} %s" % (key, labels, snapshot[key]))
+        for key in ["elapsed_seconds", "responses_per_second", "bytes_per_second", "response_bytes_mean", "response_bytes_max", "latency_seconds_mean", "latency_seconds_max", "items_per_second"]:
+            lines.append("tourque_crawl_%s{%s} %s" % (key, labels, snapshot[key]))
+        for name, callback in snapshot["callbacks"].items():
+            callback_labels = '%s,callback="%s"' % (labels, name)
+            lines.append("tourque_crawl_callback_calls_total{%s} %s" % (callback_labels, callback["calls"]))
+            lines.append("tourque_crawl_callback_cpu_seconds_total{%s} %s" % (callback_labels, callback["cpu_seconds"]))
+            lines.append("tourque_crawl_callback_cpu_seconds_max{%s} %s" % (callback_labels, callback["cpu_seconds_max"]))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, spider):
+        snapshot = self.getSnapshot(spider)
+        self.stats_dir_path.mkdir(parents = True, exist_ok = True)
+
+        with open(self.stats_dir_path / ("%s.snapshots.jsonl" % spider.name), "a", encoding = "utf-8") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+        # The textfile is replaced whole so a scraper never reads it half written
+        prometheus_path = self.stats_dir_path / ("%s.prom" % spider.name)
+        temp_path = prometheus_path.with_name("%s.%d.tmp" % (prometheus_path.name, os.getpid()))
+        with open(temp_path, "w", encoding = "utf-8") as file:
+            file.write(self.getPrometheusText(snapshot))
+        os.replace(temp_path, prometheus_path)
+
+        return snapshot
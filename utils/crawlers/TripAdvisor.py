@@ -0,0 +1,59 @@
+import re
+import json
+from nested_lookup import nested_lookup
+
+WEB_CONTEXT_PATTERN = re.compile(r'window.__WEB_CONTEXT__=\{pageManifest:\s*(\{.*?)\}\s*;\s*')
+
+def getWebContext(response):
+    # The manifest is parsed once per response and cached on its request, so every parser shares it
+    if("web_context" not in response.meta):
+        match = WEB_CONTEXT_PATTERN.search(response.text)
+        try:
+            response.meta["web_context"] = json.loads(match.group(1)) if match else None
+        except json.JSONDecodeError:
+            response.meta["web_context"] = None
+    return response.meta["web_context"]
+
+def getAPIResponses(web_context):
+    try:
+        return web_context["redux"]["api"]["responses"]
+    except (KeyError, TypeError):
+        return {}
+
+def getLocationId(web_context):
+    return web_context["redux"]["route"]["detail"]
+
+def getAPIData(web_context, path):
+    return getAPIResponses(web_context)[path]["data"]
+
+def getReviewListPage(web_context):
+    if(web_context is None):
+        return None
+
+    for api_response in getAPIResponses(web_context).values():
+        data = api_response.get("data") if isinstance(api_response, dict) else None
+        if(isinstance(data, dict) and "reviewListPage" in data):
+            return data["reviewListPage"]
+
+    review_list_pages = nested_lookup("reviewListPage", web_context)
+    return review_list_pages[0] if review_list_pages else None
+
+def getNextReviewPageURL(response):
+    next_page_href = response.xpath('//div[contains(@class, "ui_pagination")]/a[contains(@class, "next")]/@href').get()
+    if(not next_page_href):
+        return None
+    return response.urljoin(next_page_href)
+
+def getReviewPageURLs(response):
+    next_page_url = getNextReviewPageURL(response)
+    if(next_page_url is None):
+        return []
+
+    match = re.search(r"-or(\d+)-", next_page_url)
+    offsets = response.xpath('//div[contains(@class, "ui_pagination")]//a[contains(@class, "pageNum")]/@data-offset').extract()
+    if(match is None or int(match.group(1)) == 0 or len(offsets) == 0):
+        return None
+
+    page_size = int(match.group(1))
+    last_offset = max(map(int, offsets))
+    return [re.sub(r"-or\d+-", "-or%d-" % offset, next_page_url, count = 1) for offset in range(page_size, last_offset + 1, page_size)]
@@ -0,0 +1,20 @@
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+def normalizeURL(url):
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", parts.query, ""))
+
+def groupByURL(data):
+    # Each page is requested once and its entity is fanned out to every id that maps to it
+    groups = OrderedDict()
+    for item in data:
+        url = normalizeURL(item["url"])
+        if(url not in groups):
+            groups[url] = {"id": item["id"], "ids": [], "url": item["url"]}
+        for id in item.get("ids", [item["id"]]):
+            if(id not in groups[url]["ids"]):
+                groups[url]["ids"].append(id)
+        if("partial" in item and "partial" not in groups[url]):
+            groups[url]["partial"] = item["partial"]
+    return list(groups.values())
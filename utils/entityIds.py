@@ -0,0 +1,159 @@
+import numpy as np
+from collections.abc import Mapping
+
+# An entity id "<city>_<type>_<number>" packed into an int64, high bits to low: city, type letter, zero padding width, number
+NUMBER_BITS = 36
+WIDTH_BITS = 4
+TYPE_BITS = 5
+CITY_BITS = 18
+
+WIDTH_SHIFT = NUMBER_BITS
+TYPE_SHIFT = WIDTH_SHIFT + WIDTH_BITS
+CITY_SHIFT = TYPE_SHIFT + TYPE_BITS
+
+NUMBER_MASK = (1 << NUMBER_BITS) - 1
+WIDTH_MASK = (1 << WIDTH_BITS) - 1
+TYPE_MASK = (1 << TYPE_BITS) - 1
+
+# Type code 0 is never used, so a zeroed column is never mistaken for an entity type
+TYPES = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TYPE_CODES = {type: code + 1 for code, type in enumerate(TYPES)}
+
+def getCity(id):
+    return id.partition("_")[0]
+
+def getType(id):
+    return id.split("_", 2)[1]
+
+def getTypeCode(type):
+    if(type not in TYPE_CODES):
+        raise ValueError("Unknown entity type: %r" % type)
+    return TYPE_CODES[type]
+
+def encode(id):
+    if(not isinstance(id, str)):
+        raise ValueError("Invalid entity id: %r" % (id,))
+    parts = id.split("_")
+    if(len(parts) != 3 or parts[1] not in TYPE_CODES or not (parts[0].isdigit() and parts[2].isdigit()) or (parts[0][0] == "0" and len(parts[0]) > 1)):
+        raise ValueError("Invalid entity id: %r" % id)
+    city, number = int(parts[0]), int(parts[2])
+
+    # Crawled ids like "123_R_001" keep their zero padding, so decoding gives back the same string
+    width = len(parts[2]) if (parts[2][0] == "0" and len(parts[2]) > 1) else 0
+    if(city >> CITY_BITS or number > NUMBER_MASK or width > WIDTH_MASK):
+        raise ValueError("Entity id out of range: %r" % id)
+
+    return (city << CITY_SHIFT) | (TYPE_CODES[parts[1]] << TYPE_SHIFT) | (width << WIDTH_SHIFT) | number
+
+def decode(code):
+    code = int(code)
+    return "%d_%s_%0*d" % (code >> CITY_SHIFT, TYPES[((code >> TYPE_SHIFT) & TYPE_MASK) - 1], (code >> WIDTH_SHIFT) & WIDTH_MASK, code & NUMBER_MASK)
+
+def isValid(id):
+    try:
+        encode(id)
+        return True
+    except ValueError:
+        return False
+
+def getInvalidIds(ids):
+    return [id for id in ids if not isValid(id)]
+
+def encodeMany(ids):
+    ids = list(ids)
+    try:
+        return np.fromiter(map(encode, ids), dtype = np.int64, count = len(ids))
+    except ValueError:
+        # Every bad id is reported at once, so an input file can be fixed in one go
+        invalid_ids = getInvalidIds(ids)
+        raise ValueError("%d invalid entity ids: %s" % (len(invalid_ids), ", ".join(map(repr, invalid_ids[:10])) + (", ..." if len(invalid_ids) > 10 else ""))) from None
+
+def decodeMany(codes):
+    codes = np.asarray(codes, dtype = np.int64)
+    cities, types, widths, numbers = getCities(codes).tolist(), getTypeCodes(codes).tolist(), getWidths(codes).tolist(), getNumbers(codes).tolist()
+    return ["%d_%s_%0*d" % (city, TYPES[type - 1], width, number) for city, type, width, number in zip(cities, types, widths, numbers)]
+
+def getCities(codes):
+    return np.asarray(codes, dtype = np.int64) >> CITY_SHIFT
+
+def getTypeCodes(codes):
+    return (np.asarray(codes, dtype = np.int64) >> TYPE_SHIFT) & TYPE_MASK
+
+def getWidths(codes):
+    return (np.asarray(codes, dtype = np.int64) >> WIDTH_SHIFT) & WIDTH_MASK
+
+def getNumbers(codes):
+    return np.asarray(codes, dtype = np.int64) & NUMBER_MASK
+
+def getMask(codes, types = None, cities = None):
+    mask = np.ones(len(codes), dtype = bool)
+    if(types is not None):
+        mask &= np.isin(getTypeCodes(codes), [getTypeCode(type) for type in types])
+    if(cities is not None):
+        mask &= np.isin(getCities(codes), [int(city) for city in cities])
+    return mask
+
+class EntityTable:
+    # One row per entity in columns; names are one string sliced by offsets instead of a string object per entity
+    def __init__(self, codes, locations, names):
+        self.codes = np.asarray(codes, dtype = np.int64)
+        self.cities = getCities(self.codes).astype(np.int32)
+        self.types = getTypeCodes(self.codes).astype(np.int8)
+        self.locations = np.asarray(locations, dtype = np.float64).reshape(-1, 2)
+        self.names = "".join(names)
+        self.name_offsets = np.zeros(len(self.codes) + 1, dtype = np.int64)
+        np.cumsum([len(name) for name in names], out = self.name_offsets[1:])
+        self.sorter = np.argsort(self.codes, kind = "stable")
+
+    @classmethod
+    def fromEntities(cls, entities):
+        entities = list(entities.values()) if isinstance(entities, Mapping) else list(entities)
+        return cls(encodeMany(entity["id"] for entity in entities), [entity.get("location") or [0.0, 0.0] for entity in entities], [entity["name"] for entity in entities])
+
+    @classmethod
+    def fromCityEntities(cls, city_entities):
+        return cls.fromEntities(entity for entities in city_entities.values() for entity in entities.values())
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.cities.nbytes + self.types.nbytes + self.locations.nbytes + self.name_offsets.nbytes + self.sorter.nbytes + len(self.names.encode("utf-8"))
+
+    def getNameLengths(self):
+        return np.diff(self.name_offsets)
+
+    def getId(self, index):
+        return decode(self.codes[index])
+
+    def getIds(self, indexes = None):
+        return decodeMany(self.codes if indexes is None else self.codes[indexes])
+
+    def getName(self, index):
+        return self.names[self.name_offsets[index]:self.name_offsets[index + 1]]
+
+    def getNames(self, indexes = None):
+        indexes = range(len(self)) if indexes is None else np.asarray(indexes).tolist()
+        offsets = self.name_offsets.tolist()
+        return [self.names[offsets[index]:offsets[index + 1]] for index in indexes]
+
+    def indexOf(self, ids):
+        # Row of each id, or -1 for ids not in the table
+        codes = encodeMany(ids)
+        if(len(self) == 0):
+            return np.full(len(codes), -1, dtype = np.int64)
+        indexes = self.sorter[np.minimum(np.searchsorted(self.codes, codes, sorter = self.sorter), len(self) - 1)]
+        return np.where(self.codes[indexes] == codes, indexes, -1)
+
+    def getMask(self, types = None, cities = None):
+        mask = np.ones(len(self), dtype = bool)
+        if(types is not None):
+            mask &= np.isin(self.types, [getTypeCode(type) for type in types])
+        if(cities is not None):
+            mask &= np.isin(self.cities, [int(city) for city in cities])
+        return mask
+
+    def select(self, selection):
+        indexes = np.flatnonzero(selection) if np.asarray(selection).dtype == bool else np.asarray(selection, dtype = np.int64)
+        return EntityTable(self.codes[indexes], self.locations[indexes], self.getNames(indexes))
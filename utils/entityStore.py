@@ -0,0 +1,266 @@
+import io
+import os
+import sys
+import json
+import tqdm
+import fcntl
+import argparse
+import functools
+from pathlib import Path
+from contextlib import contextmanager
+
+from utils import common
+
+DATA_SUFFIX = ".entities.jsonl"
+INDEX_SUFFIX = ".entities.idx"
+
+class EntityStore:
+    # One append-only JSON lines file per city and an "id offset length" line per record; the latest record of an id wins
+    def __init__(self, path):
+        self.data_path = Path(str(path) + DATA_SUFFIX)
+        self.index_path = Path(str(path) + INDEX_SUFFIX)
+        self.index = {}
+        self.indexed = 0
+        self.index_end = 0
+        self.index_read = 0
+        self.file = None
+
+    def readIndex(self):
+        try:
+            file = open(self.index_path, "rb")
+        except FileNotFoundError:
+            return
+
+        with file:
+            file.seek(self.index_read)
+            for line in file:
+                # A line cut short by a crash is left for the next locked refresh to repair
+                if(not line.endswith(b"\n")):
+                    break
+                id, offset, length = line.split()
+                self.index[id.decode("utf-8")] = (int(offset), int(length))
+                self.index_end = max(self.index_end, int(offset) + int(length))
+                self.index_read += len(line)
+        self.indexed = max(self.indexed, self.index_end)
+
+    def scanData(self):
+        # Records written after the last index line (a crash between the two writes) are found by reading the data tail
+        records = []
+        try:
+            file = open(self.data_path, "rb")
+        except FileNotFoundError:
+            return records
+
+        with file:
+            file.seek(self.indexed)
+            offset = self.indexed
+            for line in file:
+                if(not line.endswith(b"\n")):
+                    break
+                try:
+                    id = json.loads(line)["id"]
+                except (ValueError, KeyError, TypeError):
+                    break
+                records.append((id, offset, len(line)))
+                self.index[id] = (offset, len(line))
+                offset += len(line)
+            self.indexed = offset
+
+        return records
+
+    def refresh(self):
+        self.readIndex()
+        self.scanData()
+
+    @contextmanager
+    def lock(self):
+        if(self.file is None):
+            self.data_path.parent.mkdir(parents = True, exist_ok = True)
+            self.file = open(self.data_path, "a+b")
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def repair(self):
+        # Under the lock: drop a torn index line, index any unindexed records and cut a torn data line, so appends start clean
+        if(self.index_path.exists() and self.index_path.stat().st_size > self.index_read):
+            self.readIndex()
+            with open(self.index_path, "r+b") as file:
+                file.truncate(self.index_read)
+
+        # Records a reader already found past the index are scanned again, so they get their index lines now
+        self.indexed = self.index_end
+        records = self.scanData()
+        if(len(records) > 0):
+            self.writeIndex(records)
+
+        if(os.fstat(self.file.fileno()).st_size > self.indexed):
+            self.file.truncate(self.indexed)
+
+    def writeIndex(self, records):
+        lines = "".join("%s %d %d\n" % record for record in records).encode("utf-8")
+        with open(self.index_path, "ab") as file:
+            file.write(lines)
+        self.index_read += len(lines)
+
+    def append(self, items):
+        with self.lock():
+            self.readIndex()
+            self.repair()
+
+            records = []
+            data = b""
+            for item in items:
+                line = (json.dumps(item, ensure_ascii = False) + "\n").encode("utf-8")
+                records.append((item["id"], self.indexed + len(data), len(line)))
+                data += line
+
+            # The records reach the data file before the index names them, so the index never points past the data
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.writeIndex(records)
+
+            for id, offset, length in records:
+                self.index[id] = (offset, length)
+            self.indexed += len(data)
+            self.index_end = self.indexed
+
+    def get(self, id, default = None):
+        if(id not in self.index):
+            self.refresh()
+        if(id not in self.index):
+            return default
+
+        offset, length = self.index[id]
+        with open(self.data_path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def ids(self):
+        self.refresh()
+        return set(self.index)
+
+    def __contains__(self, id):
+        return id in self.ids()
+
+    def __len__(self):
+        return len(self.ids())
+
+    def __iter__(self):
+        self.refresh()
+        # Latest records in file order make the reads sequential
+        records = sorted(self.index.values())
+        try:
+            file = open(self.data_path, "rb")
+        except FileNotFoundError:
+            return
+
+        with file:
+            for offset, length in records:
+                if(file.tell() != offset):
+                    file.seek(offset)
+                yield json.loads(file.read(length))
+
+    def readRecords(self, offset = 0, fields = None):
+        # Every complete record from a record boundary on, superseded ones included, with the offset each one ends at; with fields, only those are decoded
+        try:
+            file = open(self.data_path, "rb")
+        except FileNotFoundError:
+            return
+
+        with file:
+            file.seek(offset)
+            for line in file:
+                if(not line.endswith(b"\n")):
+                    break
+                offset += len(line)
+                if(fields is None):
+                    yield json.loads(line), offset
+                else:
+                    yield common.readJSONFields(io.StringIO(line.decode("utf-8")), fields), offset
+
+    def compact(self):
+        # Rewrites the store without superseded records; no crawl may be appending to it meanwhile
+        with self.lock():
+            self.readIndex()
+            self.repair()
+            items = list(self)
+
+            temp_store = EntityStore(str(self.data_path)[:-len(DATA_SUFFIX)] + ".%d.tmp" % os.getpid())
+            temp_store.append(items)
+            temp_store.close()
+            os.replace(temp_store.index_path, self.index_path)
+            os.replace(temp_store.data_path, self.data_path)
+
+        self.close()
+        self.index = {}
+        self.indexed = 0
+        self.index_end = 0
+        self.index_read = 0
+
+    def close(self):
+        if(self.file is not None):
+            self.file.close()
+            self.file = None
+
+def getStorePath(dir_path, city):
+    return Path(dir_path) / str(city)
+
+def getStores(dir_path):
+    stores = {}
+    if(not Path(dir_path).is_dir()):
+        return stores
+
+    for entry in os.scandir(dir_path):
+        if(entry.name.endswith(DATA_SUFFIX) and entry.is_file()):
+            city = entry.name[:-len(DATA_SUFFIX)]
+            stores[city] = EntityStore(getStorePath(dir_path, city))
+
+    return stores
+
+@functools.lru_cache(maxsize = None)
+def getCachedStore(dir_path, city):
+    return EntityStore(getStorePath(dir_path, city))
+
+def loadEntity(dir_path, id):
+    # Readers share one store per city, so its index is loaded once and only the new tail is read afterwards
+    return getCachedStore(str(dir_path), id.split("_")[0]).get(id)
+
+def pack(input_dir_path, output_dir_path = None, batch_size = 1000):
+    output_dir_path = Path(output_dir_path or input_dir_path)
+
+    count = 0
+    for city_entry in sorted(os.scandir(input_dir_path), key = lambda entry: entry.name):
+        if(not city_entry.is_dir() or city_entry.name.startswith(".")):
+            continue
+
+        names = sorted(entry.name for entry in os.scandir(city_entry.path) if entry.name.endswith(".json") and entry.is_file())
+        if(len(names) == 0):
+            continue
+
+        store = EntityStore(getStorePath(output_dir_path, city_entry.name))
+        for index in tqdm.tqdm(range(0, len(names), batch_size), desc = city_entry.name):
+            store.append([common.loadJSON(Path(city_entry.path) / name) for name in names[index:index + batch_size]])
+        store.close()
+        count += len(names)
+
+    return count
+
+if(__name__ == "__main__"):
+    project_root_path = common.getProjectRootPath()
+
+    defaults = {}
+
+    defaults["input_dir_path"] = project_root_path / "data" / "tourque" / "entities" / "data"
+
+    parser = argparse.ArgumentParser(description = "Pack one JSON file per entity into one entity store per city")
+
+    parser.add_argument("-i", "--input_dir_path", type = str, default = defaults["input_dir_path"])
+    parser.add_argument("-o", "--output_dir_path", type = str, default = None)
+
+    options = parser.parse_args(sys.argv[1:])
+
+    pack(input_dir_path = Path(options.input_dir_path), output_dir_path = Path(options.output_dir_path) if options.output_dir_path is not None else None)
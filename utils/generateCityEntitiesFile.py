@@ -1,21 +1,95 @@
+import os
 import sys
 import json
 import glob
 import tqdm
 import argparse
 from pathlib import Path
-from collections import defaultdict
-from utils import common
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils import common, entityStore
 
-def generate(input_dir_path, output_file_path):
-    data = defaultdict(dict)
+# Entity files keep their reviews after these, so reading stops before the reviews are parsed
+FIELDS = ["id", "name", "properties", "latitude", "longitude"]
+
+def getManifestPath(output_file_path):
+    output_file_path = Path(output_file_path)
+    return output_file_path.with_name(output_file_path.stem + ".manifest.json")
+
+def summarize(item):
+    return {"id": item["id"], "name": item["name"], "categories": item["properties"], "location": [item["latitude"], item["longitude"]]}
+
+def readEntry(kind, path, offset):
+    if(kind == "file"):
+        item = common.loadJSONFields(path, FIELDS)
+        return {item["id"]: summarize(item)}, 0
+
+    # Stores only grow between compactions, so a changed store is read from where the last run stopped
+    summaries = {}
+    for item, offset in entityStore.EntityStore(path).readRecords(offset, fields = FIELDS):
+        summaries[item["id"]] = summarize(item)
+    return summaries, offset
+
+def isUnchanged(entry, stat):
+    return entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+
+def generate(input_dir_path, output_file_path, manifest_file_path = None, workers = 1, rebuild = False):
+    input_dir_path = Path(input_dir_path)
+    manifest_file_path = Path(manifest_file_path or getManifestPath(output_file_path))
+    manifest = common.loadJSON(manifest_file_path) if (not rebuild and manifest_file_path.exists()) else {}
+
+    # (path, mtime, size) -> summaries; unchanged entries are reused, deleted ones drop out
+    entries = OrderedDict()
+    tasks = []
 
-    files = glob.glob(str(input_dir_path / "**/*.json"), recursive = True)
+    files = sorted(glob.glob(str(input_dir_path / "**/*.json"), recursive = True))
     for file in files:
-        item = common.loadJSON(file)
-        data[item["id"].split("_")[0]][item["id"]] = {"id": item["id"], "name": item["name"], "categories": item["properties"], "location": [item["latitude"], item["longitude"]]}
+        stat = os.stat(file)
+        key = os.path.relpath(file, input_dir_path)
+        if(isUnchanged(manifest.get(key), stat)):
+            entries[key] = manifest[key]
+            continue
+        entries[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "summaries": {}}
+        tasks.append((key, "file", file, 0))
+
+    for city, store in sorted(entityStore.getStores(input_dir_path).items()):
+        stat = os.stat(store.data_path)
+        key = store.data_path.name
+        entry = manifest.get(key)
+        if(isUnchanged(entry, stat)):
+            entries[key] = entry
+            continue
+        # A compaction replaces the file, so a new inode or a shorter file means reading it whole
+        resumable = entry is not None and entry["ino"] == stat.st_ino and stat.st_size >= entry["offset"]
+        offset = entry["offset"] if resumable else 0
+        entries[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "ino": stat.st_ino, "offset": offset, "summaries": dict(entry["summaries"]) if resumable else {}}
+        tasks.append((key, "store", str(entityStore.getStorePath(input_dir_path, city)), offset))
+
+    arguments = [list(column) for column in zip(*tasks)] if len(tasks) > 0 else [[], [], [], []]
+    if(workers > 1 and len(tasks) > 1):
+        executor = ProcessPoolExecutor(max_workers = workers)
+        results = executor.map(readEntry, *arguments[1:], chunksize = max(len(tasks) // (workers * 4), 1))
+    else:
+        executor = None
+        results = map(readEntry, *arguments[1:])
+
+    for key, (summaries, offset) in zip(arguments[0], tqdm.tqdm(results, total = len(tasks))):
+        entries[key]["summaries"].update(summaries)
+        if("offset" in entries[key]):
+            entries[key]["offset"] = offset
+
+    if(executor is not None):
+        executor.shutdown()
+
+    data = defaultdict(dict)
+    for entry in entries.values():
+        for id, summary in entry["summaries"].items():
+            data[id.split("_")[0]][id] = summary
+
+    common.dumpJSON(data, output_file_path, atomic = True)
+    common.dumpJSON(entries, manifest_file_path, atomic = True)
 
-    common.dumpJSON(data, output_file_path)
+    return len(tasks)
 
 if(__name__ == "__main__"):
     project_root_path = common.getProjectRootPath()
@@ -24,12 +98,16 @@ if(__name__ == "__main__"):
 
     defaults["input_dir_path"] = project_root_path / "data" / "tourque" / "entities" / "data"
     defaults["output_file_path"] = project_root_path / "data" / "generated" / "city_entities.tourque.json"
+    defaults["workers"] = os.cpu_count() or 1
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-i", "--input_dir_path", type = str, default = defaults["input_dir_path"])
     parser.add_argument("-o", "--output_file_path", type = str, default = defaults["output_file_path"])
+    parser.add_argument("--manifest_file_path", type = str, default = None)
+    parser.add_argument("--workers", type = int, default = defaults["workers"])
+    parser.add_argument("--rebuild", action = "store_true")
 
     options = parser.parse_args(sys.argv[1:])
 
-    generate(input_dir_path = Path(options.input_dir_path), output_file_path = Path(options.output_file_path))
+    generate(input_dir_path = Path(options.input_dir_path), output_file_path = Path(options.output_file_path), manifest_file_path = options.manifest_file_path, workers = options.workers, rebuild = options.rebuild)
@@ -0,0 +1,65 @@
+import functools
+import numpy as np
+from fuzzywuzzy import fuzz
+from collections import Counter, defaultdict
+
+# fuzz.ratio rounds 100 * 2M / T, so a score above THRESHOLD means 2M / T >= 0.955; MIN_RATIO leaves room for float rounding
+THRESHOLD = 95
+MIN_RATIO = 0.95
+
+def getNGrams(name, n):
+    return [name[index:index + n] for index in range(max(len(name) - n + 1, 1))]
+
+@functools.lru_cache(maxsize = 1 << 20)
+def getRatio(x, name):
+    return fuzz.ratio(x, name)
+
+class NameIndex:
+    # Blocks fuzz.ratio candidates by name length and shared character n-grams, so a token is only scored against plausible names.
+    # Both blocks are exact for scores above THRESHOLD: with M matched characters of T, 2M / T >= 0.95 bounds the lengths,
+    # and the at most T - 2M + 1 matched blocks hold at least M - (T - 2M + 1)(n - 1) n-grams of the token that the name also has
+    def __init__(self, ids, names, n = 3, cache_size = 100000):
+        self.ids = list(ids)
+        self.names = list(names)
+        self.lengths = np.array([len(name) for name in self.names], dtype = np.int64)
+        self.n = n
+
+        postings = defaultdict(list)
+        for position, name in enumerate(self.names):
+            for ngram in set(getNGrams(name, n)):
+                postings[ngram].append(position)
+        self.postings = {ngram: np.array(positions, dtype = np.int64) for ngram, positions in postings.items()}
+
+        self.getMatches = functools.lru_cache(maxsize = cache_size)(self.findMatches)
+
+    @classmethod
+    def fromEntities(cls, entities):
+        return cls(entities.keys(), [entity_item["name"] for entity_item in entities.values()])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def getCandidates(self, x):
+        ngrams = Counter(getNGrams(x, self.n))
+        ngrams = {ngram: count for ngram, count in ngrams.items() if ngram in self.postings}
+        if(len(x) == 0 or len(ngrams) == 0):
+            return np.empty(0, dtype = np.int64)
+
+        # Shared n-grams of each name, counted with their multiplicity in the token
+        postings = [self.postings[ngram] for ngram in ngrams]
+        weights = np.repeat(list(ngrams.values()), [len(positions) for positions in postings])
+        positions, inverse = np.unique(np.concatenate(postings), return_inverse = True)
+        shared = np.bincount(inverse.ravel(), weights = weights)
+
+        totals = self.lengths[positions] + len(x)
+        unmatched = np.floor((1 - MIN_RATIO) * totals)
+        required = np.maximum(np.ceil((totals - unmatched) / 2) - (unmatched + 1) * (self.n - 1), 1)
+        window = 2 * np.minimum(self.lengths[positions], len(x)) >= MIN_RATIO * totals
+        return positions[window & (shared >= required)]
+
+    def findMatches(self, x):
+        # Positions of the names scoring above THRESHOLD, in index order like a scan over every name
+        return [position for position in self.getCandidates(x).tolist() if getRatio(x, self.names[position]) > THRESHOLD]
+
+    def scan(self, x):
+        return [position for position, name in enumerate(self.names) if fuzz.ratio(x, name) > THRESHOLD]
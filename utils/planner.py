@@ -0,0 +1,88 @@
+import random
+import datetime
+from collections import OrderedDict
+
+def sample(items, size, seed = None):
+    items = list(items)
+    if(size >= len(items)):
+        return items
+    return random.Random(seed).sample(items, size)
+
+def formatBytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if(size < 1024):
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f TB" % size
+
+class CrawlPlanner:
+    def __init__(self, total, sampled, concurrency = 1, delay = 0.0, target_concurrency = None, sleep = 0.0, unit = "item", count = "review"):
+        self.total = total
+        self.sampled = sampled
+        self.concurrency = max(concurrency, 1)
+        # delay is a download slot delay (at most one request per delay, whatever the concurrency), target_concurrency
+        # the AutoThrottle target when it is enabled, and sleep a pause after each request of a sequential crawler
+        self.delay = delay
+        self.target_concurrency = target_concurrency
+        self.sleep = sleep
+        self.unit = unit
+        self.count = count
+
+        self.requests = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.finished = 0
+        self.counts = 0
+
+    def record(self, size, latency):
+        self.requests += 1
+        self.bytes += size
+        self.latency += latency
+
+    def add(self, count = 0):
+        self.finished += 1
+        self.counts += count
+
+    def getThroughput(self, latency):
+        # Requests per second of one download slot; None when nothing bounds it
+        limits = []
+        if(latency + self.sleep > 0):
+            limits.append(self.concurrency / (latency + self.sleep))
+        if(self.delay > 0):
+            limits.append(1 / self.delay)
+        if(self.target_concurrency and latency > 0):
+            limits.append(self.target_concurrency / latency)
+        return min(limits) if len(limits) > 0 else None
+
+    def estimate(self):
+        estimate = OrderedDict()
+
+        sampled = max(self.sampled, 1)
+        requests = max(self.requests, 1)
+
+        estimate["total"] = self.total
+        estimate["sampled"] = self.sampled
+        estimate["finished"] = self.finished
+        estimate["requests_per_%s" % self.unit] = self.requests / sampled
+        estimate["%ss_per_%s" % (self.count, self.unit)] = self.counts / max(self.finished, 1)
+        estimate["bytes_per_request"] = self.bytes / requests
+        estimate["latency_per_request"] = self.latency / requests
+        estimate["total_requests"] = int(round(self.requests / sampled * self.total))
+        estimate["total_bytes"] = int(round(self.bytes / sampled * self.total))
+        estimate["total_%ss" % self.count] = int(round(self.counts / max(self.finished, 1) * self.total))
+        throughput = self.getThroughput(estimate["latency_per_request"])
+        estimate["requests_per_second"] = throughput or 0.0
+        estimate["total_seconds"] = estimate["total_requests"] / throughput if throughput else 0.0
+
+        return estimate
+
+    def report(self, name = ""):
+        estimate = self.estimate()
+
+        lines = []
+        lines.append("Plan%s: sampled %d of %d %ss (%d finished)" % ((" [%s]" % name) if name else "", estimate["sampled"], estimate["total"], self.unit, estimate["finished"]))
+        lines.append("  %.1f requests/%s, %.1f %ss/%s" % (estimate["requests_per_%s" % self.unit], self.unit, estimate["%ss_per_%s" % (self.count, self.unit)], self.count, self.unit))
+        lines.append("  %s/request, %.3fs latency/request, %.3fs delay, concurrency %d%s, %.1f requests/s" % (formatBytes(estimate["bytes_per_request"]), estimate["latency_per_request"], self.delay + self.sleep, self.concurrency, (" (AutoThrottle target %.1f)" % self.target_concurrency) if self.target_concurrency else "", estimate["requests_per_second"]))
+        lines.append("  Estimated: %d requests, %s, %d %ss, %s HH:MM:SS" % (estimate["total_requests"], formatBytes(estimate["total_bytes"]), estimate["total_%ss" % self.count], self.count, str(datetime.timedelta(seconds = int(estimate["total_seconds"])))))
+
+        return "\n".join(lines)
@@ -0,0 +1,157 @@
+import re
+import sys
+import tqdm
+import argparse
+import numpy as np
+from pathlib import Path
+from collections import defaultdict
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from utils import common
+from utils.spatialIndex import haversine, isLocated
+
+NAME_PATTERN = re.compile(r"[^\w]+")
+
+def normalizeName(name):
+    return " %s " % NAME_PATTERN.sub(" ", name.lower()).strip()
+
+def getNGrams(name, n):
+    return [name[index:index + n] for index in range(max(len(name) - n + 1, 1))]
+
+def getTFIDF(names, n = 3):
+    # Rows are L2 normalized character n-gram TF-IDF vectors, so a row dot product is the cosine similarity
+    vocabulary = {}
+    rows, columns = [], []
+    for row, name in enumerate(names):
+        for ngram in getNGrams(normalizeName(name), n):
+            rows.append(row)
+            columns.append(vocabulary.setdefault(ngram, len(vocabulary)))
+
+    counts = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape = (len(names), len(vocabulary)))
+    counts.sum_duplicates()
+
+    df = np.bincount(counts.indices, minlength = len(vocabulary))
+    idf = np.log((1 + len(names)) / (1 + df)) + 1
+    tfidf = sparse.csr_matrix(counts.multiply(idf.reshape(1, -1)))
+
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis = 1)).ravel())
+    norms[norms == 0] = 1.0
+    tfidf = sparse.csr_matrix(sparse.diags(1.0 / norms) @ tfidf)
+
+    return tfidf, df
+
+def getBlockingKeys(tfidf, df, max_df = 0.05, min_df = 50, keys = 2):
+    # n-grams shared by many names ("the", "hotel") are not blocking keys; a name made only of them keeps its rarest few
+    limit = max(max_df * tfidf.shape[0], min_df)
+    rows, columns = [], []
+    for row in range(tfidf.shape[0]):
+        ngrams = tfidf.indices[tfidf.indptr[row]:tfidf.indptr[row + 1]]
+        kept = ngrams[df[ngrams] <= limit]
+        if(len(kept) < keys):
+            kept = ngrams[np.argsort(df[ngrams], kind = "stable")[:keys]]
+        rows += [row] * len(kept)
+        columns += kept.tolist()
+    return sparse.csr_matrix((np.ones(len(rows), dtype = np.int32), (rows, columns)), shape = tfidf.shape)
+
+def getCandidatePairs(blocking_keys, chunk_size = 2000):
+    # Only names sharing a blocking key are compared, a chunk of rows at a time to bound memory
+    transposed = blocking_keys.T.tocsr()
+    pairs = []
+    for start in range(0, blocking_keys.shape[0], chunk_size):
+        shared = sparse.triu(blocking_keys[start:start + chunk_size] @ transposed, k = start + 1).tocoo()
+        pairs.append(np.stack([shared.row + start, shared.col], axis = 1))
+    return np.concatenate(pairs) if len(pairs) > 0 else np.empty((0, 2), dtype = int)
+
+def getCosines(tfidf, pairs, chunk_size = 100000):
+    cosines = np.empty(len(pairs))
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        cosines[start:start + chunk_size] = np.asarray(tfidf[chunk[:, 0]].multiply(tfidf[chunk[:, 1]]).sum(axis = 1)).ravel()
+    return cosines
+
+def getSortKey(id):
+    return [int(part) if part.isdigit() else part for part in id.split("_")]
+
+def resolveBlock(ids, names, locations, threshold = 0.8, strict_threshold = 0.95, max_km = 0.5, n = 3, max_df = 0.05):
+    if(len(ids) < 2):
+        return {}
+
+    tfidf, df = getTFIDF(names, n = n)
+    pairs = getCandidatePairs(getBlockingKeys(tfidf, df, max_df = max_df))
+    if(len(pairs) == 0):
+        return {}
+
+    cosines = getCosines(tfidf, pairs)
+    selected = cosines >= threshold
+    pairs, cosines = pairs[selected], cosines[selected]
+
+    # Entities crawled without coordinates have (0, 0), so their names alone must nearly match
+    locations = np.asarray(locations, dtype = float).reshape(-1, 2)
+    located = isLocated(locations)
+    both_located = located[pairs[:, 0]] & located[pairs[:, 1]]
+    distances = haversine(locations[pairs[:, 0], 0], locations[pairs[:, 0], 1], locations[pairs[:, 1], 0], locations[pairs[:, 1], 1])
+    matched = np.where(both_located, distances <= max_km, cosines >= strict_threshold)
+    pairs = pairs[matched]
+
+    graph = sparse.csr_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape = (len(ids), len(ids)))
+    count, labels = connected_components(graph, directed = False)
+
+    clusters = defaultdict(list)
+    for index, label in enumerate(labels):
+        clusters[label].append(ids[index])
+
+    # The lowest numbered id of a cluster is its canonical id, so the mapping is stable across runs
+    canonical_ids = {}
+    for cluster in clusters.values():
+        if(len(cluster) > 1):
+            canonical_id = min(cluster, key = getSortKey)
+            for id in cluster:
+                if(id != canonical_id):
+                    canonical_ids[id] = canonical_id
+    return canonical_ids
+
+def resolve(city_entities, threshold = 0.8, strict_threshold = 0.95, max_km = 0.5, n = 3, max_df = 0.05, by_type = True):
+    # Blocks are a city, and within it an entity type, since a restaurant is never the duplicate of a hotel
+    blocks = defaultdict(list)
+    for city, entities in city_entities.items():
+        for id, entity in entities.items():
+            blocks[(city, id.split("_")[1] if by_type else None)].append(entity)
+
+    canonical_ids = {}
+    for key, entities in tqdm.tqdm(sorted(blocks.items(), key = lambda item: str(item[0]))):
+        ids = [entity["id"] for entity in entities]
+        names = [entity["name"] for entity in entities]
+        locations = [entity.get("location") or [0.0, 0.0] for entity in entities]
+        canonical_ids.update(resolveBlock(ids, names, locations, threshold = threshold, strict_threshold = strict_threshold, max_km = max_km, n = n, max_df = max_df))
+    return canonical_ids
+
+if(__name__ == "__main__"):
+    project_root_path = common.getProjectRootPath()
+
+    defaults = {}
+
+    defaults["input_file_path"] = project_root_path / "data" / "generated" / "city_entities.json"
+    defaults["output_file_path"] = project_root_path / "data" / "generated" / "canonical_ids.json"
+    defaults["threshold"] = 0.8
+    defaults["strict_threshold"] = 0.95
+    defaults["max_km"] = 0.5
+    defaults["ngram"] = 3
+    defaults["max_df"] = 0.05
+
+    parser = argparse.ArgumentParser(description = "Map duplicate entities of a city to one canonical id")
+
+    parser.add_argument("-i", "--input_file_path", type = str, default = defaults["input_file_path"])
+    parser.add_argument("-o", "--output_file_path", type = str, default = defaults["output_file_path"])
+    parser.add_argument("--threshold", type = float, default = defaults["threshold"])
+    parser.add_argument("--strict_threshold", type = float, default = defaults["strict_threshold"])
+    parser.add_argument("--max_km", type = float, default = defaults["max_km"])
+    parser.add_argument("--ngram", type = int, default = defaults["ngram"])
+    parser.add_argument("--max_df", type = float, default = defaults["max_df"])
+    parser.add_argument("--across_types", action = "store_true")
+
+    options = parser.parse_args(sys.argv[1:])
+
+    canonical_ids = resolve(common.loadJSON(options.input_file_path), threshold = options.threshold, strict_threshold = options.strict_threshold, max_km = options.max_km, n = options.ngram, max_df = options.max_df, by_type = not options.across_types)
+    print("Mapped %d duplicate entities to canonical ids" % len(canonical_ids))
+    common.dumpJSON(canonical_ids, Path(options.output_file_path), sort_keys = True)
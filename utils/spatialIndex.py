@@ -0,0 +1,89 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great circle distance in km; the arguments broadcast like any NumPy arrays
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype = float)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def pairwiseDistances(locations):
+    locations = np.asarray(locations, dtype = float).reshape(-1, 2)
+    return haversine(locations[:, None, 0], locations[:, None, 1], locations[None, :, 0], locations[None, :, 1])
+
+def toXYZ(locations):
+    # Points on the unit sphere, where straight line (chord) distance grows monotonically with great circle distance
+    locations = np.radians(np.asarray(locations, dtype = float).reshape(-1, 2))
+    cos_lat = np.cos(locations[:, 0])
+    return np.stack([cos_lat * np.cos(locations[:, 1]), cos_lat * np.sin(locations[:, 1]), np.sin(locations[:, 0])], axis = 1)
+
+def kmToChord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype = float) / EARTH_RADIUS_KM, np.pi) / 2)
+
+def isLocated(locations):
+    # Entities crawled without coordinates carry (0, 0)
+    locations = np.asarray(locations, dtype = float).reshape(-1, 2)
+    return np.isfinite(locations).all(axis = 1) & np.any(locations != 0, axis = 1)
+
+class SpatialIndex:
+    def __init__(self, ids, locations):
+        locations = np.asarray(locations, dtype = float).reshape(-1, 2)
+        located = isLocated(locations)
+
+        self.ids = [id for id, keep in zip(ids, located) if keep]
+        self.locations = locations[located]
+        self.positions = {id: position for position, id in enumerate(self.ids)}
+        self.tree = cKDTree(toXYZ(self.locations)) if len(self.ids) > 0 else None
+
+    @classmethod
+    def fromEntities(cls, entities):
+        entities = list(entities.values()) if isinstance(entities, dict) else list(entities)
+        return cls([entity["id"] for entity in entities], [entity.get("location") or [0.0, 0.0] for entity in entities])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id):
+        return id in self.positions
+
+    def getLocation(self, id):
+        return self.locations[self.positions[id]].tolist()
+
+    def queryRadius(self, lat, lon, km):
+        if(self.tree is None):
+            return []
+        positions = np.asarray(self.tree.query_ball_point(toXYZ([lat, lon])[0], kmToChord(km)), dtype = int)
+        distances = haversine(lat, lon, self.locations[positions, 0], self.locations[positions, 1])
+        order = np.argsort(distances, kind = "stable")
+        return [(self.ids[positions[index]], float(distances[index])) for index in order]
+
+    def queryNearest(self, lat, lon, k = 1):
+        if(self.tree is None):
+            return []
+        k = min(k, len(self.ids))
+        chords, positions = self.tree.query(toXYZ([lat, lon])[0], k = k)
+        positions = np.atleast_1d(positions)
+        distances = haversine(lat, lon, self.locations[positions, 0], self.locations[positions, 1])
+        return [(self.ids[position], float(distance)) for position, distance in zip(positions, distances)]
+
+    def queryRadiusMany(self, locations, km):
+        # One tree walk for many centers; returns the indexed ids within km of each
+        if(self.tree is None):
+            return [[] for _ in range(len(locations))]
+        return [[self.ids[position] for position in sorted(positions)] for positions in self.tree.query_ball_point(toXYZ(locations), kmToChord(km))]
+
+    def getPairs(self, km):
+        # Every pair of indexed entities within km of each other, as index positions into self.ids
+        if(self.tree is None):
+            return np.empty((0, 2), dtype = int)
+        return self.tree.query_pairs(kmToChord(km), output_type = "ndarray")
+
+    def getDistances(self, ids):
+        # Pairwise distances between a post's candidate entities; entities without a location get nan
+        locations = np.array([self.locations[self.positions[id]] if id in self.positions else [np.nan, np.nan] for id in ids], dtype = float).reshape(-1, 2)
+        return pairwiseDistances(locations)
+
+def getCityIndexes(city_entities):
+    return {city: SpatialIndex.fromEntities(entities) for city, entities in city_entities.items()}